@@ -0,0 +1,181 @@
+"""
+bapX Adapter Pool
+Serves many LoRA adapters side by side on one resident base model.
+
+Adapters trained with different task/time/identity parameters differ only
+in their LoRA weights, so instead of loading the base model once per
+adapter, an AdapterPool loads each adapter into the same PEFT model under
+its own name. A request names the adapter it wants (None for the plain
+base model), and a batch may mix adapters: PEFT's adapter_names argument
+routes each row through its own adapter in the same forward pass.
+
+Adapters are loaded on first use from a registry of name -> directory and
+stay loaded until the pool exceeds max_bytes or max_adapters; then the
+least recently used ones are deleted. The base model is never reloaded.
+Loading and deleting patch the model's layers in place, so they wait until
+no generate() call holds the pool; every generation on a pooled model,
+including base-only ones, goes through acquire().
+
+    with resident.adapters.acquire(["identity-a", None]) as adapter_names:
+        model.generate(**inputs, adapter_names=adapter_names)
+"""
+import contextlib
+import threading
+import time
+
+from bapx_logging import get_logger
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_MAX_ADAPTERS = 8
+# PEFT's name for rows that skip every adapter
+BASE_ADAPTER = "__base__"
+
+logger = get_logger("adapters")
+
+
+def adapter_nbytes(model, name):
+    """Bytes of the LoRA weights loaded under an adapter name"""
+    marker = f".{name}."
+    return sum(p.numel() * p.element_size() for n, p in model.named_parameters() if marker in n)
+
+
+class _Adapter:
+    __slots__ = ("name", "path", "nbytes", "load_seconds", "last_used", "refcount", "requests")
+
+    def __init__(self, name, path, nbytes, load_seconds):
+        self.name = name
+        self.path = path
+        self.nbytes = nbytes
+        self.load_seconds = load_seconds
+        self.last_used = time.monotonic()
+        self.refcount = 0
+        self.requests = 0
+
+
+class AdapterPool:
+    """LoRA adapters loaded by name into one resident transformers model, LRU-evicted over a budget"""
+
+    def __init__(self, resident, registry=None, max_bytes=DEFAULT_MAX_BYTES, max_adapters=DEFAULT_MAX_ADAPTERS):
+        self.resident = resident
+        # Adapter name -> directory; shared with whoever registers adapters
+        self.registry = registry if registry is not None else {}
+        self.max_bytes = max_bytes
+        self.max_adapters = max_adapters
+        # Name -> _Adapter, for adapters currently loaded into the model
+        self.adapters = {}
+        self.evictions = 0
+        # acquire() calls in progress
+        self._active = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # Held while loading; new acquire() calls wait behind it so in-flight ones can drain
+        self._load_lock = threading.Lock()
+
+    @property
+    def wrapped(self):
+        """True once the base model has been wrapped in a PeftModel"""
+        return bool(self.adapters)
+
+    def register(self, name, path):
+        if name == BASE_ADAPTER:
+            raise ValueError(f"{BASE_ADAPTER} is reserved for the base model")
+        self.registry[name] = path
+
+    def load(self, name):
+        """Load a registered adapter if it is not loaded yet"""
+        with self.acquire([name]):
+            pass
+
+    @contextlib.contextmanager
+    def acquire(self, names):
+        """Hold the adapters named per row (None: base model) for one generate() call
+
+        Yields the adapter_names argument for the PEFT model, or None while no
+        adapter has been loaded and every row uses the base model.
+        """
+        wanted = {name for name in names if name is not None}
+        unknown = wanted - self.registry.keys()
+        if unknown:
+            raise KeyError(f"Unknown adapter: {', '.join(sorted(unknown))}")
+        with self._load_lock:
+            with self._lock:
+                missing = [name for name in wanted if name not in self.adapters]
+            for name in missing:
+                self._load(name, keep=wanted)
+            with self._lock:
+                held = [self.adapters[name] for name in wanted]
+                for adapter in held:
+                    adapter.refcount += 1
+                    adapter.requests += 1
+                self._active += 1
+                wrapped = self.wrapped
+        try:
+            yield [name or BASE_ADAPTER for name in names] if wrapped else None
+        finally:
+            with self._lock:
+                for adapter in held:
+                    adapter.refcount -= 1
+                    adapter.last_used = time.monotonic()
+                self._active -= 1
+                self._idle.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_bytes": self.max_bytes,
+                "max_adapters": self.max_adapters,
+                "loaded_bytes": sum(adapter.nbytes for adapter in self.adapters.values()),
+                "evictions": self.evictions,
+                "registered": sorted(self.registry),
+                "loaded": [{
+                    "name": adapter.name,
+                    "path": adapter.path,
+                    "bytes": adapter.nbytes,
+                    "load_seconds": round(adapter.load_seconds, 3),
+                    "in_use": adapter.refcount,
+                    "requests": adapter.requests
+                } for adapter in self.adapters.values()]
+            }
+
+    def _load(self, name, keep):
+        """Load one adapter into the model (called with _load_lock held)"""
+        path = self.registry[name]
+        with self._lock:
+            self._idle.wait_for(lambda: not self._active)
+            self._evict_to_fit(keep)
+        start = time.perf_counter()
+        model = self.resident.model
+        if not self.wrapped:
+            from peft import PeftModel
+
+            model = PeftModel.from_pretrained(model, path, adapter_name=name)
+            model.eval()
+        else:
+            model.load_adapter(path, adapter_name=name)
+        adapter = _Adapter(name, path, adapter_nbytes(model, name), time.perf_counter() - start)
+        with self._lock:
+            self.resident.model = model
+            self.adapters[name] = adapter
+            self.resident.nbytes += adapter.nbytes
+        logger.info("Loaded adapter %s from %s in %.2f s", name, path, adapter.load_seconds,
+                    extra={"fields": {"bytes": adapter.nbytes}})
+
+    def _evict_to_fit(self, keep):
+        """Delete least recently used adapters so one more fits (called with _lock held, nothing generating)"""
+        total = sum(adapter.nbytes for adapter in self.adapters.values())
+        # Make room by count up front; by bytes, assume the new adapter is as large as the largest loaded one
+        incoming = max((adapter.nbytes for adapter in self.adapters.values()), default=0)
+        candidates = sorted((adapter for adapter in self.adapters.values() if adapter.name not in keep),
+                            key=lambda adapter: adapter.last_used)
+        loaded = len(self.adapters)
+        for adapter in candidates:
+            # PEFT needs at least one adapter once the model is wrapped
+            if loaded <= 1 or (loaded < self.max_adapters and total + incoming <= self.max_bytes):
+                break
+            self.resident.model.base_model.delete_adapter(adapter.name)
+            del self.adapters[adapter.name]
+            self.resident.nbytes -= adapter.nbytes
+            self.evictions += 1
+            loaded -= 1
+            total -= adapter.nbytes
+            logger.info("Evicted adapter %s", adapter.name, extra={"fields": {"bytes": adapter.nbytes}})
@@ -0,0 +1,181 @@
+"""
+bapX Batching Scheduler
+Dynamic request batching for generation with a resident model.
+
+Requests are queued with submit() and answered through futures. A scheduler
+thread takes the first waiting prompt, keeps collecting for up to
+max_wait_ms or until max_batch_size prompts are waiting, left-pads them
+and runs them through one model.generate() call. Prompts that arrive while
+a batch is generating are admitted as soon as it finishes, so under load
+batches form back to back without waiting.
+
+Batches decode greedily. Each request gets at most its own max_new_tokens
+and stops at EOS. GGUF (llama.cpp) models have no batched API and run
+their batch one prompt at a time. A batch of one prompt reuses the model's
+cached KV prefix, if any; padded batches prefill in full.
+
+Requests may name a LoRA adapter of the model's AdapterPool. A batch is not
+split by adapter: every prompt runs through its own adapter (or the base
+model) in the same generate() call.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from bapx_logging import get_logger
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 10
+DEFAULT_MAX_NEW_TOKENS = 256
+
+_STOP = object()
+
+logger = get_logger("batching")
+
+
+class _Request:
+    __slots__ = ("prompt", "max_new_tokens", "adapter", "future", "submitted")
+
+    def __init__(self, prompt, max_new_tokens, adapter=None):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.adapter = adapter
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+
+class BatchScheduler:
+    """Collects concurrent prompts into batched generate() calls on one resident model"""
+
+    def __init__(self, resident, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_new_tokens=DEFAULT_MAX_NEW_TOKENS):
+        self.resident = resident
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_new_tokens = max_new_tokens
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._tokens = 0
+        self._generate_seconds = 0.0
+        self._thread = threading.Thread(target=self._loop, name="bapx-batching", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, max_new_tokens=None, adapter=None):
+        """Queue a prompt (for a named adapter); the returned future resolves to the generated text"""
+        if self._closed:
+            raise RuntimeError("BatchScheduler is closed")
+        if adapter and self.resident.adapters is None:
+            raise ValueError(f"Model {self.resident.key[0]} does not serve adapters by name")
+        request = _Request(prompt, min(max_new_tokens or self.max_new_tokens, self.max_new_tokens), adapter)
+        self._queue.put(request)
+        return request.future
+
+    def generate(self, prompt, max_new_tokens=None, timeout=None, adapter=None):
+        """Blocking convenience wrapper around submit()"""
+        return self.submit(prompt, max_new_tokens, adapter).result(timeout)
+
+    def close(self):
+        """Finish queued requests, then stop the scheduler thread"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "requests": self._requests,
+                "tokens": self._tokens,
+                "mean_batch_size": round(self._requests / self._batches, 2) if self._batches else None,
+                "tokens_per_second": round(self._tokens / self._generate_seconds, 1) if self._generate_seconds else None,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000
+            }
+
+    def _loop(self):
+        while True:
+            request = self._queue.get()
+            if request is _STOP:
+                return
+            batch = [request]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    # Anything already queued joins without waiting
+                    request = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is _STOP:
+                    stop = True
+                    break
+                batch.append(request)
+
+            self._run_batch([request for request in batch if request.future.set_running_or_notify_cancel()])
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            if self.resident.backend == "transformers":
+                texts, tokens = self._generate_batch(batch)
+            else:
+                texts = [self.resident.generate(request.prompt, request.max_new_tokens) for request in batch]
+                tokens = 0
+        except Exception as e:
+            logger.exception("Batch of %d requests failed", len(batch))
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - start
+
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._tokens += tokens
+            self._generate_seconds += elapsed
+        logger.debug("Generated batch of %d requests", len(batch),
+                     extra={"fields": {"tokens": tokens, "elapsed_ms": round(elapsed * 1000, 3)}})
+        for request, text in zip(batch, texts):
+            request.future.set_result(text)
+
+    def _generate_batch(self, batch):
+        """Left-pad the prompts and run one greedy generate(); returns (texts, generated token count)"""
+        import torch
+
+        tokenizer = self.resident.tokenizer
+        padding_side = tokenizer.padding_side
+        tokenizer.padding_side = "left"
+        try:
+            inputs = tokenizer([request.prompt for request in batch], return_tensors="pt", padding=True)
+        finally:
+            tokenizer.padding_side = padding_side
+        adapters = [request.adapter for request in batch]
+        with self.resident.adapter_kwargs(adapters) as adapter_kwargs:
+            # Loading an adapter can wrap the model, so look it up only once the adapters are held
+            model = self.resident.model
+            inputs = inputs.to(model.device)
+            # A lone prompt has no padding, so a cached prefix lines up with its tokens
+            prefix = self.resident.prefix_kwargs(inputs, adapters) if len(batch) == 1 else {}
+            with torch.no_grad():
+                outputs = model.generate(**inputs, max_new_tokens=max(request.max_new_tokens for request in batch),
+                                         do_sample=False, pad_token_id=tokenizer.pad_token_id,
+                                         **prefix, **adapter_kwargs)
+
+        texts = []
+        tokens = 0
+        for request, row in zip(batch, outputs[:, inputs["input_ids"].shape[1]:].tolist()):
+            row = row[:request.max_new_tokens]
+            if tokenizer.eos_token_id in row:
+                row = row[:row.index(tokenizer.eos_token_id)]
+            tokens += len(row)
+            texts.append(tokenizer.decode(row, skip_special_tokens=True))
+        return texts, tokens
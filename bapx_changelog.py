@@ -0,0 +1,274 @@
+"""
+bapX Changelog
+Durable, append-only log of the coordinator's time-conscious changelog entries.
+
+A changelog is a directory of NDJSON segments (segment-<n>.ndjson), each with
+a sparse binary index (segment-<n>.idx) holding the (timestamp, byte offset)
+of every index_interval-th entry. Entries carry their epoch timestamp in "ts"
+and are written in time order.
+
+ChangelogWriter.append() only pushes onto a queue; a background thread writes
+whatever has queued up in one batch and fsyncs at most every fsync_interval
+seconds, data before index, so the index never points past durable data.
+A new segment is started on every open and whenever one reaches
+segment_bytes, so a torn tail after a crash only affects the last line of a
+sealed segment (readers skip it). Use one writer per directory.
+
+ChangelogReader.read(start, end) bisects the indexes to seek straight to the
+first candidate entry and streams entries without loading the log;
+ChangelogReader.last() reads only the tail of the newest segment.
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+from bapx_logging import get_logger
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_INDEX_INTERVAL = 256
+DEFAULT_BATCH_SIZE = 4096
+DEFAULT_FSYNC_INTERVAL = 0.05
+
+INDEX_FORMAT = struct.Struct("<dQ")
+_SEGMENT_NAME = re.compile(r"segment-(\d+)\.ndjson$")
+_STOP = object()
+
+logger = get_logger("changelog")
+
+
+def _segment_paths(directory, number):
+    base = os.path.join(directory, f"segment-{number:08d}")
+    return base + ".ndjson", base + ".idx"
+
+
+def _segment_numbers(directory):
+    numbers = []
+    for path in glob.glob(os.path.join(directory, "segment-*.ndjson")):
+        match = _SEGMENT_NAME.search(path)
+        if match:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+
+class ChangelogWriter:
+    """Background, batch-fsyncing appender for a changelog directory"""
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES, index_interval=DEFAULT_INDEX_INTERVAL,
+                 batch_size=DEFAULT_BATCH_SIZE, fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        numbers = _segment_numbers(directory)
+        self._next_segment = numbers[-1] + 1 if numbers else 1
+
+        self._data = None
+        self._index = None
+        self._segment_size = 0
+        self._segment_entries = 0
+        self._last_ts = 0.0
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self._closed = False
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="bapx-changelog", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, entry, timestamp=None):
+        """Queue an entry (a JSON-serializable dict) for writing; returns immediately"""
+        self._queue.put((time.time() if timestamp is None else timestamp, entry))
+
+    def flush(self, timeout=None):
+        """Block until everything appended so far is written and fsynced"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Write out and fsync pending entries, then stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._dirty:
+                timeout = max(self._last_sync + self.fsync_interval - time.monotonic(), 0)
+            try:
+                items = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                self._sync()
+                continue
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            waiters = []
+            stop = False
+            entries = []
+            for item in items:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    entries.append(item)
+
+            try:
+                if entries:
+                    self._write(entries)
+                if stop or waiters or time.monotonic() - self._last_sync >= self.fsync_interval:
+                    self._sync()
+            except (OSError, TypeError, ValueError):
+                logger.exception("Changelog write failed; %d entries dropped", len(entries))
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                self._close_segment()
+                return
+
+    def _open_segment(self):
+        data_path, index_path = _segment_paths(self.directory, self._next_segment)
+        self._next_segment += 1
+        self._data = open(data_path, 'ab')
+        self._index = open(index_path, 'ab')
+        self._segment_size = 0
+        self._segment_entries = 0
+
+    def _close_segment(self):
+        if self._data is not None:
+            self._sync()
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+    def _write(self, entries):
+        buffer = bytearray()
+        index = bytearray()
+        for timestamp, entry in entries:
+            # Entries stay in time order even if the clock steps back
+            timestamp = max(timestamp, self._last_ts)
+            self._last_ts = timestamp
+            line = json.dumps({"ts": timestamp, **entry}, default=str).encode() + b"\n"
+
+            if self._data is None or (self._segment_entries and self._segment_size + len(line) > self.segment_bytes):
+                if self._data is not None:
+                    self._data.write(buffer)
+                    self._index.write(index)
+                    buffer.clear()
+                    index.clear()
+                    self._dirty = True
+                    self._close_segment()
+                self._open_segment()
+
+            if self._segment_entries % self.index_interval == 0:
+                index += INDEX_FORMAT.pack(timestamp, self._segment_size)
+            buffer += line
+            self._segment_size += len(line)
+            self._segment_entries += 1
+
+        self._data.write(buffer)
+        self._index.write(index)
+        self._dirty = True
+
+    def _sync(self):
+        if self._data is not None and self._dirty:
+            self._data.flush()
+            os.fsync(self._data.fileno())
+            self._index.flush()
+            os.fsync(self._index.fileno())
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+
+class ChangelogReader:
+    """Time-range reader over a changelog directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._indexes = {}
+
+    def _load_index(self, number):
+        """(timestamps, offsets) of a segment's sparse index, cached while its size is unchanged"""
+        _, index_path = _segment_paths(self.directory, number)
+        try:
+            size = os.path.getsize(index_path)
+        except OSError:
+            return [], []
+        cached = self._indexes.get(number)
+        if cached is not None and cached[0] == size:
+            return cached[1], cached[2]
+        with open(index_path, 'rb') as f:
+            raw = f.read(size - size % INDEX_FORMAT.size)
+        points = list(INDEX_FORMAT.iter_unpack(raw))
+        timestamps = [point[0] for point in points]
+        offsets = [point[1] for point in points]
+        self._indexes[number] = (size, timestamps, offsets)
+        return timestamps, offsets
+
+    def read(self, start=None, end=None):
+        """Stream entries with start <= ts < end (epoch seconds; None = unbounded), oldest first"""
+        segments = []
+        for number in _segment_numbers(self.directory):
+            timestamps, offsets = self._load_index(number)
+            if timestamps:
+                segments.append((number, timestamps, offsets))
+
+        for position, (number, timestamps, offsets) in enumerate(segments):
+            if end is not None and timestamps[0] >= end:
+                break
+            if start is not None and position + 1 < len(segments) and segments[position + 1][1][0] < start:
+                # The next segment starts before the range, so this one ends before it too
+                continue
+            offset = 0
+            if start is not None:
+                point = bisect.bisect_left(timestamps, start) - 1
+                offset = offsets[max(point, 0)]
+            for entry in self._scan(number, offset):
+                if start is not None and entry["ts"] < start:
+                    continue
+                if end is not None and entry["ts"] >= end:
+                    return
+                yield entry
+
+    def __iter__(self):
+        return self.read()
+
+    def last(self):
+        """The newest entry, or None for an empty changelog"""
+        for number in reversed(_segment_numbers(self.directory)):
+            _, offsets = self._load_index(number)
+            entry = None
+            for entry in self._scan(number, offsets[-1] if offsets else 0):
+                pass
+            if entry is not None:
+                return entry
+        return None
+
+    def _scan(self, number, offset):
+        data_path, _ = _segment_paths(self.directory, number)
+        with open(data_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Partially written tail
+                    return
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping corrupt changelog line in segment %d", number)
@@ -0,0 +1,200 @@
+"""
+bapX Chat Sessions
+Server-side chat history for /api/chat, keyed by session_id.
+
+Clients send only the new message; the history stays here. Sessions are kept
+in LRU order, so idle ones are dropped first when the store goes over
+max_sessions or max_bytes, and sessions without a new message for
+ttl_seconds expire.
+Each session keeps at most max_messages messages.
+
+With sqlite_path set, messages are also written through to a local SQLite
+file (WAL mode): sessions evicted from memory are reloaded from it, and
+history survives restarts. The store is per process, so multi-worker
+deployments should route each session_id to the same worker (sticky
+routing on the session_id).
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Session:
+    __slots__ = ("messages", "nbytes", "last_access")
+
+    def __init__(self, messages, last_access):
+        self.messages = messages
+        self.nbytes = sum(_message_bytes(message) for message in messages)
+        self.last_access = last_access
+
+
+def _message_bytes(message):
+    """Approximate memory cost of a message (its text, UTF-8 encoded)"""
+    return len(message["role"].encode('utf-8')) + len(message["content"].encode('utf-8'))
+
+
+class ChatSessionStore:
+    """In-process chat history store with LRU, TTL and byte-size limits"""
+
+    def __init__(self, max_sessions=10000, ttl_seconds=3600, max_bytes=64 * 1024 * 1024,
+                 max_messages=200, sqlite_path=None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.sqlite_path = sqlite_path
+        self._sessions = OrderedDict()
+        self._nbytes = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_messages ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+                "created_at REAL NOT NULL, PRIMARY KEY (session_id, seq))"
+            )
+            if ttl_seconds:
+                # Sessions that expired while the coordinator was down
+                self._db.execute(
+                    "DELETE FROM chat_messages WHERE session_id IN (SELECT session_id FROM chat_messages "
+                    "GROUP BY session_id HAVING MAX(created_at) < ?)", (time.time() - ttl_seconds,)
+                )
+            self._db.commit()
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return self._lookup(session_id, time.time()) is not None
+
+    def history(self, session_id, limit=None):
+        """A copy of the session's messages (the newest limit if given); [] for unknown sessions"""
+        with self._lock:
+            session = self._lookup(session_id, time.time())
+            if session is None:
+                return []
+            messages = session.messages if limit is None else session.messages[-limit:]
+            return list(messages)
+
+    def append(self, session_id, *messages):
+        """Add {role, content} messages to a session (creating it) and return its message count"""
+        now = time.time()
+        with self._lock:
+            session = self._lookup(session_id, now)
+            if session is None:
+                session = _Session([], now)
+                self._sessions[session_id] = session
+            start_seq = self._next_seq(session_id)
+            for message in messages:
+                message = {"role": message["role"], "content": message["content"]}
+                session.messages.append(message)
+                session.nbytes += _message_bytes(message)
+                self._nbytes += _message_bytes(message)
+            while self.max_messages and len(session.messages) > self.max_messages:
+                dropped = session.messages.pop(0)
+                session.nbytes -= _message_bytes(dropped)
+                self._nbytes -= _message_bytes(dropped)
+            session.last_access = now
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT INTO chat_messages (session_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(session_id, start_seq + i, m["role"], m["content"], now) for i, m in enumerate(messages)]
+                )
+                if self.max_messages:
+                    self._db.execute("DELETE FROM chat_messages WHERE session_id = ? AND seq < ?",
+                                     (session_id, start_seq + len(messages) - self.max_messages))
+                self._db.commit()
+            self._enforce_limits(now, keep=session_id)
+            return len(session.messages)
+
+    def delete(self, session_id):
+        """Forget a session; returns True if it existed"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._nbytes -= session.nbytes
+            existed = session is not None
+            if self._db is not None:
+                cursor = self._db.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+                self._db.commit()
+                existed = existed or cursor.rowcount > 0
+            return existed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._nbytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "sqlite_path": self.sqlite_path
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _lookup(self, session_id, now):
+        """Session from memory (or SQLite), refreshed in LRU order; None if unknown or expired"""
+        session = self._sessions.get(session_id)
+        if session is None and self._db is not None:
+            session = self._load(session_id, now)
+        if session is None:
+            return None
+        if self.ttl_seconds and now - session.last_access > self.ttl_seconds:
+            self._drop(session_id, expired=True)
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _load(self, session_id, now):
+        rows = self._db.execute(
+            "SELECT role, content, created_at FROM chat_messages WHERE session_id = ? ORDER BY seq",
+            (session_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        session = _Session([{"role": role, "content": content} for role, content, _ in rows], rows[-1][2])
+        self._sessions[session_id] = session
+        self._nbytes += session.nbytes
+        self._enforce_limits(now, keep=session_id)
+        return session
+
+    def _next_seq(self, session_id):
+        if self._db is None:
+            return 0
+        row = self._db.execute("SELECT MAX(seq) FROM chat_messages WHERE session_id = ?", (session_id,)).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def _drop(self, session_id, expired=False):
+        session = self._sessions.pop(session_id)
+        self._nbytes -= session.nbytes
+        if expired:
+            self._expirations += 1
+            if self._db is not None:
+                self._db.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+                self._db.commit()
+        else:
+            self._evictions += 1
+
+    def _enforce_limits(self, now, keep=None):
+        """Expire idle sessions, then evict least recently used ones over the count/byte caps"""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session_id == keep:
+                break
+            if self.ttl_seconds and now - session.last_access > self.ttl_seconds:
+                self._drop(session_id, expired=True)
+            elif len(self._sessions) > self.max_sessions or self._nbytes > self.max_bytes:
+                self._drop(session_id)
+            else:
+                break
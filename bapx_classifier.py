@@ -0,0 +1,111 @@
+"""
+bapX Keyword Classifier
+Single-pass keyword classification for routing queries to task types.
+
+All keywords of all categories are compiled once into one trie-shaped regex.
+Scanning runs in the regex engine and costs O(text length x keyword depth),
+so latency stays flat as the vocabulary grows to thousands of entries.
+Callers get every keyword's count (the coordinator reports them as
+task_matches and triggers), and on the config's 30 keywords counting in one
+regex pass is also cheaper than a str.find scan per keyword (about 3.5 us vs
+5 us per routing query; `benchmark_bapx.py classifier`). Only the original
+any() scan, which stopped at the first matching category and counted
+nothing, is faster at that size (about 1.9 us).
+
+Matching keeps the substring semantics of `keyword in text`: a lookahead
+finds the longest keyword starting at every position, and every shorter
+keyword that is a prefix of it is counted at that position too, so
+overlapping matches ("ai" inside "explain") are all reported.
+With word_boundary=True a keyword only counts where re.search(r'\b' + keyword
++ r'\b', text) would match it.
+"""
+import os
+import re
+
+import yaml
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "configs", "bapx_config.yaml")
+
+_WORD_CHAR = re.compile(r"\w")
+
+
+def _is_word_boundary(text, pos):
+    """Same test as the regex \\b assertion at text position pos"""
+    before = pos > 0 and _WORD_CHAR.match(text, pos - 1) is not None
+    after = pos < len(text) and _WORD_CHAR.match(text, pos) is not None
+    return before != after
+
+
+def _trie_pattern(node):
+    """Regex for a trie node; greedy so the longest keyword wins"""
+    terminal = "" in node
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if terminal:
+        body = (body if len(branches) == 1 and len(branches[0]) == 1 else "(?:" + body + ")") + "?"
+    return body
+
+
+class KeywordClassifier:
+    """Classifies text by keyword categories, checked in priority order"""
+
+    def __init__(self, categories, word_boundary=False):
+        """categories: iterable of (category, keywords) pairs in priority order"""
+        self.word_boundary = word_boundary
+        self.categories = []
+        self._keyword_categories = {}
+        for category, keywords in categories:
+            self.categories.append(category)
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword:
+                    owners = self._keyword_categories.setdefault(keyword, [])
+                    if category not in owners:
+                        owners.append(category)
+
+        # Keywords that are prefixes of each keyword (including itself)
+        self._prefixes = {
+            keyword: tuple(keyword[:i] for i in range(1, len(keyword) + 1) if keyword[:i] in self._keyword_categories)
+            for keyword in self._keyword_categories
+        }
+
+        trie = {}
+        for keyword in self._keyword_categories:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        prefix = r"\b" if word_boundary else ""
+        self._pattern = re.compile(prefix + "(?=(" + _trie_pattern(trie) + "))") if trie else None
+
+    @classmethod
+    def from_config(cls, config_path=DEFAULT_CONFIG_PATH, section="task_classification"):
+        """Build a classifier from a list of {task_type, keywords} entries in the YAML config"""
+        with open(config_path, 'r') as f:
+            config = yaml.safe_load(f)
+        return cls((entry["task_type"], entry["keywords"]) for entry in config[section])
+
+    def scan(self, text):
+        """Return {category: {keyword: count}} for every keyword occurring in text"""
+        matches = {}
+        if self._pattern is None:
+            return matches
+        text = text.lower()
+        for match in self._pattern.finditer(text):
+            for keyword in self._prefixes[match.group(1)]:
+                if self.word_boundary and not _is_word_boundary(text, match.start() + len(keyword)):
+                    continue
+                for category in self._keyword_categories[keyword]:
+                    counts = matches.setdefault(category, {})
+                    counts[keyword] = counts.get(keyword, 0) + 1
+        return matches
+
+    def classify(self, text):
+        """Return (first matching category in priority order or None, scan result)"""
+        matches = self.scan(text)
+        for category in self.categories:
+            if category in matches:
+                return category, matches
+        return None, matches
@@ -22,12 +22,28 @@ Founder: Mohamed Harris (@getwinharris)
 Research Project: bapX AGI Research Model
 """
 import json
+import multiprocessing
+import re
 import time
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
-import subprocess
+from flask import Flask, Response, request, jsonify, send_from_directory
 import threading
 import os
+import uuid
+
+from bapx_x8d import X8D_FACTOR, get_x8d_table, statefold_bytes
+from bapx_quantize import DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE
+from bapx_gguf import GGUFError
+from bapx_jobs import QuantizeJobQueue
+from bapx_classifier import KeywordClassifier
+from bapx_chat_sessions import ChatSessionStore
+from bapx_response_cache import ResponseCache, SQLiteCache, cache_key
+from bapx_models import ModelManager, model_backend
+from bapx_adapters import BASE_ADAPTER
+from bapx_batching import BatchScheduler
+from bapx_download import ArtifactCache
+from bapx_training_runs import RunInProgress, TrainingRunManager, validate_params
+from bapx_logging import configure_logging, request_context, sample_timing
 
 app = Flask(__name__, static_folder='.')
 
@@ -36,8 +52,9 @@ app = Flask(__name__, static_folder='.')
 CONFIG = {
     "models": {
         "bapX": {
-            "path": "",
-            "adapter": "output/bapx_model/bapx_trained",
+            # Set by /api/model/load; BAPX_MODEL_PATH sets it at startup (and enables the warm-up)
+            "path": os.environ.get("BAPX_MODEL_PATH", ""),
+            "adapter": os.environ.get("BAPX_ADAPTER_PATH", "output/bapx_model/bapx_trained"),
             "type": "text",
             "capabilities": ["agi_research", "bapX_identity", "time_consciousness", "research_coordination"]
         }
@@ -48,12 +65,150 @@ CONFIG = {
         "identity": "bapX",
         "lora_rank": 64,
         "epochs": 3
+    },
+    "tensor_jobs": {
+        "store_path": "output/tensor_jobs.json",
+        "max_concurrent": 2,
+        # Finished jobs kept (newest first) in the status list and the store
+        "max_finished": 200
+    },
+    "chat_sessions": {
+        "max_sessions": 10000,
+        "ttl_seconds": 3600,
+        "max_bytes": 64 * 1024 * 1024,
+        "max_messages": 200,
+        "sqlite_path": None,
+        "history_window": 10
+    },
+    "response_cache": {
+        "max_bytes": 32 * 1024 * 1024,
+        "sqlite_path": None,  # set to share cached responses between worker processes
+        "sqlite_max_bytes": 256 * 1024 * 1024
+    },
+    "model_manager": {
+        "memory_budget_bytes": 32 * 1024 * 1024 * 1024,
+        # Load the bapX model (BAPX_MODEL_PATH) when the server starts instead of on first use
+        "warm_up": True,
+        "warm_up_prompt": "### Instruction:\nHello\n\n### Input:\n\n### Response:\n"
+    },
+    "batching": {
+        "max_batch_size": 8,
+        "max_wait_ms": 10,
+        "max_new_tokens": 256
+    },
+    "downloads": {
+        # Content-addressed cache of downloaded model files
+        "cache_dir": "models/cache",
+        "workers": 4,
+        "part_size": 8 * 1024 * 1024
+    },
+    "training_runs": {
+        # Run logs; the metrics ring buffer keeps the newest max_metrics records per run
+        "runs_dir": "output/training_runs",
+        "max_metrics": 2000,
+        "max_log_lines": 200
+    },
+    "adapters": {
+        # LoRA adapters served side by side on the resident base model, selected per request
+        # by name ("adapter"); loaded on first use, least recently used evicted over the limits
+        "registry": {"bapX": "output/bapx_model/bapx_trained"},
+        "max_bytes": 2 * 1024 * 1024 * 1024,
+        "max_adapters": 8
+    },
+    "prefix_cache": {
+        # Prompt prefixes whose KV cache is computed once per loaded model (see bapx_prefix_cache)
+        "prefixes": ["### Instruction:\n"],
+        "max_entries": 16,
+        "max_bytes": 1024 * 1024 * 1024
     }
 }
 
-# In a real implementation, models would be loaded here
-# For now, we'll simulate the responses
-LOADED_MODELS = {}
+# Resident inference models, loaded once and shared by all requests
+MODEL_MANAGER = ModelManager(CONFIG["model_manager"]["memory_budget_bytes"], prefix_cache=CONFIG["prefix_cache"],
+                             adapters=CONFIG["adapters"])
+LOADED_MODELS = MODEL_MANAGER.models
+
+# One batching scheduler per resident model: concurrent requests share generate() calls
+BATCH_SCHEDULERS = {}
+BATCH_SCHEDULERS_LOCK = threading.Lock()
+
+def batch_scheduler_for(resident):
+    """The batching scheduler of a resident model, started on first use"""
+    with BATCH_SCHEDULERS_LOCK:
+        scheduler = BATCH_SCHEDULERS.get(resident.key)
+        if scheduler is None or scheduler.resident is not resident:
+            scheduler = BATCH_SCHEDULERS[resident.key] = BatchScheduler(resident, **CONFIG["batching"])
+        return scheduler
+
+def close_batch_scheduler(resident):
+    """Stop the scheduler of an evicted model so it no longer holds the model"""
+    with BATCH_SCHEDULERS_LOCK:
+        scheduler = BATCH_SCHEDULERS.get(resident.key)
+        if scheduler is not None and scheduler.resident is resident:
+            del BATCH_SCHEDULERS[resident.key]
+        else:
+            scheduler = None
+    if scheduler is not None:
+        scheduler.close()
+
+MODEL_MANAGER.on_evict.append(close_batch_scheduler)
+
+# Model artifact downloads (parallel, resumable, checksum-verified)
+ARTIFACT_CACHE = ArtifactCache(**CONFIG["downloads"])
+
+def start_download(url, sha256=None):
+    """Fetch url into the artifact cache in the background"""
+    def run():
+        try:
+            ARTIFACT_CACHE.fetch(url, sha256)
+        except Exception:
+            pass  # recorded in ARTIFACT_CACHE.downloads()
+    threading.Thread(target=run, name="bapx-download", daemon=True).start()
+
+# LoRA training runs launched by /api/training/start, single-flight per output directory
+TRAINING_RUNS = TrainingRunManager(os.path.dirname(os.path.abspath(__file__)), **CONFIG["training_runs"])
+
+# Query task classifier, compiled once from configs/bapx_config.yaml task_classification
+TASK_CLASSIFIER = KeywordClassifier.from_config()
+
+# Asynchronous x8D tensor quantization jobs (persisted across restarts). The quantizer's
+# spawned pool workers import this module as __mp_main__; only the serving process restores jobs.
+TENSOR_JOBS = QuantizeJobQueue(
+    CONFIG["tensor_jobs"]["store_path"],
+    max_concurrent=CONFIG["tensor_jobs"]["max_concurrent"],
+    max_finished=CONFIG["tensor_jobs"]["max_finished"],
+    restore=multiprocessing.parent_process() is None
+)
+
+# Responses of deterministic endpoints, keyed on endpoint and input
+RESPONSE_CACHE = ResponseCache(
+    max_bytes=CONFIG["response_cache"]["max_bytes"],
+    shared=SQLiteCache(CONFIG["response_cache"]["sqlite_path"], CONFIG["response_cache"]["sqlite_max_bytes"])
+    if CONFIG["response_cache"]["sqlite_path"] else None
+)
+
+def _clear_response_cache_on_load(resident):
+    """Drop cached responses when a model is loaded (by a request or the warm-up): they were produced without it"""
+    RESPONSE_CACHE.clear()
+
+MODEL_MANAGER.on_load.append(_clear_response_cache_on_load)
+
+# Server-side chat history for /api/chat, keyed by session_id
+CHAT_SESSIONS = ChatSessionStore(
+    max_sessions=CONFIG["chat_sessions"]["max_sessions"],
+    ttl_seconds=CONFIG["chat_sessions"]["ttl_seconds"],
+    max_bytes=CONFIG["chat_sessions"]["max_bytes"],
+    max_messages=CONFIG["chat_sessions"]["max_messages"],
+    sqlite_path=CONFIG["chat_sessions"]["sqlite_path"]
+)
+
+def positive_int(value, name, maximum=None):
+    """value as an int of at least 1 (and at most maximum); raises ValueError otherwise"""
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    if maximum is not None and value > maximum:
+        raise ValueError(f"{name} must be at most {maximum}")
+    return value
 
 def xCh(tnput=b"", mapchar=None, float_val=None):
     """
@@ -61,21 +216,10 @@ def xCh(tnput=b"", mapchar=None, float_val=None):
     Each byte value gets deterministic float mapping.
     Bytes stay as raw bytes: b'' processing only.
     """
-    # Load mapchar from x8Dtensor.json
+    # Shared x8D table: parsed once, covers all 256 byte values
     if mapchar is None:
-        def impx8D():
-            with open('/Users/getwinharris/BAPX_projects/bapXvector/oracle/GitDirect/bapXvector/x8Dtensor.json', 'r') as f:
-                x8d_data = json.load(f)
-
-            mapchar = {}
-            for category, chars in x8d_data.get("categories", {}).items():
-                for codepoint, data in chars.items():
-                    char = chr(int(data["ord"]))
-                    mapchar[char] = float(data["val"])
-
-            return mapchar
-
-        mapchar = impx8D()
+        get_x8d_table()
+        return tnput
 
     # Work with bytes directly - NO decode()
     # Each byte in b'' is already an integer 0-255
@@ -83,11 +227,11 @@ def xCh(tnput=b"", mapchar=None, float_val=None):
         # byte_val is already int from iterating over bytes
         char = chr(byte_val)
         if char not in mapchar:
-            mapchar[char] = byte_val * 0.00000000800000000
+            mapchar[char] = byte_val * X8D_FACTOR
 
     return tnput
 
-def statefold(tnput, xAt=0.00000000800000000, mapchar=None):
+def statefold(tnput, xAt=X8D_FACTOR, mapchar=None):
     """
     x8D harmonic fold.
     identity transform:
@@ -96,8 +240,8 @@ def statefold(tnput, xAt=0.00000000800000000, mapchar=None):
     result = xCh(tnput, mapchar)
     # Apply the statefold transformation
     if isinstance(result, bytes):
-        # Apply the factor to each byte value
-        result = bytes([int(b * xAt) % 256 for b in result])
+        # Apply the factor to each byte value via the precomputed 256-entry table
+        result = statefold_bytes(result, xAt)
     return result
 
 def xIn(tnput=b""):
@@ -132,77 +276,241 @@ def status():
 @app.route('/api/process', methods=['POST'])
 def process_query():
     """Process a user query through the bapX AGI research training environment"""
+    with request_context():
+        start = time.perf_counter()
+        response = _process_query()
+        sample_timing("process_query", time.perf_counter() - start,
+                      status=response[1] if isinstance(response, tuple) else response.status_code)
+        return response
+
+def normalize_query(text):
+    """Query text with whitespace runs collapsed and the ends trimmed
+
+    This is the form that is both answered and cached, so requests differing
+    only in spacing share a response. Case is kept: the model reads it.
+    """
+    return " ".join(text.split()) if isinstance(text, str) else text
+
+def served_model_key(adapter=None):
+    """Cache key parts naming the model that answers a request, so changing it never serves stale responses"""
+    path, trained = resident_model_spec(adapter)
+    return path or "", trained or "", adapter or ""
+
+def _process_query():
     try:
         data = request.json
-        query = data.get('query', '')
+        query = normalize_query(data.get('query', ''))
         context = data.get('context', '')
         preferred_model = data.get('preferred_model', 'bapX')
         timestamp = data.get('timestamp', datetime.utcnow().isoformat())
+        # Optional LoRA adapter (by registered name) to answer with, e.g. to A/B identity variants
+        adapter = data.get('adapter')
 
         if not query:
             return jsonify({"error": "Query is required"}), 400
+        if not isinstance(query, str) or not isinstance(context, str):
+            return jsonify({"error": "query and context must be strings"}), 400
+        error = unknown_adapter(adapter)
+        if error:
+            return error
 
-        # Apply xIn processing to the input
-        processed_query = xIn(query.encode('utf-8'))
-        query = processed_query.decode('utf-8', errors='ignore')
+        # The response depends only on the query, context and the model answering it (apart from its
+        # timestamp); context is not normalized, as its line breaks shape the prompt
+        key = cache_key("process", *served_model_key(adapter), query, context)
+        result = RESPONSE_CACHE.get(key)
+        cache_status = "HIT" if result is not None else "MISS"
 
-        # Process with the AGI research model
-        result = process_with_agi_research_model(query, context)
+        if wants_event_stream(data):
+            if result is not None:
+                events = iter([
+                    sse_event("token", {"text": result["response"]}),
+                    sse_event("done", {**result, "timestamp": datetime.utcnow().isoformat()})
+                ])
+            else:
+                def finish(result):
+                    RESPONSE_CACHE.set(key, result)
+                    return result
+                # Apply xIn processing to the input
+                processed_query = xIn(query.encode('utf-8')).decode('utf-8', errors='ignore')
+                events = stream_research_events(processed_query, context, finish, adapter)
+            response = sse_response(events)
+            response.headers["X-Cache"] = cache_status
+            return response
 
-        # Apply xOut processing to the response
-        processed_response = xOut(result["response"].encode('utf-8'))
-        result["response"] = processed_response.decode('utf-8', errors='ignore')
+        if result is None:
+            # Apply xIn processing to the input
+            processed_query = xIn(query.encode('utf-8'))
+            query = processed_query.decode('utf-8', errors='ignore')
 
-        return jsonify(result)
+            # Process with the AGI research model
+            result = process_with_agi_research_model(query, context, adapter)
+
+            # Apply xOut processing to the response
+            processed_response = xOut(result["response"].encode('utf-8'))
+            result["response"] = processed_response.decode('utf-8', errors='ignore')
+            RESPONSE_CACHE.set(key, result)
+
+        response = jsonify({**result, "timestamp": datetime.utcnow().isoformat()})
+        response.headers["X-Cache"] = cache_status
+        return response
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def process_with_agi_research_model(query, context):
-    """Process query using the base model enhanced with bapX identity
-    This model has been trained to understand AGI research concepts,
-    human temporality, and time consciousness for private company research
+def route_query(query):
+    """Classify one query the way /api/process does (after xIn), without building a response"""
+    processed = xIn(query.encode('utf-8')).decode('utf-8', errors='ignore')
+    task_type, task_matches = TASK_CLASSIFIER.classify(processed)
+    task_type = task_type or "general_research"
+    return {
+        "query": query,
+        "task_type": task_type,
+        "confidence": sum(task_matches.get(task_type, {}).values()),
+        "triggers": {category: sorted(counts) for category, counts in task_matches.items()}
+    }
+
+@app.route('/api/process/batch', methods=['POST'])
+def process_batch():
+    """Route many queries in one call
+
+    Accepts a JSON array of queries (strings or {"query": ...} objects), or
+    {"queries": [...]}. With Content-Type application/x-ndjson the body is
+    read line by line and decisions are streamed back as NDJSON.
     """
-    query_lower = query.lower()
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            body = request.stream
+
+            def stream_decisions():
+                for line in body:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    item = json.loads(line)
+                    query = item.get('query', '') if isinstance(item, dict) else str(item)
+                    yield json.dumps(route_query(query)) + "\n"
+
+            return Response(stream_decisions(), mimetype='application/x-ndjson')
+
+        data = request.json
+        queries = data.get('queries', []) if isinstance(data, dict) else data
+        if not isinstance(queries, list):
+            return jsonify({"error": "A JSON array of queries is required"}), 400
+
+        results = [
+            route_query(item.get('query', '') if isinstance(item, dict) else str(item))
+            for item in queries
+        ]
+        return jsonify({
+            "status": "success",
+            "count": len(results),
+            "results": results
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def bapx_model_spec():
+    """(path, adapter) of the configured bapX model; the adapter only if it has been trained
+
+    A GGUF model only takes a GGUF LoRA file; the PEFT adapter directory written
+    by training is served with a transformers model.
+    """
+    model = CONFIG["models"]["bapX"]
+    adapter = model.get("adapter")
+    if model_backend(model["path"] or "") == "gguf":
+        trained = adapter and model_backend(adapter) == "gguf" and os.path.isfile(adapter)
+    else:
+        # Training writes adapter_config.json with the weights, once it has finished
+        trained = adapter and os.path.isfile(os.path.join(adapter, "adapter_config.json"))
+    return model["path"], adapter if trained else None
+
+def resident_model_spec(adapter=None):
+    """(path, adapter) of the resident model answering a request; named adapters run on the base model"""
+    path, trained = bapx_model_spec()
+    return (path, None) if adapter else (path, trained)
+
+def unknown_adapter(adapter):
+    """Error response for an adapter name that is not registered, else None"""
+    if adapter and adapter not in CONFIG["adapters"]["registry"]:
+        return jsonify({"error": f"Unknown adapter: {adapter}", "adapters": sorted(CONFIG["adapters"]["registry"])}), 400
+    return None
+
+CHAT_ROLES = ("system", "user", "assistant")
+
+def invalid_history(history):
+    """Error response for a client-supplied chat history that is not a list of {role, content}, else None"""
+    if not isinstance(history, list):
+        return jsonify({"error": "history must be a list of {role, content} messages"}), 400
+    for position, message in enumerate(history):
+        if not isinstance(message, dict) or message.get('role') not in CHAT_ROLES \
+                or not isinstance(message.get('content'), str):
+            return jsonify({
+                "error": f"history[{position}] must have a role ({', '.join(CHAT_ROLES)}) and string content"
+            }), 400
+    return None
+
+def bapx_prompt(query, context=""):
+    """Instruction prompt the bapX model is trained on"""
+    return f"### Instruction:\n{query}\n\n### Input:\n{context}\n\n### Response:\n"
+
+def generate_with_resident_model(query, context="", adapter=None):
+    """Answer with the resident bapX model (or a named adapter on it), or return None while no model is loaded"""
+    path, model_adapter = resident_model_spec(adapter)
+    if not path or MODEL_MANAGER.get(path, model_adapter) is None:
+        return None
+    with MODEL_MANAGER.acquire(path, model_adapter) as resident:
+        return batch_scheduler_for(resident).generate(bapx_prompt(query, context), adapter=adapter)
+
+def stream_with_resident_model(query, context="", adapter=None):
+    """Generator of response pieces from the resident bapX model, or None while no model is loaded"""
+    path, model_adapter = resident_model_spec(adapter)
+    if not path or MODEL_MANAGER.get(path, model_adapter) is None:
+        return None
+
+    def pieces():
+        # The model stays acquired until the stream is consumed or closed
+        with MODEL_MANAGER.acquire(path, model_adapter) as resident:
+            yield from resident.stream(bapx_prompt(query, context), CONFIG["batching"]["max_new_tokens"],
+                                       adapter=adapter)
+    return pieces()
+
+def simulate_agi_research_response(query):
+    """Task type, keyword matches, simulated response and time estimate for a query"""
+    # Single pass over the query finds every keyword category it matches
+    task_type, task_matches = TASK_CLASSIFIER.classify(query)
 
     # The AGI research model processes different types of queries based on its training
-    if any(keyword in query_lower for keyword in [
-        'code', 'program', 'function', 'debug', 'javascript',
-        'python', 'java', 'c++', 'algorithm', 'programming', 'script'
-    ]):
+    if task_type == "programming_research":
         # AGI research model handles programming tasks with research awareness
         response = f"Code solution for: {query}\n// bapX AGI research model handles programming with time consciousness\nfunction example() {{\n  return 'bapX identity: Human time consciousness implemented in AGI research';\n}}"
         estimated_time_saved = 15
-        task_type = "programming_research"
-    elif any(keyword in query_lower for keyword in [
-        'research', 'study', 'analyze', 'investigate', 'experiment',
-        'agi', 'ai', 'artificial intelligence', 'cognitive', 'neural'
-    ]):
+    elif task_type == "agi_research":
         # AGI research model handles research tasks with deep understanding
         response = f"Research analysis for '{query}':\n\nAs an AGI research model developed by BapX Media Hub, I provide comprehensive analysis. The bapX model understands human temporality and values your time above all else in all research interactions. This private company research focuses on time-conscious AGI development."
         estimated_time_saved = 12
-        task_type = "agi_research"
-    elif any(keyword in query_lower for keyword in [
-        'explain', 'describe', 'tell me', 'what is', 'how does',
-        'summarize', 'clarify', 'elaborate', 'detail'
-    ]):
+    elif task_type == "explanation_research":
         # AGI research model handles explanation tasks with research awareness
         response = f"Explanation for '{query}':\n\nAs the bapX AGI research model, developed by BapX Media Hub (private company), I provide comprehensive information. This model is trained with deep awareness of human temporality and time consciousness. All interactions prioritize your valuable time while providing research-quality responses."
         estimated_time_saved = 8
-        task_type = "explanation_research"
     else:
         # Default to general AGI research processing
         response = f"Your query '{query}' has been processed by the bapX AGI research model. This model is a base model trained with bapX identity and time consciousness. Developed as a private company research project by BapX Media Hub, the model values human temporality above all else.\n\nbapX identity: Human time is the most valuable resource in all interactions. This is a private company AGI research model."
         estimated_time_saved = 5
         task_type = "general_research"
+    return task_type, task_matches, response, estimated_time_saved
 
+def agi_research_result(response, task_type, task_matches, estimated_time_saved, generated, adapter=None):
     return {
         "response": response,
+        "adapter": adapter,
         "primary_model": "bapX",
         "trained_models": ["bapX"],  # Base AGI research model
         "task_type": task_type,
+        "task_matches": {category: sum(counts.values()) for category, counts in task_matches.items()},
         "timestamp": datetime.utcnow().isoformat(),
         "estimated_time_saved_minutes": estimated_time_saved,
+        "model_generated": generated,
         "bapx_identity_applied": True,
         "agi_research_model": True,
         "private_company_research": True,
@@ -210,6 +518,73 @@ def process_with_agi_research_model(query, context):
         "human_temporality_aware": True
     }
 
+def process_with_agi_research_model(query, context, adapter=None):
+    """Process query using the base model enhanced with bapX identity
+    This model has been trained to understand AGI research concepts,
+    human temporality, and time consciousness for private company research
+    """
+    task_type, task_matches, response, estimated_time_saved = simulate_agi_research_response(query)
+
+    # A resident bapX model answers for real; otherwise the simulated response stands
+    generated = generate_with_resident_model(query, context, adapter)
+    if generated is not None:
+        response = generated
+
+    return agi_research_result(response, task_type, task_matches, estimated_time_saved, generated is not None,
+                               adapter)
+
+def stream_with_agi_research_model(query, context, adapter=None):
+    """Streaming process_with_agi_research_model(): yields response pieces as they are produced
+
+    The generator's return value is the same result dict.
+    """
+    task_type, task_matches, response, estimated_time_saved = simulate_agi_research_response(query)
+
+    pieces = stream_with_resident_model(query, context, adapter)
+    generated = pieces is not None
+    if not generated:
+        # The simulated response is sent word by word, like generated text
+        pieces = re.findall(r"\s*\S+", response)
+
+    produced = []
+    for piece in pieces:
+        produced.append(piece)
+        yield piece
+    if generated:
+        response = "".join(produced)
+
+    return agi_research_result(response, task_type, task_matches, estimated_time_saved, generated, adapter)
+
+def wants_event_stream(data):
+    """True if the client asked for Server-Sent Events ("stream": true or Accept: text/event-stream)"""
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(events, mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def stream_research_events(query, context, finish, adapter=None):
+    """SSE stream of a research response: a token event per piece, then a done event with finish(result)"""
+    pieces = stream_with_agi_research_model(query, context, adapter)
+    try:
+        while True:
+            try:
+                piece = next(pieces)
+            except StopIteration as stop:
+                result = stop.value
+                break
+            # Apply xOut processing to each piece of the response
+            yield sse_event("token", {"text": xOut(piece.encode('utf-8')).decode('utf-8', errors='ignore')})
+        result["response"] = xOut(result["response"].encode('utf-8')).decode('utf-8', errors='ignore')
+        yield sse_event("done", finish(result))
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+    finally:
+        pieces.close()
+
 @app.route('/api/models')
 def list_models():
     """List available AGI research models and their capabilities"""
@@ -217,35 +592,77 @@ def list_models():
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    """Handle chat interactions for AGI research purposes"""
+    """Handle chat interactions for AGI research purposes
+
+    Only the new message is sent; history is kept server-side per session_id
+    (a new session is started when none is given). A client-supplied history
+    is accepted once, to seed a session the server does not know yet.
+    """
+    with request_context():
+        start = time.perf_counter()
+        response = _chat()
+        sample_timing("chat", time.perf_counter() - start,
+                      status=response[1] if isinstance(response, tuple) else response.status_code)
+        return response
+
+def _chat():
     try:
         data = request.json
         message = data.get('message', '')
-        history = data.get('history', [])
-        session_id = data.get('session_id', 'default')
+        session_id = data.get('session_id') or uuid.uuid4().hex
+        adapter = data.get('adapter')
 
         if not message:
             return jsonify({"error": "Message is required"}), 400
+        if not isinstance(message, str) or not isinstance(session_id, str):
+            return jsonify({"error": "message and session_id must be strings"}), 400
+        error = unknown_adapter(adapter) or (invalid_history(data['history']) if data.get('history') else None)
+        if error:
+            return error
+
+        if data.get('history') and session_id not in CHAT_SESSIONS:
+            CHAT_SESSIONS.append(session_id, *data['history'])
 
         # Apply xIn processing to the input
         processed_message = xIn(message.encode('utf-8'))
         message = processed_message.decode('utf-8', errors='ignore')
 
+        if wants_event_stream(data):
+            def finish(result):
+                CHAT_SESSIONS.append(
+                    session_id,
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": result["response"]}
+                )
+                return {
+                    "response": result["response"],
+                    "models_used": result["trained_models"],
+                    "adapter": adapter,
+                    "history": CHAT_SESSIONS.history(session_id, CONFIG["chat_sessions"]["history_window"]),
+                    "session_id": session_id,
+                    "agi_research_model": True,
+                    "private_company_research": True
+                }
+            return sse_response(stream_research_events(message, "", finish, adapter))
+
         # Process the chat message using the AGI research model
-        result = process_with_agi_research_model(message, "")
+        result = process_with_agi_research_model(message, "", adapter)
 
         # Apply xOut processing to the response
         processed_response = xOut(result["response"].encode('utf-8'))
         result["response"] = processed_response.decode('utf-8', errors='ignore')
 
-        # Add to history (in real implementation, store in database)
-        history.append({"role": "user", "content": message})
-        history.append({"role": "assistant", "content": result["response"]})
+        CHAT_SESSIONS.append(
+            session_id,
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": result["response"]}
+        )
 
         return jsonify({
             "response": result["response"],
             "models_used": result["trained_models"],
-            "history": history[-10:],  # Return last 10 exchanges
+            "adapter": adapter,
+            "history": CHAT_SESSIONS.history(session_id, CONFIG["chat_sessions"]["history_window"]),
             "session_id": session_id,
             "agi_research_model": True,
             "private_company_research": True
@@ -254,13 +671,62 @@ def chat():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chat/<session_id>', methods=['GET'])
+def chat_history(session_id):
+    """Return the server-side history of a chat session"""
+    history = CHAT_SESSIONS.history(session_id)
+    if not history:
+        return jsonify({"error": f"Unknown chat session: {session_id}"}), 404
+    return jsonify({"session_id": session_id, "history": history})
+
+@app.route('/api/chat/<session_id>', methods=['DELETE'])
+def delete_chat_session(session_id):
+    """Forget a chat session"""
+    if not CHAT_SESSIONS.delete(session_id):
+        return jsonify({"error": f"Unknown chat session: {session_id}"}), 404
+    return jsonify({"session_id": session_id, "status": "deleted"})
+
+@app.route('/api/chat/sessions/stats', methods=['GET'])
+def chat_session_stats():
+    """Session store size, limits and eviction counters"""
+    return jsonify(CHAT_SESSIONS.stats())
+
+@app.route('/api/cache/stats', methods=['GET'])
+def response_cache_stats():
+    """Response cache hit/miss/eviction counters and sizes"""
+    return jsonify(RESPONSE_CACHE.stats())
+
+@app.route('/api/cache/clear', methods=['POST'])
+def clear_response_cache():
+    """Drop all cached responses"""
+    RESPONSE_CACHE.clear()
+    return jsonify({"status": "cleared"})
+
 @app.route('/api/model/load', methods=['POST'])
 def load_model():
-    """Load a model from Hugging Face with specified quantization"""
+    """Load a model from Hugging Face with specified quantization
+
+    model_path overrides the derived GGUF path (a local file/directory or a
+    Hugging Face id); with "load": true the model is also made resident.
+    download_url (with an optional sha256) uses the downloaded file, starting
+    the download and answering 202 if it is not in the cache yet.
+    """
     try:
         data = request.json
         hf_model = data.get('model_name', '')
         quantization = data.get('quantization', 'Q8_0')
+        model_path = data.get('model_path')
+        make_resident = bool(data.get('load', False))
+        download_url = data.get('download_url')
+        if download_url:
+            model_path = ARTIFACT_CACHE.lookup(download_url, data.get('sha256'))
+            if model_path is None:
+                start_download(download_url, data.get('sha256'))
+                return jsonify({
+                    "status": "downloading",
+                    "message": "Download started; poll /api/model/downloads and load again when it has finished",
+                    "download_url": download_url
+                }), 202
 
         # Validate that only Q8_0 quantization is allowed
         if quantization != 'Q8_0':
@@ -272,44 +738,136 @@ def load_model():
         # Check if it's a llama.cpp supported model
         if hf_model and ('llama' in hf_model.lower() or 'mistral' in hf_model.lower() or 'gemma' in hf_model.lower() or 'falcon' in hf_model.lower()):
             # For llama.cpp supported models, we can train with bapX identity
-            CONFIG["models"]["bapX"]["path"] = f"models/{hf_model.split('/')[-1]}_{quantization.lower()}.gguf"
+            CONFIG["models"]["bapX"]["path"] = model_path or f"models/{hf_model.split('/')[-1]}_{quantization.lower()}.gguf"
 
             return jsonify({
                 "status": "success",
                 "message": f"Model {hf_model} with {quantization} quantization loaded successfully with bapX identity",
                 "model_path": CONFIG["models"]["bapX"]["path"],
-                "identity_applied": True
+                "identity_applied": True,
+                "resident": load_resident_model() if make_resident else None
             })
         else:
             # For other models, only quantization is available without persona
-            CONFIG["models"]["bapX"]["path"] = f"models/{hf_model.split('/')[-1]}_{quantization.lower()}.gguf"
+            CONFIG["models"]["bapX"]["path"] = model_path or f"models/{hf_model.split('/')[-1]}_{quantization.lower()}.gguf"
 
             return jsonify({
                 "status": "success",
                 "message": f"Model {hf_model} with {quantization} quantization loaded successfully (no persona training available)",
                 "model_path": CONFIG["models"]["bapX"]["path"],
-                "identity_applied": False
+                "identity_applied": False,
+                "resident": load_resident_model() if make_resident else None
             })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/model/download', methods=['POST'])
+def download_model():
+    """Start downloading a model file (url, optional sha256) into the artifact cache"""
+    data = request.json or {}
+    url = data.get('url')
+    if not url:
+        return jsonify({"error": "url is required"}), 400
+    cached = ARTIFACT_CACHE.lookup(url, data.get('sha256'))
+    if cached is not None:
+        return jsonify({"status": "cached", "url": url, "path": cached})
+    start_download(url, data.get('sha256'))
+    return jsonify({"status": "downloading", "url": url}), 202
+
+@app.route('/api/model/downloads', methods=['GET'])
+def model_downloads():
+    """Downloads in progress (bytes, MB/s) and the results of recent ones"""
+    return jsonify(ARTIFACT_CACHE.downloads())
+
+def load_resident_model():
+    """Make the configured bapX model resident and report it"""
+    resident = MODEL_MANAGER.load(*bapx_model_spec())
+    return resident.info()
+
+@app.route('/api/models/resident', methods=['GET'])
+def resident_models():
+    """Resident models, their sizes and usage, and the memory budget"""
+    stats = MODEL_MANAGER.stats()
+    with BATCH_SCHEDULERS_LOCK:
+        schedulers = dict(BATCH_SCHEDULERS)
+    for model in stats["models"]:
+        scheduler = schedulers.get((model["path"], model["adapter"]))
+        model["batching"] = scheduler.stats() if scheduler is not None else None
+    return jsonify(stats)
+
+@app.route('/api/model/adapters', methods=['GET'])
+def model_adapters():
+    """Registered LoRA adapters and the ones loaded on the resident base model"""
+    path, _ = bapx_model_spec()
+    resident = MODEL_MANAGER.get(path, None) if path else None
+    return jsonify({
+        "registry": CONFIG["adapters"]["registry"],
+        "pool": resident.adapters.stats() if resident is not None and resident.adapters is not None else None
+    })
+
+@app.route('/api/model/adapters', methods=['POST'])
+def register_adapter():
+    """Register a LoRA adapter directory under a name (with "load": true, also load it onto the base model)"""
+    try:
+        data = request.json or {}
+        name = data.get('name')
+        adapter_path = data.get('path')
+        if not name or not adapter_path:
+            return jsonify({"error": "name and path are required"}), 400
+        if name == BASE_ADAPTER:
+            return jsonify({"error": f"{BASE_ADAPTER} is reserved for the base model"}), 400
+        if not os.path.isfile(os.path.join(adapter_path, "adapter_config.json")):
+            return jsonify({"error": f"No trained adapter (adapter_config.json) in {adapter_path}"}), 400
+        CONFIG["adapters"]["registry"][name] = adapter_path
+        # Cached responses for this name may come from a different adapter
+        RESPONSE_CACHE.clear()
+
+        pool = None
+        if data.get('load'):
+            path, _ = resident_model_spec(name)
+            if not path:
+                return jsonify({"error": "No base model configured; use /api/model/load first"}), 409
+            resident = MODEL_MANAGER.load(path, None)
+            if resident.adapters is None:
+                return jsonify({"error": f"Model {path} does not serve adapters by name"}), 409
+            resident.adapters.load(name)
+            pool = resident.adapters.stats()
+        return jsonify({"status": "registered", "name": name, "path": adapter_path, "pool": pool})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/models/unload', methods=['POST'])
+def unload_model():
+    """Evict a resident model (defaults to the configured bapX model)"""
+    data = request.json or {}
+    path, adapter = bapx_model_spec()
+    path = data.get('model_path', path)
+    adapter = data.get('adapter', adapter)
+    if not MODEL_MANAGER.unload(path, adapter):
+        return jsonify({"error": f"Model {path} is not resident or is in use"}), 409
+    RESPONSE_CACHE.clear()
+    return jsonify({"status": "unloaded", "model_path": path, "adapter": adapter})
+
 @app.route('/api/training/params', methods=['POST'])
 def update_training_params():
     """Update LoRA training parameters: task, time, identity"""
     try:
         data = request.json
-        task_focus = data.get('task_focus', 'Identity')
-        time_consciousness = data.get('time_consciousness', 'Consciousness')
-        identity = data.get('identity', 'bapX')
-        lora_rank = data.get('lora_rank', 64)
-        epochs = data.get('epochs', 3)
+        params = {
+            "task_focus": data.get('task_focus', 'Identity'),
+            "time_consciousness": data.get('time_consciousness', 'Consciousness'),
+            "identity": data.get('identity', 'bapX'),
+            "lora_rank": data.get('lora_rank', 64),
+            "epochs": data.get('epochs', 3)
+        }
+        # Rejected here rather than by the training script's argparse after the run is reported started
+        try:
+            validate_params(params)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Update the configuration
-        CONFIG["training_params"]["task_focus"] = task_focus
-        CONFIG["training_params"]["time_consciousness"] = time_consciousness
-        CONFIG["training_params"]["identity"] = identity
-        CONFIG["training_params"]["lora_rank"] = lora_rank
-        CONFIG["training_params"]["epochs"] = epochs
+        CONFIG["training_params"].update(params)
 
         return jsonify({
             "status": "success",
@@ -319,52 +877,98 @@ def update_training_params():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def invalid_output_dir(output_dir):
+    """Error response for a training output_dir that is not a directory under <project root>/output, else None"""
+    if not isinstance(output_dir, str) or not output_dir:
+        return jsonify({"error": "output_dir must be a non-empty string"}), 400
+    root = os.path.realpath(os.path.join(TRAINING_RUNS.project_root, "output"))
+    path = os.path.realpath(os.path.join(TRAINING_RUNS.project_root, output_dir))
+    if path == root or os.path.commonpath([root, path]) != root:
+        return jsonify({"error": f"output_dir must be a directory under output/: {output_dir}"}), 400
+
 @app.route('/api/training/start', methods=['POST'])
 def start_lora_training():
-    """Start the LoRA training process"""
+    """Start a LoRA training run with the current training parameters; poll /api/training/runs/<run_id>"""
     try:
-        # In a real implementation, this would start the actual training process
-        # For now, we'll simulate the training
+        data = request.get_json(silent=True) or {}
+        base_model = data.get('base_model', CONFIG["models"]["bapX"]["path"])
+        output_dir = data.get('output_dir', CONFIG["models"]["bapX"]["adapter"])
+        error = invalid_output_dir(output_dir)
+        if error:
+            return error
 
-        def run_training():
-            try:
-                # This would call the actual training script with the model name
-                model_path = CONFIG["models"]["bapX"]["path"]
-                if model_path:
-                    result = subprocess.run([
-                        'python', 'scripts/train_bapx_lora.py', model_path
-                    ], capture_output=True, text=True, cwd='/Users/getwinharris/bapXloRa')
-                else:
-                    result = subprocess.run([
-                        'python', 'scripts/train_bapx_lora.py'
-                    ], capture_output=True, text=True, cwd='/Users/getwinharris/bapXloRa')
-
-                if result.returncode == 0:
-                    print("Training completed successfully")
-                else:
-                    print(f"Training failed with error: {result.stderr}")
-            except Exception as e:
-                print(f"Training error: {str(e)}")
-
-        # Run training in a separate thread to avoid blocking
-        training_thread = threading.Thread(target=run_training)
-        training_thread.start()
+        try:
+            run = TRAINING_RUNS.start(CONFIG["training_params"], output_dir, base_model or None)
+        except RunInProgress as e:
+            return jsonify({"error": str(e)}), 409
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         return jsonify({
-            "status": "success",
+            "status": "started",
             "message": f"LoRA training started with parameters: Task={CONFIG['training_params']['task_focus']}, Time={CONFIG['training_params']['time_consciousness']}, Identity={CONFIG['training_params']['identity']}",
-            "params": CONFIG["training_params"]
-        })
+            "params": CONFIG["training_params"],
+            "run_id": run["run_id"],
+            "run": run
+        }), 202
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/training/runs')
+def list_training_runs():
+    """List training runs, newest first"""
+    return jsonify({"runs": TRAINING_RUNS.list()})
+
+@app.route('/api/training/runs/<run_id>')
+def training_run_status(run_id):
+    """Status and live metrics of a training run
+
+    ?after=<seq> returns the buffered metrics records after that number. With
+    Accept: text/event-stream (or ?stream=1) metrics are streamed as SSE
+    "metrics" events until a final "done" event with the run's status.
+    """
+    after = request.args.get('after', type=int)
+    if wants_event_stream(request.args):
+        if TRAINING_RUNS.get(run_id) is None:
+            return jsonify({"error": f"Unknown run: {run_id}"}), 404
+
+        def events():
+            for event, payload in TRAINING_RUNS.follow(run_id, after or 0):
+                # Comment lines keep idle connections open through proxies
+                yield ": keep-alive\n\n" if event == "heartbeat" else sse_event(event, payload)
+        return sse_response(events())
+
+    run = TRAINING_RUNS.get(run_id, after)
+    if run is None:
+        return jsonify({"error": f"Unknown run: {run_id}"}), 404
+    return jsonify(run)
+
+@app.route('/api/training/runs/<run_id>/cancel', methods=['POST'])
+def cancel_training_run(run_id):
+    """Stop a running training run"""
+    run = TRAINING_RUNS.cancel(run_id)
+    if run is None:
+        return jsonify({"error": f"Unknown run: {run_id}"}), 404
+    return jsonify(run)
+
 @app.route('/api/training/qa', methods=['POST'])
 def handle_qa_training():
     """Handle Q&A training where user can clarify answers, ask doubts, etc."""
     try:
         data = request.json
-        user_input = data.get('input', '')
+        user_input = normalize_query(data.get('input', ''))
         action = data.get('action', 'normal')  # 'clarify', 'doubt', 'show_me', 'normal'
+        if not isinstance(user_input, str):
+            return jsonify({"error": "input must be a string"}), 400
+
+        # clarify/doubt/show_me depend only on the input; a normal query also on the model answering it
+        model = served_model_key() if action not in ('clarify', 'doubt', 'show_me') else ()
+        key = cache_key("training_qa", action, *model, user_input)
+        cached = RESPONSE_CACHE.get(key)
+        if cached is not None:
+            response = jsonify(cached)
+            response.headers["X-Cache"] = "HIT"
+            return response
 
         response = ""
         if action == 'clarify':
@@ -378,17 +982,21 @@ def handle_qa_training():
             result = process_with_agi_research_model(user_input, "")
             response = result["response"]
 
-        return jsonify({
+        result = {
             "status": "success",
             "response": response,
             "action": action
-        })
+        }
+        RESPONSE_CACHE.set(key, result)
+        response = jsonify(result)
+        response.headers["X-Cache"] = "MISS"
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tensor/quantize', methods=['POST'])
 def tensor_quantize():
-    """Apply tensor quantization using x8D algorithm"""
+    """Queue a tensor quantization job using the x8D algorithm"""
     try:
         data = request.json
         input_file = data.get('input_file', '')
@@ -397,31 +1005,62 @@ def tensor_quantize():
         if not input_file or not output_file:
             return jsonify({"error": "Input and output file paths are required"}), 400
 
-        # Apply the x8D tensor mapping and quantization
-        try:
-            # Read the input file as binary
-            with open(input_file, 'rb') as f:
-                file_data = f.read()
+        if not os.path.isfile(input_file):
+            return jsonify({"error": f"Input file not found: {input_file}"}), 400
 
-            # Apply statefold to the data
-            processed_data = statefold(file_data)
+        try:
+            chunk_size = positive_int(data.get('chunk_size', DEFAULT_CHUNK_SIZE), "chunk_size", MAX_CHUNK_SIZE)
+            # More processes than cores only adds contention
+            workers = min(positive_int(data.get('workers', 1), "workers"), os.cpu_count() or 1)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # GGUF inputs: optional tensor name patterns / ggml types to process (default: all tensors)
+        tensors = data.get('tensors')
+        tensor_types = data.get('tensor_types')
 
-            # Write the output file
-            with open(output_file, 'wb') as f:
-                f.write(processed_data)
+        # The x8D statefold runs in the background; poll /api/tensor/jobs/<job_id>
+        try:
+            job = TENSOR_JOBS.submit(
+                input_file, output_file, chunk_size=chunk_size, workers=workers,
+                tensors=tensors, tensor_types=tensor_types
+            )
+        except GGUFError as e:
+            return jsonify({"error": str(e)}), 400
 
-            return jsonify({
-                "status": "success",
-                "message": f"Tensor quantization completed using x8D algorithm. File saved as {output_file}",
-                "output_file": output_file
-            })
-        except Exception as e:
-            return jsonify({"error": f"Tensor quantization failed: {str(e)}"}), 500
+        return jsonify({
+            "status": "queued",
+            "message": f"Tensor quantization queued using x8D algorithm. Output will be saved as {output_file}",
+            "job_id": job["job_id"],
+            "job": job
+        }), 202
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/tensor/jobs')
+def list_tensor_jobs():
+    """List tensor quantization jobs"""
+    return jsonify({"jobs": TENSOR_JOBS.list()})
+
+@app.route('/api/tensor/jobs/<job_id>')
+def tensor_job_status(job_id):
+    """Report state, progress, throughput, ETA and checksum of a quantization job"""
+    job = TENSOR_JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job)
+
+@app.route('/api/tensor/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_tensor_job(job_id):
+    """Cancel a queued or running quantization job"""
+    job = TENSOR_JOBS.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job)
+
 if __name__ == '__main__':
+    # INFO, JSON on stderr with sampled request timings (BAPX_LOG_* environment overrides)
+    configure_logging()
     print("Starting bapX AGI Research Coordinator...")
     print("Base AGI research model configured:", list(CONFIG["models"].keys()))
     print("Ready for private company AGI research at http://localhost:5000")
@@ -429,4 +1068,12 @@ if __name__ == '__main__':
     print("API endpoints available for model loading, training parameter updates, and LoRA training")
     print("Tensor mapping and quantization using x8D algorithms")
     print("BapX Media Hub - Private Company AGI Research Project")
+    if CONFIG["model_manager"]["warm_up"] and CONFIG["models"]["bapX"]["path"]:
+        # Load in the background so the server starts answering right away
+        threading.Thread(
+            target=MODEL_MANAGER.warm_up,
+            args=([bapx_model_spec()], CONFIG["model_manager"]["warm_up_prompt"]),
+            name="bapx-warm-up",
+            daemon=True
+        ).start()
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,246 @@
+"""
+bapX Training Dataset Cache
+Pre-tokenized, memory-mapped training data built from data/*.json corpora.
+
+prepare_dataset() streams every corpus (a JSON file with a "conversations"
+list, a JSON list, or JSON Lines for large corpora), formats each sample
+with the instruction template, tokenizes chunks of samples in a process
+pool and appends the token ids to one flat file. The cache directory is
+keyed by a hash of the tokenizer, template, max_length and the source
+files (path, size, mtime), so any change rebuilds it and anything else
+reuses it: later runs only mmap tokens.bin and offsets.npy, which takes
+milliseconds however many samples there are.
+
+Cache layout (<cache_dir>/<key>/):
+    tokens.bin    token ids of all samples back to back (uint16 or uint32)
+    offsets.npy   int64 start of each sample in tokens.bin, plus the end
+    meta.json     sample/token counts, dtype, tokenizer, template, sources
+
+Build one ahead of training from the project root:
+    python bapx_dataset.py --tokenizer Qwen/Qwen3-8B
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join("output", "dataset_cache")
+DEFAULT_MAX_LENGTH = 2048
+DEFAULT_CHUNK_SAMPLES = 1024
+
+# Instruction template the bapX models are trained (and prompted) with
+PROMPT_TEMPLATE = "### Instruction:\n{instruction}\n\n### Input:\n{input}\n\n### Response:\n{output}"
+PROMPT_TEMPLATE_NO_INPUT = "### Instruction:\n{instruction}\n\n### Response:\n{output}"
+TEMPLATE_VERSION = hashlib.sha256((PROMPT_TEMPLATE + "\0" + PROMPT_TEMPLATE_NO_INPUT).encode('utf-8')).hexdigest()[:16]
+
+
+def format_sample(item):
+    """Training text for one {instruction, input, output} sample"""
+    if item.get("input"):
+        return PROMPT_TEMPLATE.format(instruction=item["instruction"], input=item["input"], output=item["output"])
+    return PROMPT_TEMPLATE_NO_INPUT.format(instruction=item["instruction"], output=item["output"])
+
+
+def iter_samples(paths):
+    """Samples of every corpus, in order; JSON Lines files are streamed line by line"""
+    for path in paths:
+        if path.endswith((".jsonl", ".ndjson")):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            yield from data["conversations"] if isinstance(data, dict) else data
+
+
+def corpus_paths(config_path="configs/bapx_config.yaml"):
+    """Corpora named by training_data_path and additional_training_data in the bapX config"""
+    import yaml
+
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    return [config["training_data_path"]] + list(config.get("additional_training_data") or [])
+
+
+def load_tokenizer(name):
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(name)
+
+
+def tokenizer_fingerprint(tokenizer):
+    """Hash of what determines a tokenizer's output"""
+    digest = hashlib.sha256()
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        digest.update(backend.to_str().encode('utf-8'))
+    else:
+        digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode('utf-8'))
+    digest.update(json.dumps([type(tokenizer).__name__, tokenizer.eos_token_id, tokenizer.bos_token_id,
+                              len(tokenizer)]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_key(tokenizer, paths, max_length):
+    digest = hashlib.sha256()
+    digest.update(tokenizer_fingerprint(tokenizer).encode('utf-8'))
+    digest.update(TEMPLATE_VERSION.encode('utf-8'))
+    digest.update(str(max_length).encode('utf-8'))
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+_worker_tokenizer = None
+
+
+def _init_worker(tokenizer_name):
+    """Process pool initializer: one tokenizer per worker process"""
+    global _worker_tokenizer
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_tokenizer = load_tokenizer(tokenizer_name)
+
+
+def _tokenize_chunk(texts, max_length, dtype, tokenizer=None):
+    """(token ids back to back, per-sample lengths) for a chunk of texts, each ending in EOS"""
+    tokenizer = tokenizer or _worker_tokenizer
+    ids = tokenizer(texts, truncation=True, max_length=max_length - 1)["input_ids"]
+    eos = tokenizer.eos_token_id
+    lengths = np.fromiter((len(sample) + 1 for sample in ids), dtype=np.int64, count=len(ids))
+    tokens = np.fromiter((token for sample in ids for token in (*sample, eos)), dtype=dtype, count=int(lengths.sum()))
+    return tokens, lengths
+
+
+def _chunks(paths, size):
+    chunk = []
+    for item in iter_samples(paths):
+        chunk.append(format_sample(item))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class TokenizedDataset:
+    """Memory-mapped pre-tokenized samples; items are {"input_ids": [...]} for a Trainer"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), 'r') as f:
+            self.meta = json.load(f)
+        self.tokens = np.memmap(os.path.join(directory, "tokens.bin"), dtype=self.meta["dtype"], mode='r',
+                                shape=(self.meta["tokens"],)) if self.meta["tokens"] else np.zeros(0, self.meta["dtype"])
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def token_ids(self, index):
+        """Token ids of one sample as a read-only array view"""
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return {"input_ids": self.token_ids(index).tolist()}
+
+
+def prepare_dataset(paths, tokenizer_name, cache_dir=DEFAULT_CACHE_DIR, max_length=DEFAULT_MAX_LENGTH,
+                    workers=None, chunk_samples=DEFAULT_CHUNK_SAMPLES, tokenizer=None):
+    """The cached TokenizedDataset for these corpora, building it first if needed
+
+    tokenizer (optional) is an already loaded tokenizer for tokenizer_name.
+    """
+    tokenizer = tokenizer or load_tokenizer(tokenizer_name)
+    key = cache_key(tokenizer, paths, max_length)
+    directory = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        return TokenizedDataset(directory)
+
+    start = time.perf_counter()
+    dtype = "uint16" if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else "uint32"
+    building = f"{directory}.building-{os.getpid()}"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    lengths = []
+    with open(os.path.join(building, "tokens.bin"), 'wb') as out:
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            for chunk in _chunks(paths, chunk_samples):
+                tokens, chunk_lengths = _tokenize_chunk(chunk, max_length, dtype, tokenizer)
+                out.write(tokens.tobytes())
+                lengths.append(chunk_lengths)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(tokenizer_name,)) as pool:
+                # A bounded window of chunks in flight keeps memory flat; results are written in order
+                pending = deque()
+                for chunk in _chunks(paths, chunk_samples):
+                    pending.append(pool.submit(_tokenize_chunk, chunk, max_length, dtype))
+                    if len(pending) >= workers * 4:
+                        tokens, chunk_lengths = pending.popleft().result()
+                        out.write(tokens.tobytes())
+                        lengths.append(chunk_lengths)
+                while pending:
+                    tokens, chunk_lengths = pending.popleft().result()
+                    out.write(tokens.tobytes())
+                    lengths.append(chunk_lengths)
+
+    offsets = np.zeros(sum(len(chunk) for chunk in lengths) + 1, dtype=np.int64)
+    if lengths:
+        np.cumsum(np.concatenate(lengths), out=offsets[1:])
+    np.save(os.path.join(building, "offsets.npy"), offsets)
+    with open(os.path.join(building, "meta.json"), 'w') as f:
+        json.dump({
+            "samples": len(offsets) - 1,
+            "tokens": int(offsets[-1]),
+            "dtype": dtype,
+            "tokenizer": tokenizer_name,
+            "tokenizer_fingerprint": tokenizer_fingerprint(tokenizer),
+            "template": TEMPLATE_VERSION,
+            "max_length": max_length,
+            "sources": [os.path.abspath(path) for path in paths],
+            "build_seconds": round(time.perf_counter() - start, 3)
+        }, f, indent=2)
+    # Publish the finished cache atomically; a concurrent build of the same key may have won
+    try:
+        os.rename(building, directory)
+    except OSError:
+        shutil.rmtree(building, ignore_errors=True)
+    return TokenizedDataset(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the bapX pre-tokenized training dataset cache")
+    parser.add_argument("corpora", nargs="*", help="Corpus files (default: the corpora in --config)")
+    parser.add_argument("--tokenizer", required=True, help="Hugging Face id or local path of the base model")
+    parser.add_argument("--config", default="configs/bapx_config.yaml")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--max-length", type=int, default=DEFAULT_MAX_LENGTH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dataset = prepare_dataset(args.corpora or corpus_paths(args.config), args.tokenizer, args.cache_dir,
+                              args.max_length, args.workers)
+    print(json.dumps({"directory": dataset.directory, **dataset.meta,
+                      "seconds": round(time.perf_counter() - start, 3)}))
+
+
+if __name__ == "__main__":
+    main()
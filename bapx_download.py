@@ -0,0 +1,388 @@
+"""
+bapX Artifact Downloader
+Concurrent, resumable model downloads into a content-addressed cache.
+
+ArtifactCache.fetch(url, sha256) downloads a file with parallel HTTP range
+requests: worker threads fetch fixed-size parts ahead (at most 2 x workers
+parts are held in memory), write them in place with pwrite and record them
+in a state file next to the partial download. The calling thread feeds the
+parts to SHA-256 in order as they arrive, so the checksum is ready when the
+last byte is, without reading the file again. An interrupted download
+resumes from its state file: parts already on disk are re-hashed from disk
+once, and only the missing ones are fetched. Servers without range support
+are read in one stream (and start over if interrupted).
+
+Finished files are stored by checksum, as <cache_dir>/sha256/<hex>/<name>,
+so the same content downloaded from two URLs is kept once; a small ref file
+per URL maps it to its checksum. Concurrent fetches of the same URL share
+one download. Only uses the standard library.
+
+    python bapx_download.py URL [--sha256 HEX]
+    python bapx_download.py --config configs/bapx_config.yaml --models-dir models
+
+The second form fetches every GGUF download_url in model_mappings and links
+it into the models directory under its target_name.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+
+from bapx_logging import get_logger
+
+DEFAULT_WORKERS = 4
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+READ_SIZE = 1024 * 1024
+USER_AGENT = "bapX-downloader/1.0"
+
+logger = get_logger("download")
+
+
+class DownloadError(Exception):
+    """A download failed"""
+
+
+class ChecksumMismatch(DownloadError):
+    """Downloaded content does not match the expected SHA-256"""
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _file_name(url):
+    return os.path.basename(unquote(urlparse(url).path)) or "artifact"
+
+
+def _write_json(path, value):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(value, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class _Progress:
+    """Live counters of one download (bytes_done is approximate while parts are in flight)"""
+
+    __slots__ = ("url", "bytes_total", "bytes_done", "resumed_bytes", "started")
+
+    def __init__(self, url):
+        self.url = url
+        self.bytes_total = None
+        self.bytes_done = 0
+        self.resumed_bytes = 0
+        self.started = time.perf_counter()
+
+    def to_dict(self):
+        elapsed = time.perf_counter() - self.started
+        fetched = self.bytes_done - self.resumed_bytes
+        return {
+            "url": self.url,
+            "bytes_total": self.bytes_total,
+            "bytes_done": self.bytes_done,
+            "mb_per_second": round(fetched / elapsed / 1e6, 2) if elapsed > 0 else None
+        }
+
+
+class ArtifactCache:
+    """Content-addressed download cache with parallel, resumable, verified fetches"""
+
+    def __init__(self, cache_dir, workers=DEFAULT_WORKERS, part_size=DEFAULT_PART_SIZE,
+                 timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.part_size = part_size
+        self.timeout = timeout
+        self.retries = retries
+        for sub in ("sha256", "refs", "partial"):
+            os.makedirs(os.path.join(cache_dir, sub), exist_ok=True)
+        self._lock = threading.Lock()
+        # url -> Future of the download in progress
+        self._inflight = {}
+        self._progress = {}
+        self.recent = deque(maxlen=100)
+
+    def blob_path(self, sha256, name):
+        return os.path.join(self.cache_dir, "sha256", sha256, name)
+
+    def lookup(self, url, sha256=None):
+        """Cached path for url (and checksum, if given), or None"""
+        if sha256:
+            directory = os.path.join(self.cache_dir, "sha256", sha256.lower())
+            if os.path.isdir(directory):
+                names = os.listdir(directory)
+                if names:
+                    return os.path.join(directory, _file_name(url) if _file_name(url) in names else names[0])
+            return None
+        ref = _read_json(os.path.join(self.cache_dir, "refs", _url_key(url)))
+        if ref and os.path.exists(self.blob_path(ref["sha256"], ref["name"])):
+            return self.blob_path(ref["sha256"], ref["name"])
+        return None
+
+    def fetch(self, url, sha256=None):
+        """Download url into the cache (or find it there) and return a result dict
+
+        Raises ChecksumMismatch if sha256 is given and the content differs.
+        Concurrent calls for the same url wait for one shared download.
+        """
+        cached = self.lookup(url, sha256)
+        if cached is not None:
+            return self._result(url, cached, sha256 or self._ref_sha256(url), cached=True)
+
+        with self._lock:
+            future = self._inflight.get(url)
+            owner = future is None
+            if owner:
+                future = self._inflight[url] = Future()
+                progress = self._progress[url] = _Progress(url)
+        if not owner:
+            result = future.result()
+            if sha256 and result["sha256"] != sha256.lower():
+                raise ChecksumMismatch(f"{url}: expected {sha256}, got {result['sha256']}")
+            return result
+
+        try:
+            result = self._download(url, sha256.lower() if sha256 else None, progress)
+        except BaseException as e:
+            logger.warning("Download of %s failed: %s", url, e)
+            future.set_exception(e)
+            self.recent.append({"url": url, "error": str(e)})
+            raise
+        else:
+            future.set_result(result)
+            self.recent.append(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[url]
+                del self._progress[url]
+
+    def downloads(self):
+        """Progress of downloads in flight and results of recent ones"""
+        with self._lock:
+            active = [progress.to_dict() for progress in self._progress.values()]
+        return {"active": active, "recent": list(self.recent)}
+
+    def _ref_sha256(self, url):
+        ref = _read_json(os.path.join(self.cache_dir, "refs", _url_key(url)))
+        return ref["sha256"] if ref else None
+
+    def _result(self, url, path, sha256, cached=False, progress=None, seconds=0.0):
+        size = os.path.getsize(path)
+        fetched = size - progress.resumed_bytes if progress else 0
+        return {
+            "url": url,
+            "path": path,
+            "sha256": sha256,
+            "bytes": size,
+            "downloaded_bytes": fetched,
+            "resumed_bytes": progress.resumed_bytes if progress else 0,
+            "seconds": round(seconds, 3),
+            "mb_per_second": round(fetched / seconds / 1e6, 2) if seconds > 0 else None,
+            "cached": cached
+        }
+
+    def _download(self, url, expected, progress):
+        start = time.perf_counter()
+        key = _url_key(url)
+        part_path = os.path.join(self.cache_dir, "partial", f"{key}.part")
+        state_path = os.path.join(self.cache_dir, "partial", f"{key}.json")
+
+        source, size, validator = self._probe(url)
+        progress.bytes_total = size
+        if size is None:
+            digest = self._download_stream(url, part_path, progress)
+        else:
+            digest = self._download_ranges(source, size, validator, part_path, state_path, progress)
+
+        sha256 = digest.hexdigest()
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        if expected and sha256 != expected:
+            os.remove(part_path)
+            raise ChecksumMismatch(f"{url}: expected {expected}, got {sha256}")
+
+        name = _file_name(url)
+        path = self.blob_path(sha256, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(part_path, path)
+        _write_json(os.path.join(self.cache_dir, "refs", key), {"url": url, "sha256": sha256, "name": name})
+        result = self._result(url, path, sha256, progress=progress, seconds=time.perf_counter() - start)
+        logger.info("Downloaded %s (%d bytes, %s MB/s)", url, result["bytes"], result["mb_per_second"],
+                    extra={"fields": {"sha256": sha256, "resumed_bytes": result["resumed_bytes"]}})
+        return result
+
+    def _open(self, url, byte_range=None):
+        headers = {"User-Agent": USER_AGENT}
+        if byte_range is not None:
+            headers["Range"] = "bytes=%d-%d" % byte_range
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout)
+
+    def _probe(self, url):
+        """(final url, size, validator) if the server serves byte ranges, else (url, None, None)"""
+        with self._open(url, (0, 0)) as response:
+            content_range = response.headers.get("Content-Range", "")
+            if response.status != 206 or "/" not in content_range or content_range.endswith("/*"):
+                return url, None, None
+            size = int(content_range.rsplit("/", 1)[1])
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+            # Parts go straight to the redirect target
+            return response.geturl(), size, validator
+
+    def _download_stream(self, url, part_path, progress):
+        """Single-stream download for servers without range support"""
+        digest = hashlib.sha256()
+        with self._open(url) as response, open(part_path, 'wb') as f:
+            length = response.headers.get("Content-Length")
+            progress.bytes_total = int(length) if length else None
+            for block in iter(lambda: response.read(READ_SIZE), b""):
+                f.write(block)
+                digest.update(block)
+                progress.bytes_done += len(block)
+        return digest
+
+    def _download_ranges(self, url, size, validator, part_path, state_path, progress):
+        """Fetch parts in parallel, hashing them in order as they complete"""
+        part_size = self.part_size
+        state = _read_json(state_path)
+        if (state and state.get("size") == size and state.get("part_size") == part_size
+                and state.get("validator") == validator and os.path.exists(part_path)):
+            done = set(state["done"])
+        else:
+            done = set()
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+        state = {"size": size, "part_size": part_size, "validator": validator, "done": sorted(done)}
+        _write_json(state_path, state)
+        state_lock = threading.Lock()
+
+        parts = -(-size // part_size)
+        progress.resumed_bytes = progress.bytes_done = sum(
+            min(part_size, size - index * part_size) for index in done)
+        if done:
+            logger.info("Resuming %s: %d of %d parts on disk", url, len(done), parts)
+
+        digest = hashlib.sha256()
+        with open(part_path, 'r+b') as f, ThreadPoolExecutor(self.workers, thread_name_prefix="bapx-download") as pool:
+            fd = f.fileno()
+
+            def fetch_part(index):
+                offset = index * part_size
+                data = self._get_range(url, offset, min(offset + part_size, size) - 1, progress)
+                os.pwrite(fd, data, offset)
+                with state_lock:
+                    state["done"].append(index)
+                    _write_json(state_path, state)
+                return data
+
+            futures = {}
+            window = self.workers * 2
+            submitted = 0
+            try:
+                for index in range(parts):
+                    # Keep workers busy up to `window` parts ahead of the hash
+                    while submitted < parts and submitted < index + window:
+                        if submitted not in done:
+                            futures[submitted] = pool.submit(fetch_part, submitted)
+                        submitted += 1
+                    future = futures.pop(index, None)
+                    if future is not None:
+                        digest.update(future.result())
+                    else:
+                        offset = index * part_size
+                        digest.update(os.pread(fd, min(part_size, size - offset), offset))
+            except BaseException:
+                for future in futures.values():
+                    future.cancel()
+                raise
+        return digest
+
+    def _get_range(self, url, first, last, progress):
+        """Bytes first..last (inclusive) of url, retried with backoff"""
+        expected = last - first + 1
+        for attempt in range(self.retries + 1):
+            received = 0
+            try:
+                with self._open(url, (first, last)) as response:
+                    if response.status != 206:
+                        raise DownloadError(f"{url}: server ignored the range request (HTTP {response.status})")
+                    data = bytearray()
+                    for block in iter(lambda: response.read(READ_SIZE), b""):
+                        data += block
+                        received += len(block)
+                        progress.bytes_done += len(block)
+                if len(data) != expected:
+                    raise DownloadError(f"{url}: got {len(data)} of {expected} bytes at offset {first}")
+                return bytes(data)
+            except (OSError, urllib.error.URLError, DownloadError) as e:
+                progress.bytes_done -= received
+                if attempt == self.retries:
+                    raise DownloadError(f"{url}: bytes {first}-{last} failed: {e}") from e
+                time.sleep(0.5 * 2 ** attempt)
+
+
+def link_into(path, target):
+    """Make target a hard link to a cached file (a copy across filesystems)"""
+    if os.path.exists(target):
+        if os.path.samefile(path, target):
+            return
+        os.remove(target)
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bapX model artifact downloader")
+    parser.add_argument("urls", nargs="*", help="URLs to download")
+    parser.add_argument("--sha256", help="Expected checksum (single URL)")
+    parser.add_argument("--config", help="Download the GGUF model_mappings of this bapX config")
+    parser.add_argument("--models-dir", default="models", help="Where --config links each target_name")
+    parser.add_argument("--cache-dir", default=os.path.join("models", "cache"))
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--part-size", type=int, default=DEFAULT_PART_SIZE)
+    args = parser.parse_args()
+
+    jobs = [(url, args.sha256 if len(args.urls) == 1 else None, None) for url in args.urls]
+    if args.config:
+        import yaml
+
+        with open(args.config, 'r') as f:
+            mappings = yaml.safe_load(f).get("model_mappings", [])
+        # Directory-format sources (e.g. a transformers repo page) are not single files
+        jobs += [(mapping["download_url"], mapping.get("sha256"), mapping["target_name"])
+                 for mapping in mappings if str(mapping.get("source_file", "")).endswith(".gguf")]
+    if not jobs:
+        parser.error("give one or more URLs or --config")
+
+    cache = ArtifactCache(args.cache_dir, workers=args.workers, part_size=args.part_size)
+    for url, sha256, target_name in jobs:
+        result = cache.fetch(url, sha256)
+        if target_name:
+            os.makedirs(args.models_dir, exist_ok=True)
+            result["linked_as"] = os.path.join(args.models_dir, target_name)
+            link_into(result["path"], result["linked_as"])
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+"""
+bapX Merge and Export
+Merges a trained LoRA adapter into its base model and exports the result.
+
+merge_adapter() streams the base checkpoint tensor by tensor: tensors the
+adapter does not touch are copied straight from the memory-mapped source
+shards, the ones it does get W + scaling * B @ A (computed in float32, stored
+in the base dtype), and the output shards are written as they go, so memory
+holds one tensor at a time rather than a second copy of the model. The
+result is a regular transformers checkpoint (sharded safetensors with an
+index, plus the base config and tokenizer files) that loads without PEFT,
+so inference no longer pays for the LoRA wrappers on every layer.
+
+export_gguf() converts such a checkpoint to a GGUF file with every 2-D
+weight whose rows are a multiple of 32 in Q8_0 (blocks of 32 int8 values
+with an fp16 scale, as llama.cpp lays them out), quantized with NumPy, and
+everything else in F32. Tensors keep their transformers names and the
+architecture is recorded in the metadata; bapx_gguf reads the file back.
+The file has neither llama.cpp's tensor names nor tokenizer.ggml.* metadata,
+so llama.cpp cannot serve it, and it is never written into models/ as a
+model_mappings target.
+
+parity_check() compares the merged checkpoint with the PEFT-wrapped model
+(logits, greedy tokens and time per generated token); use it on a small
+model, as it loads both.
+
+    python bapx_export.py --adapter output/bapx_model/bapx_trained \\
+        --output output/bapx_merged --gguf output/bapx_merged.gguf --check
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import struct
+import time
+
+import numpy as np
+
+from bapx_gguf import GGUF_DEFAULT_ALIGNMENT, GGUF_MAGIC, GGUF_STRING, GGUF_UINT32, GGUF_FLOAT32, GGUF_SCALAR_FORMATS
+from bapx_quantize import DEFAULT_CHUNK_SIZE, peak_rss_bytes
+
+DEFAULT_MAX_SHARD_SIZE = 5 * 1000 ** 3
+Q8_0_BLOCK = 32
+# ggml type ids and the GGUF file type of a mostly-Q8_0 model
+GGML_F32, GGML_Q8_0 = 0, 8
+GGUF_FILE_TYPE_Q8_0 = 7
+# Elements (whole rows) converted and quantized at a time
+QUANTIZE_CHUNK_ELEMENTS = 16 * 1024 * 1024
+SIZE_UNITS = {"": 1, "B": 1, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4,
+              "KIB": 1024, "MIB": 1024 ** 2, "GIB": 1024 ** 3, "TIB": 1024 ** 4}
+
+# safetensors dtype -> NumPy dtype (BF16 is read as raw uint16 bits)
+SAFETENSORS_DTYPES = {
+    "F64": np.float64, "F32": np.float32, "F16": np.float16, "BF16": np.uint16,
+    "I64": np.int64, "I32": np.int32, "I16": np.int16, "I8": np.int8, "U8": np.uint8, "BOOL": np.bool_
+}
+FLOAT_DTYPES = ("F64", "F32", "F16", "BF16")
+
+# Files of the base model directory that are not weights, copied next to the merged shards
+WEIGHT_FILE = re.compile(r".*\.(safetensors|bin|pt|pth|ckpt|h5|msgpack|gguf)$|.*\.safetensors\.index\.json$")
+
+# Adapter tensor key -> (base module, A or B); PEFT saves without the adapter name
+LORA_KEY = re.compile(r"^base_model\.model\.(?P<module>.+)\.lora_(?:embedding_)?(?P<part>[AB])(?:\.weight)?$")
+
+
+def parse_size(size):
+    """Bytes in a size like 5GB, 500MB or 1024"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([A-Za-z]*)\s*", str(size))
+    if not match or match.group(2).upper() not in SIZE_UNITS:
+        raise ValueError(f"Invalid size: {size}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def bf16_to_float32(bits):
+    return (bits.astype(np.uint32) << 16).view(np.float32)
+
+
+def float32_to_bf16(values):
+    """Round float32 values to bfloat16 bits (nearest, ties to even)"""
+    bits = np.ascontiguousarray(values, dtype=np.float32).view(np.uint32)
+    return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+
+
+def to_float32(array, dtype):
+    return bf16_to_float32(array) if dtype == "BF16" else array.astype(np.float32)
+
+
+def from_float32(values, dtype):
+    return float32_to_bf16(values) if dtype == "BF16" else values.astype(SAFETENSORS_DTYPES[dtype])
+
+
+class SafetensorsFile:
+    """Header of a safetensors file, with tensors read as memory-mapped arrays"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header_size = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(header_size))
+        self.metadata = header.pop("__metadata__", {})
+        self.data_offset = 8 + header_size
+        # name -> {"dtype", "shape", "data_offsets": [start, end]}
+        self.tensors = header
+        self._map = None
+
+    def nbytes(self, name):
+        start, end = self.tensors[name]["data_offsets"]
+        return end - start
+
+    def read(self, name):
+        """The tensor as a read-only array view of the file (BF16 as uint16 bits)"""
+        info = self.tensors[name]
+        if self._map is None:
+            self._map = np.memmap(self.path, dtype=np.uint8, mode='r')
+        start, end = info["data_offsets"]
+        raw = self._map[self.data_offset + start:self.data_offset + end]
+        return raw.view(SAFETENSORS_DTYPES[info["dtype"]]).reshape(info["shape"])
+
+    def close(self):
+        self._map = None
+
+
+def checkpoint_files(model_dir):
+    """SafetensorsFile of every shard of a transformers checkpoint, in shard order"""
+    index = os.path.join(model_dir, "model.safetensors.index.json")
+    if os.path.exists(index):
+        with open(index, 'r') as f:
+            names = sorted(set(json.load(f)["weight_map"].values()))
+    elif os.path.exists(os.path.join(model_dir, "model.safetensors")):
+        names = ["model.safetensors"]
+    else:
+        raise FileNotFoundError(f"No safetensors checkpoint in {model_dir} (pytorch .bin checkpoints are not supported)")
+    return [SafetensorsFile(os.path.join(model_dir, name)) for name in names]
+
+
+def resolve_model_dir(name_or_path):
+    """Local directory of a model: the path itself, or a Hugging Face snapshot of its config, tokenizer and weights"""
+    if os.path.isdir(name_or_path):
+        return name_or_path
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(name_or_path, allow_patterns=["*.json", "*.safetensors", "*.model", "*.txt", "*.tiktoken"])
+
+
+class LoraAdapter:
+    """LoRA weights of a saved PEFT adapter, as per-module weight deltas"""
+
+    def __init__(self, adapter_dir):
+        self.adapter_dir = adapter_dir
+        with open(os.path.join(adapter_dir, "adapter_config.json"), 'r') as f:
+            self.config = json.load(f)
+        if self.config.get("peft_type", "LORA") != "LORA":
+            raise ValueError(f"{adapter_dir} is a {self.config['peft_type']} adapter, not LoRA")
+        if self.config.get("use_dora"):
+            raise ValueError("DoRA adapters are not supported")
+        weights = os.path.join(adapter_dir, "adapter_model.safetensors")
+        if not os.path.exists(weights):
+            raise FileNotFoundError(f"No adapter_model.safetensors in {adapter_dir}")
+        self.file = SafetensorsFile(weights)
+        # base tensor name -> {"A": key, "B": key}
+        self.modules = {}
+        for key in self.file.tensors:
+            match = LORA_KEY.match(key)
+            if match is None:
+                raise ValueError(f"Adapter tensor {key} cannot be merged (only LoRA A/B weights are supported)")
+            self.modules.setdefault(f"{match.group('module')}.weight", {})[match.group("part")] = key
+        for name, parts in self.modules.items():
+            if set(parts) != {"A", "B"}:
+                raise ValueError(f"Adapter has an incomplete LoRA pair for {name}")
+
+    @property
+    def base_model(self):
+        return self.config.get("base_model_name_or_path")
+
+    def scaling(self, name, rank):
+        """lora_alpha / r (or / sqrt(r) with rsLoRA), honouring per-module alpha patterns"""
+        module = name[:-len(".weight")]
+        alpha = self.config.get("lora_alpha", 8)
+        for pattern, value in (self.config.get("alpha_pattern") or {}).items():
+            if re.fullmatch(rf"(.*\.)?{pattern}", module):
+                alpha = value
+                break
+        return alpha / (rank ** 0.5 if self.config.get("use_rslora") else rank)
+
+    def delta(self, name, shape):
+        """Float32 weight delta (scaling * B @ A) for a base tensor, or None if the adapter does not touch it"""
+        parts = self.modules.get(name)
+        if parts is None:
+            return None
+        a = to_float32(self.file.read(parts["A"]), self.file.tensors[parts["A"]]["dtype"])
+        b = to_float32(self.file.read(parts["B"]), self.file.tensors[parts["B"]]["dtype"])
+        if "lora_embedding_A" in parts["A"]:
+            # Embedding LoRA: A is (r, vocab), B is (dim, r)
+            delta = (b @ a).T
+            rank = a.shape[0]
+        else:
+            delta = b @ a
+            rank = a.shape[0]
+            if self.config.get("fan_in_fan_out"):
+                delta = delta.T
+        delta *= self.scaling(name, rank)
+        if tuple(delta.shape) != tuple(shape):
+            raise ValueError(f"Adapter delta for {name} has shape {delta.shape}, base tensor is {tuple(shape)}")
+        return delta
+
+
+def plan_shards(entries, max_shard_bytes):
+    """Split (name, nbytes) entries into consecutive shards of at most max_shard_bytes (one tensor at least)"""
+    shards = [[]]
+    size = 0
+    for name, nbytes in entries:
+        if shards[-1] and size + nbytes > max_shard_bytes:
+            shards.append([])
+            size = 0
+        shards[-1].append(name)
+        size += nbytes
+    return shards
+
+
+def _write_chunks(out, array, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write an array's bytes in chunks (a memory-mapped source is never copied whole)"""
+    data = memoryview(np.ascontiguousarray(array).reshape(-1).view(np.uint8))
+    for start in range(0, len(data), chunk_size):
+        out.write(data[start:start + chunk_size])
+
+
+def merge_adapter(base_dir, adapter_dir, output_dir, max_shard_size=DEFAULT_MAX_SHARD_SIZE):
+    """Write base + LoRA adapter as a sharded safetensors checkpoint in output_dir; returns stats"""
+    start = time.perf_counter()
+    adapter = LoraAdapter(adapter_dir)
+    files = checkpoint_files(base_dir)
+    # name -> SafetensorsFile, in checkpoint order
+    sources = {name: source for source in files for name in source.tensors}
+    missing = set(adapter.modules) - set(sources)
+    if missing:
+        raise ValueError(f"Adapter targets tensors the base model does not have: {', '.join(sorted(missing)[:5])}")
+
+    building = f"{output_dir.rstrip(os.sep)}.building-{os.getpid()}"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    shards = plan_shards([(name, source.nbytes(name)) for name, source in sources.items()], max_shard_size)
+    weight_map = {}
+    merged = 0
+    total = 0
+    for number, names in enumerate(shards, 1):
+        filename = "model.safetensors" if len(shards) == 1 else f"model-{number:05d}-of-{len(shards):05d}.safetensors"
+        # Merging keeps every shape and dtype, so the header is known before any data is written
+        header = {"__metadata__": {"format": "pt"}}
+        offset = 0
+        for name in names:
+            info = sources[name].tensors[name]
+            nbytes = sources[name].nbytes(name)
+            header[name] = {"dtype": info["dtype"], "shape": info["shape"], "data_offsets": [offset, offset + nbytes]}
+            offset += nbytes
+        header_bytes = json.dumps(header, separators=(",", ":")).encode('utf-8')
+        header_bytes += b" " * (-len(header_bytes) % 8)
+        with open(os.path.join(building, filename), 'wb') as out:
+            out.write(struct.pack("<Q", len(header_bytes)))
+            out.write(header_bytes)
+            for name in names:
+                source = sources[name]
+                info = source.tensors[name]
+                tensor = source.read(name)
+                delta = adapter.delta(name, info["shape"])
+                if delta is not None:
+                    if info["dtype"] not in FLOAT_DTYPES:
+                        raise ValueError(f"Cannot merge into {info['dtype']} tensor {name}")
+                    delta += to_float32(tensor, info["dtype"])
+                    tensor = from_float32(delta, info["dtype"])
+                    merged += 1
+                _write_chunks(out, tensor)
+                weight_map[name] = filename
+        total += offset
+    for source in files:
+        source.close()
+
+    if len(shards) > 1:
+        with open(os.path.join(building, "model.safetensors.index.json"), 'w') as f:
+            json.dump({"metadata": {"total_size": total}, "weight_map": weight_map}, f, indent=2)
+    # Config and tokenizer of the base model; a tokenizer saved with the adapter takes precedence
+    for directory in (base_dir, adapter_dir):
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if (os.path.isfile(path) and not WEIGHT_FILE.match(filename) and not filename.startswith("adapter_")
+                    and (directory == base_dir or filename.startswith(("tokenizer", "special_tokens")))):
+                shutil.copyfile(path, os.path.join(building, filename))
+    stats = {
+        "output_dir": output_dir,
+        "base": base_dir,
+        "adapter": adapter_dir,
+        "tensors": len(sources),
+        "merged_tensors": merged,
+        "shards": len(shards),
+        "bytes": total,
+        "seconds": round(time.perf_counter() - start, 3),
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+    with open(os.path.join(building, "bapx_merge.json"), 'w') as f:
+        json.dump({**stats, "adapter_config": adapter.config}, f, indent=2)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.rename(building, output_dir)
+    return stats
+
+
+def quantize_q8_0(values):
+    """Q8_0 blocks (fp16 scale, 32 int8) of float32 values, as llama.cpp's reference quantizer makes them"""
+    blocks = values.reshape(-1, Q8_0_BLOCK)
+    scale = np.abs(blocks).max(axis=1) / 127
+    inverse = np.divide(1.0, scale, out=np.zeros_like(scale), where=scale > 0)
+    scaled = blocks * inverse[:, None]
+    # roundf: halves away from zero
+    quants = (np.sign(scaled) * np.floor(np.abs(scaled) + 0.5)).astype(np.int8)
+    out = np.empty(len(blocks), dtype=[("d", "<f2"), ("qs", "i1", Q8_0_BLOCK)])
+    out["d"] = scale
+    out["qs"] = quants
+    return out
+
+
+def dequantize_q8_0(blocks):
+    """Float32 values of Q8_0 blocks"""
+    return (blocks["qs"].astype(np.float32) * blocks["d"].astype(np.float32)[:, None]).reshape(-1)
+
+
+def gguf_tensor_type(shape):
+    """Q8_0 for 2-D weights whose rows split into whole blocks, F32 for the rest (norms, biases)"""
+    return GGML_Q8_0 if len(shape) == 2 and shape[-1] % Q8_0_BLOCK == 0 else GGML_F32
+
+
+def _gguf_string(value):
+    data = value.encode('utf-8')
+    return struct.pack("<Q", len(data)) + data
+
+
+def _gguf_kv(key, value_type, value):
+    data = _gguf_string(value) if value_type == GGUF_STRING else struct.pack(GGUF_SCALAR_FORMATS[value_type], value)
+    return _gguf_string(key) + struct.pack("<I", value_type) + data
+
+
+def gguf_metadata(config, name):
+    """GGUF metadata for a transformers config (architecture and the usual llama-style hyperparameters)"""
+    arch = config.get("model_type", "unknown")
+    metadata = [
+        ("general.architecture", GGUF_STRING, arch),
+        ("general.name", GGUF_STRING, name),
+        ("general.file_type", GGUF_UINT32, GGUF_FILE_TYPE_Q8_0),
+        ("general.quantization_version", GGUF_UINT32, 2),
+        ("general.alignment", GGUF_UINT32, GGUF_DEFAULT_ALIGNMENT)
+    ]
+    for key, source, value_type in (
+        ("context_length", "max_position_embeddings", GGUF_UINT32),
+        ("embedding_length", "hidden_size", GGUF_UINT32),
+        ("block_count", "num_hidden_layers", GGUF_UINT32),
+        ("feed_forward_length", "intermediate_size", GGUF_UINT32),
+        ("attention.head_count", "num_attention_heads", GGUF_UINT32),
+        ("attention.head_count_kv", "num_key_value_heads", GGUF_UINT32),
+        ("rope.freq_base", "rope_theta", GGUF_FLOAT32),
+        ("attention.layer_norm_rms_epsilon", "rms_norm_eps", GGUF_FLOAT32)
+    ):
+        if isinstance(config.get(source), (int, float)):
+            metadata.append((f"{arch}.{key}", value_type, config[source]))
+    return metadata
+
+
+def export_gguf(model_dir, output_file, name=None):
+    """Write the checkpoint in model_dir as a Q8_0 GGUF file; returns stats with the quantization error"""
+    start = time.perf_counter()
+    with open(os.path.join(model_dir, "config.json"), 'r') as f:
+        config = json.load(f)
+    files = checkpoint_files(model_dir)
+    tensors = [(tensor, source) for source in files for tensor in source.tensors]
+
+    infos = []
+    offset = 0
+    for tensor, source in tensors:
+        shape = source.tensors[tensor]["shape"]
+        elements = int(np.prod(shape, dtype=np.int64))
+        type_id = gguf_tensor_type(shape)
+        nbytes = elements // Q8_0_BLOCK * 34 if type_id == GGML_Q8_0 else elements * 4
+        infos.append((tensor, source, shape, type_id, offset, nbytes))
+        offset += -(-nbytes // GGUF_DEFAULT_ALIGNMENT) * GGUF_DEFAULT_ALIGNMENT
+
+    metadata = gguf_metadata(config, name or os.path.splitext(os.path.basename(output_file))[0])
+    header = bytearray(GGUF_MAGIC + struct.pack("<IQQ", 3, len(infos), len(metadata)))
+    for key, value_type, value in metadata:
+        header += _gguf_kv(key, value_type, value)
+    for tensor, _, shape, type_id, tensor_offset, _ in infos:
+        # GGUF lists dimensions innermost first
+        header += _gguf_string(tensor) + struct.pack("<I", len(shape))
+        header += b"".join(struct.pack("<Q", dim) for dim in reversed(shape))
+        header += struct.pack("<IQ", type_id, tensor_offset)
+    header += b"\0" * (-len(header) % GGUF_DEFAULT_ALIGNMENT)
+
+    squared_error = squared_norm = 0.0
+    worst = (0.0, None)
+    building = f"{output_file}.building-{os.getpid()}"
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(building, 'wb') as out:
+        out.write(header)
+        for tensor, source, shape, type_id, tensor_offset, nbytes in infos:
+            dtype = source.tensors[tensor]["dtype"]
+            values = source.read(tensor).reshape(-1)
+            tensor_error = tensor_norm = 0.0
+            # Whole rows at a time keep memory flat on large embeddings
+            row = shape[-1] if shape and shape[-1] else 1
+            step = max(QUANTIZE_CHUNK_ELEMENTS // row, 1) * row
+            for chunk_start in range(0, len(values), step):
+                chunk = to_float32(values[chunk_start:chunk_start + step], dtype)
+                if type_id == GGML_Q8_0:
+                    blocks = quantize_q8_0(chunk)
+                    error = dequantize_q8_0(blocks) - chunk
+                    tensor_error += float(np.dot(error, error))
+                    tensor_norm += float(np.dot(chunk, chunk))
+                    out.write(blocks.tobytes())
+                else:
+                    out.write(chunk.tobytes())
+            out.write(b"\0" * (-nbytes % GGUF_DEFAULT_ALIGNMENT))
+            squared_error += tensor_error
+            squared_norm += tensor_norm
+            if tensor_norm and (tensor_error / tensor_norm) ** 0.5 > worst[0]:
+                worst = ((tensor_error / tensor_norm) ** 0.5, tensor)
+    for source in files:
+        source.close()
+    os.replace(building, output_file)
+    return {
+        "output_file": output_file,
+        "tensors": len(infos),
+        "q8_0_tensors": sum(1 for info in infos if info[3] == GGML_Q8_0),
+        "bytes": os.path.getsize(output_file),
+        # Root-mean-square error of the Q8_0 weights relative to their magnitude
+        "relative_rms_error": round((squared_error / squared_norm) ** 0.5, 6) if squared_norm else 0.0,
+        "worst_tensor": {"name": worst[1], "relative_rms_error": round(worst[0], 6)},
+        "seconds": round(time.perf_counter() - start, 3),
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+
+def parity_check(base_dir, adapter_dir, merged_dir, input_ids, new_tokens=32):
+    """Logit difference, greedy-token agreement and time per token of the merged vs the PEFT-wrapped model"""
+    import torch
+    from peft import PeftModel
+    from transformers import AutoModelForCausalLM
+
+    wrapped = PeftModel.from_pretrained(
+        AutoModelForCausalLM.from_pretrained(base_dir, torch_dtype=torch.float32), adapter_dir).eval()
+    merged = AutoModelForCausalLM.from_pretrained(merged_dir, torch_dtype=torch.float32).eval()
+    ids = torch.tensor([input_ids])
+
+    def generate(model):
+        with torch.no_grad():
+            model.generate(input_ids=ids, max_new_tokens=2, do_sample=False, pad_token_id=0)  # warm-up
+            started = time.perf_counter()
+            output = model.generate(input_ids=ids, max_new_tokens=new_tokens, min_new_tokens=new_tokens,
+                                    do_sample=False, pad_token_id=0)
+            elapsed = time.perf_counter() - started
+        return output[0, ids.shape[1]:].tolist(), elapsed / new_tokens * 1000
+
+    with torch.no_grad():
+        difference = (wrapped(input_ids=ids).logits - merged(input_ids=ids).logits).abs().max().item()
+    wrapped_tokens, wrapped_ms = generate(wrapped)
+    merged_tokens, merged_ms = generate(merged)
+    return {
+        "max_logit_difference": difference,
+        "greedy_tokens_match": wrapped_tokens == merged_tokens,
+        "peft_ms_per_token": round(wrapped_ms, 3),
+        "merged_ms_per_token": round(merged_ms, 3),
+        "speedup": round(wrapped_ms / merged_ms, 2) if merged_ms else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge a bapX LoRA adapter into its base model and export it")
+    parser.add_argument("--adapter", required=True, help="Directory of the trained adapter")
+    parser.add_argument("--base", help="Base model id or directory (default: the adapter's base_model_name_or_path)")
+    parser.add_argument("--output", default="output/bapx_merged", help="Directory for the merged safetensors")
+    parser.add_argument("--max-shard-size", default="5GB")
+    parser.add_argument("--gguf", help="Also write a Q8_0 GGUF file here (transformers tensor names; not for llama.cpp)")
+    parser.add_argument("--target", help=argparse.SUPPRESS)
+    parser.add_argument("--check", action="store_true",
+                        help="Compare the merged model with the PEFT-wrapped one (loads both; small models only)")
+    parser.add_argument("--check-prompt", default="### Instruction:\nWho are you?\n\n### Response:\n")
+    args = parser.parse_args()
+    if args.target:
+        # models/<target_name> is served by llama.cpp, which cannot load this GGUF
+        parser.error("--target is not supported: the exported GGUF keeps transformers tensor names and has no "
+                     "tokenizer metadata, so llama.cpp cannot serve it; write it elsewhere with --gguf")
+
+    base = args.base or LoraAdapter(args.adapter).base_model
+    if not base:
+        parser.error("The adapter does not name its base model; pass --base")
+    base_dir = resolve_model_dir(base)
+    print(json.dumps({"merge": merge_adapter(base_dir, args.adapter, args.output, parse_size(args.max_shard_size))}))
+
+    if args.gguf:
+        print(json.dumps({"gguf": export_gguf(args.output, args.gguf)}))
+
+    if args.check:
+        from transformers import AutoTokenizer
+
+        input_ids = AutoTokenizer.from_pretrained(args.output)(args.check_prompt)["input_ids"]
+        print(json.dumps({"parity": parity_check(base_dir, args.adapter, args.output, input_ids)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+bapX GGUF Tensor Quantizer
+Reads GGUF headers and tensor info tables (zero-copy over mmap) so the x8D
+statefold is applied only to selected tensor data.
+
+The header, metadata KV section and alignment padding are copied through
+untouched with copy_file_range/sendfile, so the output stays a loadable GGUF
+file. Tensors can be selected by name (fnmatch patterns) and/or ggml type,
+e.g. only the Q8_0 blocks.
+"""
+import fnmatch
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+from bapx_quantize import (
+    DEFAULT_CHUNK_SIZE, QuantizationCancelled, align_chunk_size, peak_rss_bytes, quantize_file, run_shards
+)
+from bapx_x8d import X8D_FACTOR
+
+GGUF_MAGIC = b"GGUF"
+GGUF_DEFAULT_ALIGNMENT = 32
+
+# GGUF metadata value types
+GGUF_UINT8, GGUF_INT8, GGUF_UINT16, GGUF_INT16, GGUF_UINT32, GGUF_INT32 = range(6)
+GGUF_FLOAT32, GGUF_BOOL, GGUF_STRING, GGUF_ARRAY, GGUF_UINT64, GGUF_INT64, GGUF_FLOAT64 = range(6, 13)
+
+GGUF_SCALAR_FORMATS = {
+    GGUF_UINT8: "<B", GGUF_INT8: "<b", GGUF_UINT16: "<H", GGUF_INT16: "<h",
+    GGUF_UINT32: "<I", GGUF_INT32: "<i", GGUF_FLOAT32: "<f", GGUF_BOOL: "<?",
+    GGUF_UINT64: "<Q", GGUF_INT64: "<q", GGUF_FLOAT64: "<d"
+}
+
+# ggml tensor types: id -> (name, elements per block, bytes per block)
+GGML_TYPES = {
+    0: ("F32", 1, 4), 1: ("F16", 1, 2), 2: ("Q4_0", 32, 18), 3: ("Q4_1", 32, 20),
+    6: ("Q5_0", 32, 22), 7: ("Q5_1", 32, 24), 8: ("Q8_0", 32, 34), 9: ("Q8_1", 32, 36),
+    10: ("Q2_K", 256, 84), 11: ("Q3_K", 256, 110), 12: ("Q4_K", 256, 144), 13: ("Q5_K", 256, 176),
+    14: ("Q6_K", 256, 210), 15: ("Q8_K", 256, 292), 16: ("IQ2_XXS", 256, 66), 17: ("IQ2_XS", 256, 74),
+    18: ("IQ3_XXS", 256, 98), 19: ("IQ1_S", 256, 50), 20: ("IQ4_NL", 32, 18), 21: ("IQ3_S", 256, 110),
+    22: ("IQ2_S", 256, 82), 23: ("IQ4_XS", 256, 136), 24: ("I8", 1, 1), 25: ("I16", 1, 2),
+    26: ("I32", 1, 4), 27: ("I64", 1, 8), 28: ("F64", 1, 8), 29: ("IQ1_M", 256, 56),
+    30: ("BF16", 1, 2), 34: ("TQ1_0", 256, 54), 35: ("TQ2_0", 256, 66)
+}
+
+# Array metadata is not decoded (vocabularies hold 100k+ strings); only its location is kept
+GGUFArray = namedtuple("GGUFArray", ["item_type", "count", "offset"])
+GGUFTensor = namedtuple("GGUFTensor", ["name", "shape", "type_id", "type_name", "offset", "nbytes"])
+
+
+class GGUFError(ValueError):
+    """Raised for files that are not valid GGUF"""
+
+
+def is_gguf(path):
+    """True if the file starts with the GGUF magic"""
+    with open(path, 'rb') as f:
+        return f.read(4) == GGUF_MAGIC
+
+
+class GGUFReader:
+    """Parses a GGUF header and tensor info table directly from an mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        self.metadata = {}
+        self.tensors = []
+        with open(path, 'rb') as f:
+            self.file_size = os.fstat(f.fileno()).st_size
+            if self.file_size < 24:
+                raise GGUFError(f"{path} is too small to be a GGUF file")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                try:
+                    self._parse(buf)
+                except (struct.error, KeyError) as e:
+                    raise GGUFError(f"Malformed GGUF header in {path}: {e}") from e
+
+    def _unpack(self, buf, fmt):
+        value = struct.unpack_from(fmt, buf, self._pos)[0]
+        self._pos += struct.calcsize(fmt)
+        return value
+
+    def _read_string(self, buf):
+        length = self._unpack(buf, "<Q")
+        value = buf[self._pos:self._pos + length].decode('utf-8', errors='replace')
+        self._pos += length
+        return value
+
+    def _skip_value(self, buf, value_type):
+        if value_type == GGUF_STRING:
+            length = self._unpack(buf, "<Q")
+            self._pos += length
+        elif value_type == GGUF_ARRAY:
+            item_type = self._unpack(buf, "<I")
+            count = self._unpack(buf, "<Q")
+            self._skip_items(buf, item_type, count)
+        else:
+            self._pos += struct.calcsize(GGUF_SCALAR_FORMATS[value_type])
+
+    def _skip_items(self, buf, item_type, count):
+        if item_type in GGUF_SCALAR_FORMATS:
+            self._pos += count * struct.calcsize(GGUF_SCALAR_FORMATS[item_type])
+        else:
+            for _ in range(count):
+                self._skip_value(buf, item_type)
+
+    def _read_value(self, buf, value_type):
+        if value_type == GGUF_STRING:
+            return self._read_string(buf)
+        if value_type == GGUF_ARRAY:
+            item_type = self._unpack(buf, "<I")
+            count = self._unpack(buf, "<Q")
+            array = GGUFArray(item_type, count, self._pos)
+            self._skip_items(buf, item_type, count)
+            return array
+        if value_type not in GGUF_SCALAR_FORMATS:
+            raise GGUFError(f"Unknown GGUF metadata type {value_type} at offset {self._pos}")
+        return self._unpack(buf, GGUF_SCALAR_FORMATS[value_type])
+
+    def _parse(self, buf):
+        if buf[:4] != GGUF_MAGIC:
+            raise GGUFError(f"{self.path} is not a GGUF file")
+        self._pos = 4
+        self.version = self._unpack(buf, "<I")
+        if self.version < 2:
+            raise GGUFError(f"GGUF version {self.version} is not supported")
+        tensor_count = self._unpack(buf, "<Q")
+        kv_count = self._unpack(buf, "<Q")
+
+        for _ in range(kv_count):
+            key = self._read_string(buf)
+            value_type = self._unpack(buf, "<I")
+            self.metadata[key] = self._read_value(buf, value_type)
+
+        infos = []
+        for _ in range(tensor_count):
+            name = self._read_string(buf)
+            n_dims = self._unpack(buf, "<I")
+            shape = tuple(self._unpack(buf, "<Q") for _ in range(n_dims))
+            type_id = self._unpack(buf, "<I")
+            offset = self._unpack(buf, "<Q")
+            infos.append((name, shape, type_id, offset))
+
+        self.alignment = int(self.metadata.get("general.alignment", GGUF_DEFAULT_ALIGNMENT))
+        self.data_offset = -(-self._pos // self.alignment) * self.alignment
+
+        for name, shape, type_id, offset in infos:
+            if type_id not in GGML_TYPES:
+                raise GGUFError(f"Tensor {name} has unknown ggml type {type_id}")
+            type_name, block_size, type_size = GGML_TYPES[type_id]
+            elements = 1
+            for dim in shape:
+                elements *= dim
+            nbytes = elements // block_size * type_size
+            start = self.data_offset + offset
+            if start + nbytes > self.file_size:
+                raise GGUFError(f"Tensor {name} extends past the end of {self.path}")
+            self.tensors.append(GGUFTensor(name, shape, type_id, type_name, start, nbytes))
+
+    def select(self, names=None, types=None):
+        """Tensors matching any of the name patterns and any of the type names (None = all)"""
+        type_names = {t.upper() for t in types} if types else None
+        selected = []
+        for tensor in self.tensors:
+            if names and not any(fnmatch.fnmatchcase(tensor.name, pattern) for pattern in names):
+                continue
+            if type_names and tensor.type_name not in type_names:
+                continue
+            selected.append(tensor)
+        return selected
+
+
+def merge_ranges(tensors):
+    """Sorted absolute byte ranges of the given tensors, overlapping ones merged
+
+    Adjacent tensors stay separate so each one can go to a different worker.
+    """
+    ranges = []
+    for tensor in sorted(tensors, key=lambda t: t.offset):
+        start, end = tensor.offset, tensor.offset + tensor.nbytes
+        if ranges and start < ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        elif end > start:
+            ranges.append([start, end])
+    return [tuple(r) for r in ranges]
+
+
+def copy_range(src_fd, dst_fd, start, end, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Copy bytes [start, end) between files at the same offset, in-kernel where possible"""
+    pos = start
+    while pos < end:
+        count = min(chunk_size, end - pos)
+        if hasattr(os, "copy_file_range"):
+            try:
+                copied = os.copy_file_range(src_fd, dst_fd, count, pos, pos)
+            except OSError:
+                copied = 0
+            if copied > 0:
+                pos += copied
+                continue
+        if hasattr(os, "sendfile"):
+            try:
+                os.lseek(dst_fd, pos, os.SEEK_SET)
+                copied = os.sendfile(dst_fd, src_fd, pos, count)
+            except OSError:
+                copied = 0
+            if copied > 0:
+                pos += copied
+                continue
+        data = os.pread(src_fd, count, pos)
+        if not data:
+            raise OSError(f"Unexpected end of file at offset {pos}")
+        pos += os.pwrite(dst_fd, data, pos)
+
+
+def quantize_gguf(input_file, output_file, names=None, types=None, xAt=X8D_FACTOR,
+                  chunk_size=DEFAULT_CHUNK_SIZE, workers=1, progress=None, cancel_event=None):
+    """Statefold only the selected tensors of a GGUF file; copy everything else through
+
+    names are fnmatch patterns on tensor names, types are ggml type names
+    (e.g. ["Q8_0"]); None selects every tensor. Returns a stats dict like
+    bapx_quantize.quantize_file(), plus tensor and copy counts.
+    """
+    chunk_size = align_chunk_size(chunk_size)
+    workers = max(int(workers), 1)
+    reader = GGUFReader(input_file)
+    selected = reader.select(names, types)
+    ranges = merge_ranges(selected)
+    size = reader.file_size
+    in_place = os.path.exists(output_file) and os.path.samefile(input_file, output_file)
+    start_time = time.perf_counter()
+
+    # Copy the gaps between selected tensors (header, metadata, padding, other tensors)
+    bytes_copied = 0
+    if not in_place:
+        with open(input_file, 'rb') as src, open(output_file, 'wb') as dst:
+            dst.truncate(size)
+            pos = 0
+            for start, end in ranges + [(size, size)]:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise QuantizationCancelled()
+                if start > pos:
+                    copy_range(src.fileno(), dst.fileno(), pos, start, chunk_size)
+                    bytes_copied += start - pos
+                    if progress is not None:
+                        progress(start - pos)
+                pos = end
+
+    # Tensor data ranges are independent, so they are shards in their own right
+    run_shards(input_file, output_file, ranges, xAt, chunk_size, workers, in_place, progress, cancel_event)
+
+    elapsed = time.perf_counter() - start_time
+    bytes_processed = sum(end - start for start, end in ranges)
+    return {
+        "bytes_processed": bytes_processed,
+        "bytes_copied": bytes_copied,
+        "bytes_total": size,
+        "tensors_selected": len(selected),
+        "tensors_total": len(reader.tensors),
+        "elapsed_seconds": round(elapsed, 6),
+        "bytes_per_second": round((bytes_processed + bytes_copied) / elapsed, 1) if elapsed > 0 else None,
+        "chunk_size": chunk_size,
+        "workers": workers,
+        "shards": len(ranges),
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+
+def planned_bytes(input_file, output_file, tensors=None, tensor_types=None):
+    """Total of the byte counts quantize_model_file() will pass to progress()
+
+    GGUF files report the selected tensor data plus, unless processed in
+    place, the copied gaps; raw files report their whole size.
+    """
+    if not is_gguf(input_file):
+        if tensors or tensor_types:
+            raise GGUFError(f"Tensor selection requires a GGUF input: {input_file}")
+        return os.path.getsize(input_file)
+    reader = GGUFReader(input_file)
+    if not (os.path.exists(output_file) and os.path.samefile(input_file, output_file)):
+        return reader.file_size
+    return sum(end - start for start, end in merge_ranges(reader.select(tensors, tensor_types)))
+
+
+def quantize_model_file(input_file, output_file, tensors=None, tensor_types=None, **kwargs):
+    """Quantize a model file: GGUF files tensor by tensor, anything else as a raw blob"""
+    if is_gguf(input_file):
+        return quantize_gguf(input_file, output_file, tensors, tensor_types, **kwargs)
+    if tensors or tensor_types:
+        raise GGUFError(f"Tensor selection requires a GGUF input: {input_file}")
+    return quantize_file(input_file, output_file, **kwargs)
@@ -0,0 +1,218 @@
+"""
+bapX Tensor Quantization Jobs
+Asynchronous job queue behind /api/tensor/quantize.
+
+Requests enqueue a job and return its id immediately; a bounded thread pool
+runs the streaming quantizer so at most max_concurrent files are processed
+at once. Job status (state, bytes processed, throughput, ETA, output
+checksum) is persisted to a JSON store so it survives coordinator restarts;
+only the newest max_finished finished jobs are kept.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bapx_gguf import planned_bytes, quantize_model_file
+from bapx_quantize import DEFAULT_CHUNK_SIZE, QuantizationCancelled
+
+DEFAULT_MAX_FINISHED = 200
+FINISHED_STATES = ("completed", "failed", "cancelled", "interrupted")
+
+
+def file_sha256(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class QuantizeJobQueue:
+    """Persistent queue of x8D tensor quantization jobs with a concurrency cap"""
+
+    def __init__(self, store_path, max_concurrent=2, persist_interval=1.0, restore=True,
+                 max_finished=DEFAULT_MAX_FINISHED):
+        self.store_path = store_path
+        self.max_concurrent = max_concurrent
+        self.max_finished = max_finished
+        self.persist_interval = persist_interval
+        self._jobs = {}
+        self._cancel_events = {}
+        self._started = {}
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._last_persist = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="bapx-quantize")
+        if restore:
+            self._load()
+
+    def submit(self, input_file, output_file, chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+               tensors=None, tensor_types=None):
+        """Enqueue a quantization job and return its status
+
+        tensors/tensor_types select GGUF tensors (see bapx_gguf.quantize_gguf).
+        Raises GGUFError for a tensor selection on a file that is not GGUF.
+        """
+        # What progress will actually count: in place, only the selected tensors
+        bytes_total = planned_bytes(input_file, output_file, tensors, tensor_types)
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "state": "queued",
+            "input_file": input_file,
+            "output_file": output_file,
+            "chunk_size": chunk_size,
+            "workers": workers,
+            "tensors": tensors,
+            "tensor_types": tensor_types,
+            "bytes_total": bytes_total,
+            "bytes_processed": 0,
+            "bytes_per_second": None,
+            "eta_seconds": None,
+            "sha256": None,
+            "error": None,
+            "created_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._cancel_events[job_id] = threading.Event()
+            snapshot = dict(job)
+        self._persist()
+        self._executor.submit(self._run, job_id)
+        return snapshot
+
+    def get(self, job_id):
+        """Return a snapshot of one job's status, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        """Return snapshots of all known jobs, newest first"""
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns its status, or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["state"] == "queued":
+                job["state"] = "cancelled"
+                job["finished_at"] = datetime.utcnow().isoformat()
+            event = self._cancel_events.get(job_id)
+            if event is not None:
+                event.set()
+            if job["state"] == "cancelled":
+                self._cancel_events.pop(job_id, None)
+                self._prune()
+        self._persist()
+        return self.get(job_id)
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            if job["state"] != "queued":
+                return
+            job.update(state="running", bytes_processed=0, started_at=datetime.utcnow().isoformat())
+            self._started[job_id] = time.perf_counter()
+            cancel_event = self._cancel_events[job_id]
+        self._persist()
+
+        try:
+            stats = quantize_model_file(
+                job["input_file"], job["output_file"], job.get("tensors"), job.get("tensor_types"),
+                chunk_size=job["chunk_size"], workers=job["workers"],
+                progress=lambda n: self._progress(job_id, n), cancel_event=cancel_event
+            )
+            checksum = file_sha256(job["output_file"])
+            with self._lock:
+                job.update(
+                    state="completed",
+                    bytes_per_second=stats["bytes_per_second"],
+                    eta_seconds=0,
+                    sha256=checksum,
+                    stats=stats
+                )
+        except QuantizationCancelled:
+            with self._lock:
+                job["state"] = "cancelled"
+        except Exception as e:
+            with self._lock:
+                job.update(state="failed", error=str(e))
+        finally:
+            with self._lock:
+                job["finished_at"] = datetime.utcnow().isoformat()
+                self._started.pop(job_id, None)
+                self._cancel_events.pop(job_id, None)
+                self._prune()
+            self._persist()
+
+    def _progress(self, job_id, nbytes):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["bytes_processed"] += nbytes
+            elapsed = time.perf_counter() - self._started[job_id]
+            if elapsed > 0:
+                rate = job["bytes_processed"] / elapsed
+                job["bytes_per_second"] = round(rate, 1)
+                job["eta_seconds"] = round((job["bytes_total"] - job["bytes_processed"]) / rate, 1) if rate else None
+        if time.monotonic() - self._last_persist >= self.persist_interval:
+            self._persist()
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond max_finished (call with the lock held)"""
+        finished = [job for job in self._jobs.values() if job["state"] in FINISHED_STATES]
+        if len(finished) <= self.max_finished:
+            return
+        finished.sort(key=lambda job: job["finished_at"] or job["created_at"])
+        for job in finished[:len(finished) - self.max_finished]:
+            del self._jobs[job["job_id"]]
+
+    def _persist(self):
+        """Write all job statuses to the store atomically"""
+        with self._persist_lock:
+            with self._lock:
+                snapshot = json.dumps({"jobs": list(self._jobs.values())}, indent=2)
+            directory = os.path.dirname(self.store_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.store_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(snapshot)
+            os.replace(tmp_path, self.store_path)
+            self._last_persist = time.monotonic()
+
+    def _load(self):
+        """Restore jobs from the store: requeue queued jobs, mark running ones interrupted"""
+        if not os.path.exists(self.store_path):
+            return
+        with open(self.store_path, 'r') as f:
+            jobs = json.load(f).get("jobs", [])
+
+        requeue = []
+        for job in jobs:
+            if job["state"] == "running":
+                job["state"] = "interrupted"
+                job["error"] = "Coordinator restarted while the job was running"
+                job["finished_at"] = datetime.utcnow().isoformat()
+            elif job["state"] == "queued":
+                self._cancel_events[job["job_id"]] = threading.Event()
+                requeue.append(job["job_id"])
+            self._jobs[job["job_id"]] = job
+        self._prune()
+
+        if jobs:
+            self._persist()
+        for job_id in requeue:
+            self._executor.submit(self._run, job_id)
@@ -0,0 +1,154 @@
+"""
+bapX Logging
+Leveled, structured logging for the bapX coordinators.
+
+Records go through a QueueHandler so the request path only pays for a queue
+push; a QueueListener thread formats them (JSON by default) and writes them
+out. Request ids are carried in a context variable and attached to every
+record. Per-request detail is logged at DEBUG with lazy %-style arguments,
+so nothing is formatted when the level is disabled; the default production
+configuration (INFO, JSON) emits lifecycle events such as model loads and
+training runs, plus sampled request timings on the "bapx.timing" logger.
+
+Environment overrides: BAPX_LOG_LEVEL, BAPX_LOG_FORMAT (json|text),
+BAPX_LOG_SAMPLE_RATE.
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+
+LOGGER_NAME = "bapx"
+TIMING_LOGGER_NAME = "bapx.timing"
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_FORMAT = "json"
+DEFAULT_SAMPLE_RATE = 0.01
+
+_request_id = contextvars.ContextVar("bapx_request_id", default=None)
+_listener = None
+_sample_rate = 0.0
+
+
+def get_logger(name=None):
+    """Logger under the bapx namespace"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+@contextlib.contextmanager
+def request_context(request_id=None):
+    """Bind a request id to every record logged inside the block"""
+    token = _request_id.set(request_id or new_request_id())
+    try:
+        yield _request_id.get()
+    finally:
+        _request_id.reset(token)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the request id of the producing context"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, request_id and extra fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None)
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for interactive runs"""
+
+    def format(self, record):
+        message = record.getMessage()
+        fields = getattr(record, "fields", None)
+        if fields:
+            message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return message
+
+
+def configure_logging(level=None, fmt=None, sample_rate=None, stream=None):
+    """Install the queue-based handler on the bapx logger (idempotent: reconfigures)
+
+    level applies to per-request detail; sampled timings are always emitted
+    at INFO on bapx.timing with probability sample_rate.
+    """
+    global _listener, _sample_rate
+    level = (level or os.environ.get("BAPX_LOG_LEVEL", DEFAULT_LEVEL)).upper()
+    fmt = fmt or os.environ.get("BAPX_LOG_FORMAT", DEFAULT_FORMAT)
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("BAPX_LOG_SAMPLE_RATE", DEFAULT_SAMPLE_RATE))
+    _sample_rate = sample_rate
+
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    logging.getLogger(TIMING_LOGGER_NAME).setLevel(logging.INFO if sample_rate > 0 else logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    return logger
+
+
+def shutdown_logging():
+    """Flush and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def sample_timing(event, elapsed_seconds, **fields):
+    """Log an event timing on bapx.timing for a random sample of calls"""
+    if _sample_rate <= 0 or random.random() >= _sample_rate:
+        return
+    logger = logging.getLogger(TIMING_LOGGER_NAME)
+    if logger.isEnabledFor(logging.INFO):
+        fields["elapsed_ms"] = round(elapsed_seconds * 1000, 3)
+        fields["sample_rate"] = _sample_rate
+        logger.info(event, extra={"fields": fields})
@@ -0,0 +1,413 @@
+"""
+bapX Model Manager
+Keeps inference models resident across requests.
+
+Models are keyed by (path, adapter): a GGUF file is served by llama.cpp
+(llama-cpp-python) when it is installed, anything else is loaded with
+transformers on CPU with the PEFT adapter applied. Each model is loaded
+once, however many requests ask for it at the same time, and stays resident
+until it has to make room: when the resident models exceed the memory
+budget, the least recently used ones that nobody is using are evicted.
+Room is made before a model is loaded, from the size of its weight files
+on disk, so peak memory stays within the budget instead of reaching the
+budget plus one whole model; the actual size is checked again once loaded.
+
+When the manager is given prefix-cache settings, each transformers model
+gets a PrefixKVCache with the shared prompt prefixes prefilled at load time,
+and generate()/stream() only prefill what follows a cached prefix. GGUF
+models get llama.cpp's own prompt-state cache instead.
+
+With adapter settings, each transformers base model (loaded without an
+adapter) gets an AdapterPool (see bapx_adapters): generate()/stream() take
+an adapter name and run it on the already resident base, so trying another
+LoRA adapter costs its weights rather than another copy of the model.
+
+Requests hold a model through acquire(), which reference-counts it so an
+in-use model is never evicted:
+
+    with MODEL_MANAGER.acquire(path, adapter) as model:
+        text = model.generate(prompt)
+"""
+import contextlib
+import gc
+import os
+import threading
+import time
+
+from bapx_adapters import AdapterPool
+from bapx_logging import get_logger
+from bapx_prefix_cache import DEFAULT_MAX_BYTES as DEFAULT_PREFIX_CACHE_BYTES, PrefixKVCache
+
+DEFAULT_MEMORY_BUDGET = 32 * 1024 * 1024 * 1024
+# Files whose sizes estimate the memory a model directory will take once loaded
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".gguf", ".pt", ".pth")
+
+logger = get_logger("models")
+
+
+def model_backend(path):
+    """Backend that serves a model path: "gguf" or "transformers\""""
+    return "gguf" if str(path).lower().endswith(".gguf") else "transformers"
+
+
+def estimate_nbytes(path, adapter=None):
+    """Memory a model will take once loaded, estimated from its weight files on disk
+
+    Paths that are not local (Hugging Face ids) count as 0. Weights stored in
+    16 bits but loaded in float32 (on CPU) take about twice this.
+    """
+    total = 0
+    for item in (path, adapter):
+        if not item:
+            continue
+        if os.path.isfile(item):
+            total += os.path.getsize(item)
+        elif os.path.isdir(item):
+            total += sum(entry.stat().st_size for entry in os.scandir(item)
+                         if entry.is_file() and entry.name.endswith(WEIGHT_SUFFIXES))
+    return total
+
+
+def load_transformers(path, adapter=None, device="cpu", dtype=None):
+    """Load a causal LM (and tokenizer) with transformers, applying a PEFT adapter if given"""
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(
+        path,
+        torch_dtype=dtype or (torch.float32 if device == "cpu" else torch.float16),
+        low_cpu_mem_usage=True
+    ).to(device)
+    if adapter:
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, adapter)
+    model.eval()
+    nbytes = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+    return model, tokenizer, nbytes
+
+
+def load_gguf(path, adapter=None, n_ctx=4096, n_threads=None):
+    """Load a GGUF model with llama-cpp-python (adapter: a GGUF LoRA file)"""
+    if adapter and model_backend(adapter) != "gguf":
+        # A PEFT adapter directory only applies to transformers models
+        raise ValueError(f"GGUF models take a GGUF LoRA file as adapter, not {adapter}")
+    from llama_cpp import Llama
+
+    model = Llama(model_path=path, lora_path=adapter, n_ctx=n_ctx,
+                  n_threads=n_threads or os.cpu_count(), verbose=False)
+    return model, None, os.path.getsize(path)
+
+
+class ResidentModel:
+    """A loaded model with its tokenizer, size and usage bookkeeping"""
+
+    __slots__ = ("key", "backend", "model", "tokenizer", "nbytes", "load_seconds", "loaded_at",
+                 "last_used", "refcount", "requests", "prefix_cache", "adapters")
+
+    def __init__(self, key, backend, model, tokenizer, nbytes, load_seconds):
+        self.key = key
+        self.backend = backend
+        self.model = model
+        self.tokenizer = tokenizer
+        self.nbytes = nbytes
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.refcount = 0
+        self.requests = 0
+        # PrefixKVCache of a transformers model, if prefix caching is enabled
+        self.prefix_cache = None
+        # AdapterPool of a transformers base model, if adapter serving is enabled
+        self.adapters = None
+
+    def prefix_kwargs(self, inputs, adapters=(None,)):
+        """generate() arguments that reuse a cached KV prefix of a single tokenized prompt
+
+        The cached prefixes were computed by the base model, so prompts for an adapter get none.
+        """
+        if self.prefix_cache is None or any(adapters):
+            return {}
+        return self.prefix_cache.generate_kwargs(inputs["input_ids"][0].tolist())
+
+    @contextlib.contextmanager
+    def adapter_kwargs(self, adapters):
+        """Hold the adapters named per prompt (None: the base model); yields their generate() arguments"""
+        if self.adapters is None:
+            if any(adapters):
+                raise ValueError(f"Model {self.key[0]} does not serve adapters by name")
+            yield {}
+            return
+        with self.adapters.acquire(adapters) as adapter_names:
+            yield {"adapter_names": adapter_names} if adapter_names else {}
+
+    def generate(self, prompt, max_new_tokens=256, temperature=0.0, adapter=None, **kwargs):
+        """Generate a completion for prompt and return only the new text
+
+        adapter names a LoRA adapter of the model's AdapterPool to generate with.
+        """
+        if self.backend == "gguf":
+            if adapter:
+                raise ValueError("GGUF models do not serve adapters by name")
+            output = self.model(prompt, max_tokens=max_new_tokens, temperature=temperature, **kwargs)
+            return output["choices"][0]["text"]
+
+        import torch
+
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        sampling = {"do_sample": True, "temperature": temperature} if temperature > 0 else {"do_sample": False}
+        with self.adapter_kwargs([adapter]) as adapter_kwargs, torch.no_grad():
+            outputs = self.model.generate(**inputs, max_new_tokens=max_new_tokens,
+                                          pad_token_id=self.tokenizer.pad_token_id, **sampling,
+                                          **self.prefix_kwargs(inputs, [adapter]), **adapter_kwargs, **kwargs)
+        # Skip the prompt by token position rather than by matching its text
+        return self.tokenizer.decode(outputs[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+
+    def stream(self, prompt, max_new_tokens=256, temperature=0.0, adapter=None, **kwargs):
+        """Yield the completion for prompt piece by piece as it is generated
+
+        Closing the generator early stops generation at the next token.
+        """
+        if self.backend == "gguf":
+            if adapter:
+                raise ValueError("GGUF models do not serve adapters by name")
+            for chunk in self.model(prompt, max_tokens=max_new_tokens, temperature=temperature, stream=True, **kwargs):
+                yield chunk["choices"][0]["text"]
+            return
+
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+        cancelled = threading.Event()
+        errors = []
+
+        class StopWhenCancelled(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return cancelled.is_set()
+
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        # skip_prompt drops the prompt by token position rather than by matching its text
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        sampling = {"do_sample": True, "temperature": temperature} if temperature > 0 else {"do_sample": False}
+        prefix = self.prefix_kwargs(inputs, [adapter])
+
+        with self.adapter_kwargs([adapter]) as adapter_kwargs:
+            def run():
+                try:
+                    with torch.no_grad():
+                        self.model.generate(**inputs, max_new_tokens=max_new_tokens, streamer=streamer,
+                                            pad_token_id=self.tokenizer.pad_token_id,
+                                            stopping_criteria=StoppingCriteriaList([StopWhenCancelled()]),
+                                            **sampling, **prefix, **adapter_kwargs, **kwargs)
+                except Exception as e:
+                    errors.append(e)
+                    streamer.end()
+
+            thread = threading.Thread(target=run, name="bapx-stream", daemon=True)
+            thread.start()
+            try:
+                for text in streamer:
+                    if text:
+                        yield text
+            finally:
+                cancelled.set()
+                thread.join()
+        if errors:
+            raise errors[0]
+
+    def info(self):
+        path, adapter = self.key
+        return {
+            "path": path,
+            "adapter": adapter,
+            "backend": self.backend,
+            "bytes": self.nbytes,
+            "load_seconds": round(self.load_seconds, 3),
+            "loaded_at": self.loaded_at,
+            "in_use": self.refcount,
+            "requests": self.requests,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache is not None else None,
+            "adapters": self.adapters.stats() if self.adapters is not None else None
+        }
+
+
+class ModelManager:
+    """Loads models once, keeps them resident and evicts idle ones over a memory budget"""
+
+    def __init__(self, memory_budget_bytes=DEFAULT_MEMORY_BUDGET, loaders=None, prefix_cache=None, adapters=None):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.loaders = loaders or {"transformers": load_transformers, "gguf": load_gguf}
+        # {"prefixes": [...], "max_entries": ..., "max_bytes": ...}, or None to disable prefix caching
+        self.prefix_cache = prefix_cache
+        # {"registry": {name: path}, "max_bytes": ..., "max_adapters": ...}, or None to serve
+        # only the adapter a model was loaded with
+        self.adapters = adapters
+        # Callables run with each evicted ResidentModel (to drop other references to it),
+        # outside the manager's lock
+        self.on_evict = []
+        # Callables run with each newly loaded ResidentModel, outside the manager's lock
+        self.on_load = []
+        # (path, adapter) -> ResidentModel
+        self.models = {}
+        self._loading = {}
+        # (path, adapter) -> estimated bytes of each model being loaded
+        self._incoming = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def load(self, path, adapter=None):
+        """Make a model resident (loading it at most once) and return it
+
+        Idle models are evicted to make room for the estimated size before
+        loading starts.
+        """
+        key = (path, adapter or None)
+        while True:
+            with self._lock:
+                resident = self.models.get(key)
+                if resident is not None:
+                    return resident
+                pending = self._loading.get(key)
+                if pending is None:
+                    pending = self._loading[key] = threading.Event()
+                    break
+            # Another request is loading this model; wait for it, then look again
+            pending.wait()
+
+        try:
+            estimate = estimate_nbytes(path, adapter)
+            with self._lock:
+                self._incoming[key] = estimate
+                evicted = self._evict_over_budget(keep=key)
+            self._evicted(evicted)
+
+            backend = model_backend(path)
+            start = time.perf_counter()
+            model, tokenizer, nbytes = self.loaders[backend](path, adapter)
+            resident = ResidentModel(key, backend, model, tokenizer, nbytes, time.perf_counter() - start)
+            if self.prefix_cache:
+                self._attach_prefix_cache(resident)
+            if self.adapters is not None and backend == "transformers" and not adapter:
+                resident.adapters = AdapterPool(resident, **self.adapters)
+            logger.info("Loaded model %s (adapter %s) in %.1f s", path, adapter, resident.load_seconds,
+                        extra={"fields": {"backend": backend, "bytes": nbytes}})
+            with self._lock:
+                del self._incoming[key]
+                self.models[key] = resident
+                evicted = self._evict_over_budget(keep=key)
+            self._evicted(evicted)
+            for callback in self.on_load:
+                callback(resident)
+            return resident
+        finally:
+            with self._lock:
+                self._incoming.pop(key, None)
+                self._loading.pop(key).set()
+
+    @contextlib.contextmanager
+    def acquire(self, path, adapter=None):
+        """Hold a resident model for the duration of a request"""
+        while True:
+            resident = self.load(path, adapter)
+            with self._lock:
+                # It may have been evicted between load() and here
+                if self.models.get(resident.key) is resident:
+                    resident.refcount += 1
+                    resident.requests += 1
+                    break
+        try:
+            yield resident
+        finally:
+            with self._lock:
+                resident.refcount -= 1
+                resident.last_used = time.monotonic()
+
+    def get(self, path, adapter=None):
+        """The resident model for (path, adapter), or None without loading it"""
+        with self._lock:
+            return self.models.get((path, adapter or None))
+
+    def unload(self, path, adapter=None):
+        """Evict a model now; returns False if it is unknown or in use"""
+        with self._lock:
+            resident = self.models.get((path, adapter or None))
+            if resident is None or resident.refcount:
+                return False
+            self._evict(resident.key)
+        self._evicted([resident])
+        return True
+
+    def warm_up(self, specs, prompt=None):
+        """Load (path, adapter) pairs, optionally running one short generation each"""
+        for path, adapter in specs:
+            try:
+                with self.acquire(path, adapter) as resident:
+                    if prompt:
+                        resident.generate(prompt, max_new_tokens=1)
+            except Exception:
+                logger.exception("Warm-up failed for model %s (adapter %s)", path, adapter)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "resident_bytes": sum(resident.nbytes for resident in self.models.values()),
+                "evictions": self.evictions,
+                "loading": [{"path": path, "adapter": adapter} for path, adapter in self._loading],
+                "models": [resident.info() for resident in self.models.values()]
+            }
+
+    def _attach_prefix_cache(self, resident):
+        """Prefill the configured shared prefixes for a newly loaded model"""
+        settings = dict(self.prefix_cache)
+        prefixes = settings.pop("prefixes", [])
+        if resident.backend == "gguf":
+            from llama_cpp import LlamaRAMCache
+
+            # llama.cpp restores the saved state with the longest matching token prefix
+            resident.model.set_cache(LlamaRAMCache(capacity_bytes=settings.get("max_bytes", DEFAULT_PREFIX_CACHE_BYTES)))
+            return
+        resident.prefix_cache = PrefixKVCache(resident.model, resident.tokenizer, **settings)
+        for prefix in prefixes:
+            tokens = resident.prefix_cache.register(prefix)
+            logger.debug("Cached KV prefix of %d tokens for %s", tokens, resident.key[0])
+
+    def _evict(self, key):
+        """Drop a model from the resident set (called with _lock held; run _evicted() after releasing it)"""
+        resident = self.models.pop(key)
+        self.evictions += 1
+        return resident
+
+    def _evicted(self, evicted):
+        """Run the on_evict callbacks for evicted models and free their memory (without _lock held)"""
+        if not evicted:
+            return
+        for resident in evicted:
+            for callback in self.on_evict:
+                callback(resident)
+            logger.info("Evicted model %s (adapter %s)", resident.key[0], resident.key[1],
+                        extra={"fields": {"bytes": resident.nbytes}})
+        del resident
+        evicted.clear()
+        gc.collect()
+
+    def _evict_over_budget(self, keep):
+        """Evict least recently used idle models until resident and loading models fit the budget
+
+        Called with _lock held; returns the evicted models for _evicted().
+        """
+        total = sum(resident.nbytes for resident in self.models.values()) + sum(self._incoming.values())
+        idle = sorted((resident for resident in self.models.values() if not resident.refcount and resident.key != keep),
+                      key=lambda resident: resident.last_used)
+        evicted = []
+        for resident in idle:
+            if total <= self.memory_budget_bytes:
+                break
+            evicted.append(self._evict(resident.key))
+            total -= resident.nbytes
+        if total > self.memory_budget_bytes:
+            logger.warning("Resident and loading models take %d bytes, over the %d byte budget (models in use)",
+                           total, self.memory_budget_bytes)
+        return evicted
@@ -0,0 +1,220 @@
+"""
+bapX Sequence Packing
+Packs short training samples into full-length rows, or batches them by length.
+
+The instruction samples are a few hundred tokens, so padding each batch to
+max_seq_length (or training one sample per step) wastes most of the compute.
+Two ways around it, both working on the sample lengths of a TokenizedDataset
+(see bapx_dataset) without reading any tokens:
+
+Packing: pack_lengths() puts samples into rows of at most max_length tokens
+(best fit, longest first) and PackedDataset serves each row as one item.
+PackingCollator keeps samples apart inside a row: position ids restart at
+every sample, the first token of a sample is not a label for the one before
+it, and attention is block-diagonal, either through an explicit 4D mask or,
+for flash attention (block_mask=False), through the restarting position ids.
+
+Bucketing: LengthBucketSampler orders samples so each batch holds similar
+lengths, which keeps padding low without changing the samples.
+
+padding_report() compares padded tokens for random batches, bucketed
+batches and packing on a set of lengths, and both collators count samples,
+real and padded tokens for throughput logging.
+"""
+import bisect
+
+import numpy as np
+
+IGNORE_INDEX = -100
+
+
+def pack_lengths(lengths, max_length):
+    """Group sample indices into packs of at most max_length tokens (best fit decreasing)
+
+    Samples longer than max_length get a pack of their own.
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(-lengths, kind="stable")
+    packs = []
+    # Sorted (space left, pack index) of packs that still have room
+    space = []
+    for index in order.tolist():
+        length = int(lengths[index])
+        slot = bisect.bisect_left(space, (length, -1))
+        if slot < len(space):
+            left, pack = space.pop(slot)
+            packs[pack].append(index)
+            left -= length
+        else:
+            pack = len(packs)
+            packs.append([index])
+            left = max_length - length
+        if left > 0:
+            bisect.insort(space, (left, pack))
+    return packs
+
+
+class PackedDataset:
+    """Rows of packed samples from a TokenizedDataset"""
+
+    def __init__(self, dataset, max_length):
+        self.dataset = dataset
+        self.max_length = max_length
+        self.packs = pack_lengths(dataset.lengths(), max_length)
+
+    def __len__(self):
+        return len(self.packs)
+
+    def lengths(self):
+        sample_lengths = self.dataset.lengths()
+        return np.array([int(sample_lengths[pack].sum()) for pack in self.packs], dtype=np.int64)
+
+    def __getitem__(self, index):
+        samples = [self.dataset.token_ids(sample) for sample in self.packs[index]]
+        return {
+            "input_ids": np.concatenate(samples).tolist(),
+            "sample_lengths": [len(sample) for sample in samples]
+        }
+
+
+class PackingCollator:
+    """Pads packed rows into a batch with per-sample positions, labels and attention
+
+    block_mask=True builds a block-diagonal causal 4D attention mask in
+    mask_dtype (the model's dtype); with block_mask=False no mask is passed
+    and flash attention separates samples by the restarting position ids.
+    """
+
+    def __init__(self, pad_token_id, block_mask=True, mask_dtype=None):
+        self.pad_token_id = pad_token_id
+        self.block_mask = block_mask
+        self.mask_dtype = mask_dtype
+        self.samples = 0
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    def __call__(self, features):
+        import torch
+
+        width = max(len(feature["input_ids"]) for feature in features)
+        input_ids = torch.full((len(features), width), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((len(features), width), IGNORE_INDEX, dtype=torch.long)
+        position_ids = torch.zeros((len(features), width), dtype=torch.long)
+        # Sample number of every position in its row; -1 for padding
+        segments = torch.full((len(features), width), -1, dtype=torch.long)
+        for row, feature in enumerate(features):
+            ids = torch.tensor(feature["input_ids"], dtype=torch.long)
+            input_ids[row, :len(ids)] = ids
+            labels[row, :len(ids)] = ids
+            start = 0
+            for segment, length in enumerate(feature["sample_lengths"]):
+                position_ids[row, start:start + length] = torch.arange(length)
+                segments[row, start:start + length] = segment
+                # The first token of a sample is not predicted from the previous sample
+                labels[row, start] = IGNORE_INDEX
+                start += length
+            self.samples += len(feature["sample_lengths"])
+            self.real_tokens += len(ids)
+        self.padded_tokens += input_ids.numel() - sum(len(feature["input_ids"]) for feature in features)
+
+        batch = {"input_ids": input_ids, "labels": labels, "position_ids": position_ids}
+        if self.block_mask:
+            causal = torch.ones((width, width), dtype=torch.bool).tril()
+            allowed = (segments[:, :, None] == segments[:, None, :]) & causal
+            dtype = self.mask_dtype or torch.float32
+            mask = torch.zeros(allowed.shape, dtype=dtype).masked_fill(~allowed, torch.finfo(dtype).min)
+            batch["attention_mask"] = mask[:, None, :, :]
+        return batch
+
+
+class CountingCollator:
+    """Wraps a padding collator to count real and padded tokens"""
+
+    def __init__(self, collator):
+        self.collator = collator
+        self.samples = 0
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    def __call__(self, features):
+        batch = self.collator(features)
+        real = int(batch["attention_mask"].sum())
+        self.samples += len(features)
+        self.real_tokens += real
+        self.padded_tokens += batch["attention_mask"].numel() - real
+        return batch
+
+
+class LengthBucketSampler:
+    """Sample order in which each run of batch_size samples has similar lengths
+
+    Indices are shuffled, cut into mega-batches of batch_size * mega_batches
+    samples, sorted by length within each, and the resulting batches are
+    shuffled, so batches stay random across the epoch. Call set_epoch() to
+    reshuffle.
+    """
+
+    def __init__(self, lengths, batch_size, mega_batches=50, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.mega_batches = mega_batches
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def batches(self):
+        """Index arrays, one per batch, in training order"""
+        rng = np.random.default_rng(self.seed + self.epoch)
+        indices = rng.permutation(len(self.lengths))
+        mega = self.batch_size * self.mega_batches
+        batches = []
+        for start in range(0, len(indices), mega):
+            chunk = indices[start:start + mega]
+            chunk = chunk[np.argsort(-self.lengths[chunk], kind="stable")]
+            batches.extend(chunk[i:i + self.batch_size] for i in range(0, len(chunk), self.batch_size))
+        # Only the last batch of the last mega-batch can be short; it stays at the end so
+        # the DataLoader's consecutive batch_size slices line up with these batches
+        full = [batch for batch in batches if len(batch) == self.batch_size]
+        return [full[i] for i in rng.permutation(len(full))] + batches[len(full):]
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch.tolist()
+
+
+def _batch_slots(lengths, batches):
+    """Token slots of batches padded to their longest row"""
+    return sum(int(lengths[batch].max()) * len(batch) for batch in batches)
+
+
+def padding_report(lengths, max_length, batch_size, seed=0):
+    """Rows, token slots and padding ratio of random batches, bucketed batches and packing"""
+    lengths = np.minimum(np.asarray(lengths), max_length)
+    real = int(lengths.sum())
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(lengths))
+    random_batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+    bucketed_batches = LengthBucketSampler(lengths, batch_size, seed=seed).batches()
+    packs = pack_lengths(lengths, max_length)
+    row_lengths = np.array([int(lengths[pack].sum()) for pack in packs])
+    row_batches = [np.arange(i, min(i + batch_size, len(packs))) for i in range(0, len(packs), batch_size)]
+
+    report = {"samples": len(lengths), "real_tokens": real,
+              "mean_length": round(real / len(lengths), 1) if len(lengths) else 0}
+    for mode, batches, slots in (
+        ("random", random_batches, _batch_slots(lengths, random_batches)),
+        ("bucketed", bucketed_batches, _batch_slots(lengths, bucketed_batches)),
+        ("packed", row_batches, _batch_slots(row_lengths, row_batches))
+    ):
+        report[mode] = {
+            "batches": len(batches),
+            "token_slots": slots,
+            "padding_ratio": round(1 - real / slots, 4) if slots else 0.0,
+            "real_tokens_per_batch": round(real / len(batches), 1) if batches else 0.0
+        }
+    return report
@@ -0,0 +1,143 @@
+"""
+bapX Prefix KV Cache
+Reuses the attention KV cache of shared prompt prefixes (transformers models).
+
+Prompts share scaffolding: every bapX prompt starts with the same
+"### Instruction:" template, and production prompts will share a long
+identity preamble. register() prefills such a prefix once and keeps its
+past_key_values in a bounded LRU keyed by a hash of its token ids. lookup()
+finds the longest registered prefix of a tokenized prompt, so generation
+only has to prefill the suffix.
+
+Matching is on token ids, not text: if a prompt tokenizes differently
+across the prefix boundary, it simply misses and is prefilled in full.
+Cached entries are copied before use, since generation extends the cache
+in place.
+"""
+import copy
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 16
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def prefix_key(input_ids):
+    """Cache key for a sequence of token ids"""
+    return hashlib.blake2b(array("q", input_ids).tobytes(), digest_size=16).digest()
+
+
+def kv_cache_nbytes(cache):
+    """Total tensor bytes held by a past_key_values object (Cache instance or legacy tuples)"""
+    if hasattr(cache, "to_legacy_cache"):
+        cache = cache.to_legacy_cache()
+    if hasattr(cache, "numel"):
+        return cache.numel() * cache.element_size()
+    if isinstance(cache, (tuple, list)):
+        return sum(kv_cache_nbytes(item) for item in cache)
+    return 0
+
+
+class _Entry:
+    __slots__ = ("length", "cache", "nbytes")
+
+    def __init__(self, length, cache, nbytes):
+        self.length = length
+        self.cache = cache
+        self.nbytes = nbytes
+
+
+class PrefixKVCache:
+    """Bounded LRU of prefilled KV caches for registered prompt prefixes of one model"""
+
+    def __init__(self, model, tokenizer, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # prefix_key(token ids) -> _Entry; _lengths counts entries per prefix length
+        self._entries = OrderedDict()
+        self._lengths = {}
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tokens_reused = 0
+
+    def prefill(self, input_ids):
+        """Run the model over input_ids (a list) and return its past_key_values"""
+        import torch
+
+        with torch.no_grad():
+            output = self.model(input_ids=torch.tensor([input_ids], device=self.model.device), use_cache=True)
+        return output.past_key_values
+
+    def register(self, prefix):
+        """Prefill a prefix (text) and cache its KV state; returns its token count"""
+        ids = self.tokenizer(prefix)["input_ids"]
+        key = prefix_key(ids)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return len(ids)
+        cache = self.prefill(ids)
+        entry = _Entry(len(ids), cache, kv_cache_nbytes(cache))
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self._lengths[entry.length] = self._lengths.get(entry.length, 0) + 1
+                self._nbytes += entry.nbytes
+                self._evict()
+        return len(ids)
+
+    def lookup(self, input_ids):
+        """(prefix length, copy of its KV cache) for the longest cached prefix of input_ids, or (0, None)
+
+        At least one token is always left over for the model to process.
+        """
+        with self._lock:
+            for length in sorted(self._lengths, reverse=True):
+                if length >= len(input_ids):
+                    continue
+                key = prefix_key(input_ids[:length])
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.tokens_reused += length
+                    cache = entry.cache
+                    break
+            else:
+                self.misses += 1
+                return 0, None
+        return length, copy.deepcopy(cache)
+
+    def generate_kwargs(self, input_ids):
+        """Extra model.generate() arguments that reuse a cached prefix of input_ids ({} on a miss)"""
+        length, cache = self.lookup(input_ids)
+        return {"past_key_values": cache} if cache is not None else {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._nbytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "tokens_reused": self.tokens_reused
+            }
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._nbytes -= entry.nbytes
+            self._lengths[entry.length] -= 1
+            if not self._lengths[entry.length]:
+                del self._lengths[entry.length]
+            self.evictions += 1
@@ -0,0 +1,223 @@
+"""
+bapX x8D Tensor Quantizer
+Streaming, memory-mapped statefold pipeline behind /api/tensor/quantize.
+
+The input file is mmapped and processed in fixed-size chunks that are written
+into a preallocated, mmapped output file. Pages are released after each chunk
+(written pages stay in the page cache for the kernel to write back, and the
+output is flushed once per shard), so peak memory is bounded by the chunk
+size rather than by the file size (Q8_0 GGUF models are 8-30 GB).
+
+statefold is position-independent, so large files are split into byte-range
+shards that a process pool transforms in parallel, each worker writing
+directly to its own offset of the shared output file.
+
+Batch use from the project root:
+    python bapx_quantize.py model.gguf model_x8d.gguf --workers 32
+    python bapx_quantize.py --output-dir models/x8d models/*.gguf --workers 32
+    python bapx_quantize.py model.gguf model_x8d.gguf --tensor-types Q8_0
+"""
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+from bapx_x8d import X8D_FACTOR, statefold_table
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+# Each chunk is held twice while it is translated
+MAX_CHUNK_SIZE = 256 * 1024 * 1024
+
+
+class QuantizationCancelled(Exception):
+    """Raised when a quantization run is cancelled through its cancel event"""
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes (None where unsupported)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def align_chunk_size(chunk_size):
+    """Round a chunk size up to a whole number of mmap pages"""
+    granularity = mmap.ALLOCATIONGRANULARITY
+    chunk_size = max(int(chunk_size), granularity)
+    return (chunk_size + granularity - 1) // granularity * granularity
+
+
+def _release(buf, start, end):
+    """Drop a processed range of a mapping from this process's memory
+
+    Dropping a page of a shared file mapping does not discard writes: dirty
+    pages stay in the page cache and are written back asynchronously, so no
+    per-chunk msync is needed.
+    """
+    # madvise needs page-aligned offsets; dropping a page that also holds
+    # unprocessed bytes is safe (it is re-read from the page cache)
+    start -= start % mmap.PAGESIZE
+    if hasattr(buf, "madvise"):
+        buf.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def statefold_range(in_map, out_map, start, end, table, chunk_size=DEFAULT_CHUNK_SIZE,
+                    progress=None, cancel_event=None):
+    """Apply a statefold translate table to in_map[start:end] into out_map, chunk by chunk
+
+    progress(n) is called with the byte count of every finished chunk;
+    cancel_event (threading.Event) is checked before each chunk.
+    """
+    in_place = in_map is out_map
+    for offset in range(start, end, chunk_size):
+        if cancel_event is not None and cancel_event.is_set():
+            raise QuantizationCancelled()
+        stop = min(offset + chunk_size, end)
+        out_map[offset:stop] = in_map[offset:stop].translate(table)
+        _release(out_map, offset, stop)
+        if not in_place:
+            _release(in_map, offset, stop)
+        if progress is not None:
+            progress(stop - offset)
+
+
+def plan_shards(size, workers, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split [0, size) into chunk-aligned byte ranges, a few per worker for load balance"""
+    if size <= 0:
+        return []
+    target = -(-size // (max(workers, 1) * 4))
+    shard_size = max(chunk_size, -(-target // chunk_size) * chunk_size)
+    return [(start, min(start + shard_size, size)) for start in range(0, size, shard_size)]
+
+
+def quantize_shard(input_file, output_file, start, end, xAt=X8D_FACTOR,
+                   chunk_size=DEFAULT_CHUNK_SIZE, in_place=False, progress=None, cancel_event=None):
+    """Statefold bytes [start, end) of input_file into the same range of output_file
+
+    The output file must already exist with its final size. start need not
+    be aligned: the mapping begins at the preceding allocation boundary.
+    """
+    if end <= start:
+        return 0
+    table = statefold_table(xAt)
+    map_start = start - start % mmap.ALLOCATIONGRANULARITY
+    length = end - map_start
+    first = start - map_start
+    if in_place:
+        with open(output_file, 'r+b') as f, mmap.mmap(f.fileno(), length, offset=map_start) as buf:
+            statefold_range(buf, buf, first, length, table, chunk_size, progress, cancel_event)
+            buf.flush()
+    else:
+        with open(input_file, 'rb') as src, open(output_file, 'r+b') as dst, \
+                mmap.mmap(src.fileno(), length, access=mmap.ACCESS_READ, offset=map_start) as in_map, \
+                mmap.mmap(dst.fileno(), length, offset=map_start) as out_map:
+            statefold_range(in_map, out_map, first, length, table, chunk_size, progress, cancel_event)
+            out_map.flush()
+    return end - start
+
+
+def run_shards(input_file, output_file, shards, xAt=X8D_FACTOR, chunk_size=DEFAULT_CHUNK_SIZE,
+               workers=1, in_place=False, progress=None, cancel_event=None):
+    """Statefold each (start, end) shard, serially or across a process pool"""
+    if workers == 1 or len(shards) <= 1:
+        for start, end in shards:
+            quantize_shard(input_file, output_file, start, end, xAt, chunk_size, in_place,
+                           progress, cancel_event)
+        return
+
+    # Spawned, not forked: the coordinator calls this from a multithreaded server
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=get_context("spawn")) as pool:
+        pending = {
+            pool.submit(quantize_shard, input_file, output_file, start, end, xAt, chunk_size, in_place)
+            for start, end in shards
+        }
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                length = future.result()
+                if progress is not None:
+                    progress(length)
+            if cancel_event is not None and cancel_event.is_set():
+                # Shards already running finish; queued ones are dropped
+                for future in pending:
+                    future.cancel()
+                raise QuantizationCancelled()
+
+
+def quantize_file(input_file, output_file, xAt=X8D_FACTOR, chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+                  progress=None, cancel_event=None):
+    """Stream input_file through statefold into output_file
+
+    Returns a stats dict with bytes processed, bytes/sec and peak RSS.
+    output_file may be the same path as input_file (processed in place).
+    With workers > 1 the file is sharded across a process pool.
+    progress(n) receives finished byte counts (per chunk, or per shard when
+    sharded); setting cancel_event raises QuantizationCancelled.
+    """
+    chunk_size = align_chunk_size(chunk_size)
+    workers = max(int(workers), 1)
+    size = os.path.getsize(input_file)
+    in_place = os.path.exists(output_file) and os.path.samefile(input_file, output_file)
+    start_time = time.perf_counter()
+
+    if not in_place:
+        # Preallocate the output so every shard can map its own range
+        with open(output_file, 'wb') as dst:
+            dst.truncate(size)
+
+    shards = plan_shards(size, workers, chunk_size)
+    run_shards(input_file, output_file, shards, xAt, chunk_size, workers, in_place, progress, cancel_event)
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        "bytes_processed": size,
+        "elapsed_seconds": round(elapsed, 6),
+        "bytes_per_second": round(size / elapsed, 1) if elapsed > 0 else None,
+        "chunk_size": chunk_size,
+        "workers": workers,
+        "shards": len(shards),
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bapX x8D tensor quantizer")
+    parser.add_argument("files", nargs="+",
+                        help="INPUT OUTPUT, or one or more INPUT files with --output-dir")
+    parser.add_argument("--output-dir", help="Write each input to this directory under the same name")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--xat", type=float, default=X8D_FACTOR, help="statefold factor")
+    parser.add_argument("--tensors", nargs="+", help="GGUF only: tensor name patterns to process")
+    parser.add_argument("--tensor-types", nargs="+", help="GGUF only: ggml tensor types to process, e.g. Q8_0")
+    args = parser.parse_args()
+
+    # GGUF inputs are parsed so only tensor data is transformed
+    from bapx_gguf import quantize_model_file
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        jobs = [(path, os.path.join(args.output_dir, os.path.basename(path))) for path in args.files]
+    elif len(args.files) == 2:
+        jobs = [tuple(args.files)]
+    else:
+        parser.error("expected INPUT OUTPUT, or --output-dir with one or more INPUT files")
+
+    for input_file, output_file in jobs:
+        stats = quantize_model_file(
+            input_file, output_file, args.tensors, args.tensor_types,
+            xAt=args.xat, chunk_size=args.chunk_size, workers=args.workers
+        )
+        print(json.dumps({"input_file": input_file, "output_file": output_file, **stats}))
+
+
+if __name__ == "__main__":
+    main()
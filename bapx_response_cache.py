@@ -0,0 +1,247 @@
+"""
+bapX Response Cache
+Caches responses of deterministic endpoints (/api/process, /api/training/qa).
+
+MemoryCache is an in-process LRU bounded by the JSON-encoded size of its
+values. SQLiteCache is an optional shared tier in a local SQLite file (WAL
+mode), so several worker processes on one host reuse each other's results;
+it evicts least recently used rows once over its own byte budget. Triggers
+keep the row count and byte total in a one-row table, so inserts never sum
+the whole cache, and access times of hits are buffered and written in one
+transaction at most every touch_interval seconds (and before any eviction),
+so reads do not take the write lock.
+ResponseCache puts the memory tier in front of the shared one and keeps
+hit/miss/eviction counters for the stats endpoint.
+
+Values must be JSON-serializable. Callers must not mutate returned values.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+KEY_SEPARATOR = "\x1f"
+# Least recently used rows looked at per eviction query
+EVICT_BATCH = 64
+
+
+def cache_key(*parts):
+    """Cache key for an endpoint and its (already normalized) inputs"""
+    return KEY_SEPARATOR.join(str(part) for part in parts)
+
+
+class MemoryCache:
+    """Thread-safe LRU cache with a byte-size limit"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, nbytes=None):
+        if nbytes is None:
+            nbytes = len(json.dumps(value, default=str))
+        nbytes += len(key)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous[1]
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._nbytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class SQLiteCache:
+    """LRU cache in a local SQLite file, shareable between worker processes"""
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, touch_interval=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key BLOB PRIMARY KEY, value TEXT NOT NULL, nbytes INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (accessed_at)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache_size ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), entries INTEGER NOT NULL, nbytes INTEGER NOT NULL)"
+            )
+            # Caches created before the size table are summed once
+            self._db.execute(
+                "INSERT OR IGNORE INTO response_cache_size (id, entries, nbytes) "
+                "SELECT 1, COUNT(*), COALESCE(SUM(nbytes), 0) FROM response_cache"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS response_cache_insert AFTER INSERT ON response_cache BEGIN "
+                "UPDATE response_cache_size SET entries = entries + 1, nbytes = nbytes + new.nbytes; END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS response_cache_update AFTER UPDATE OF nbytes ON response_cache BEGIN "
+                "UPDATE response_cache_size SET nbytes = nbytes + new.nbytes - old.nbytes; END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS response_cache_delete AFTER DELETE ON response_cache BEGIN "
+                "UPDATE response_cache_size SET entries = entries - 1, nbytes = nbytes - old.nbytes; END"
+            )
+        self._lock = threading.Lock()
+        # Digest -> access time of hits not yet written back
+        self._touched = {}
+        self._last_touch_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha256(key.encode('utf-8')).digest()
+
+    def get(self, key):
+        digest = self._digest(key)
+        with self._lock:
+            row = self._db.execute("SELECT value FROM response_cache WHERE key = ?", (digest,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touched[digest] = time.time()
+            if time.monotonic() - self._last_touch_flush >= self.touch_interval:
+                self._flush_touched()
+                self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def _flush_touched(self):
+        """Write buffered access times into the current transaction (called with _lock held)"""
+        if self._touched:
+            self._db.executemany("UPDATE response_cache SET accessed_at = ? WHERE key = ?",
+                                 [(accessed_at, digest) for digest, accessed_at in self._touched.items()])
+            self._touched.clear()
+        self._last_touch_flush = time.monotonic()
+
+    def set(self, key, value, nbytes=None):
+        encoded = json.dumps(value, default=str)
+        nbytes = len(encoded) + len(key)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO response_cache (key, value, nbytes, accessed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, nbytes = excluded.nbytes, "
+                "accessed_at = excluded.accessed_at",
+                (self._digest(key), encoded, nbytes, time.time())
+            )
+            total = self._db.execute("SELECT nbytes FROM response_cache_size").fetchone()[0]
+            if total > self.max_bytes:
+                # Recent hits count before choosing what to drop
+                self._flush_touched()
+            while total > self.max_bytes:
+                # Drop least recently used rows, a batch at a time, until back under budget
+                rows = self._db.execute("SELECT key, nbytes FROM response_cache ORDER BY accessed_at LIMIT ?",
+                                        (EVICT_BATCH,)).fetchall()
+                if not rows:
+                    break
+                stale = []
+                for row_key, row_bytes in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((row_key,))
+                    total -= row_bytes
+                self._db.executemany("DELETE FROM response_cache WHERE key = ?", stale)
+                self.evictions += len(stale)
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM response_cache")
+            self._touched.clear()
+
+    def stats(self):
+        with self._lock:
+            entries, nbytes = self._db.execute("SELECT entries, nbytes FROM response_cache_size").fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": entries,
+            "bytes": nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class ResponseCache:
+    """Memory LRU in front of an optional shared backend"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, shared=None):
+        self.memory = MemoryCache(max_bytes)
+        self.shared = shared
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        nbytes = len(json.dumps(value, default=str))
+        self.memory.set(key, value, nbytes)
+        if self.shared is not None:
+            self.shared.set(key, value, nbytes)
+
+    def clear(self):
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        memory = self.memory.stats()
+        lookups = memory["hits"] + memory["misses"]
+        return {
+            "hit_rate": round(memory["hits"] / lookups, 4) if lookups else None,
+            "memory": memory,
+            "shared": self.shared.stats() if self.shared is not None else None
+        }
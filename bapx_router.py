@@ -0,0 +1,360 @@
+"""
+bapX Delegation Router
+Dispatches delegated requests to specialist model backends in worker processes.
+
+Each backend (bapXcoder, bapXnarrator, ...) is a separate process holding
+one model. It answers requests over a local socket (multiprocessing.connection,
+a Unix socket where available) and batches concurrent ones through
+bapx_batching. For each backend the router keeps a pool of open connections
+and allows at most max_concurrency requests in flight; up to max_queue_depth
+more may wait for a slot. Past that the backend is saturated and a request
+is shed at once instead of queueing: it goes to the primary model's backend,
+and failing that to the caller's local fallback. Backends that fail to start,
+crash or time out are treated the same way.
+
+A backend's model is a path served through bapx_models, or a stub for
+benchmarks and local runs:
+
+    "stub:echo"         replies with the prompt
+    "stub:sleep:0.05"   sleeps 50 ms, then replies with the prompt
+"""
+import atexit
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import multiprocessing
+from multiprocessing.connection import Client, Listener
+
+from bapx_logging import get_logger
+
+DEFAULT_MAX_CONCURRENCY = 2
+DEFAULT_MAX_QUEUE_DEPTH = 8
+DEFAULT_QUEUE_TIMEOUT = 5.0
+DEFAULT_REQUEST_TIMEOUT = 120.0
+DEFAULT_START_TIMEOUT = 600.0
+
+logger = get_logger("router")
+
+
+class BackendError(Exception):
+    """A backend could not answer a request"""
+
+
+class BackendSaturated(BackendError):
+    """A backend's concurrency slots and wait queue are full"""
+
+
+class BackendUnavailable(BackendError):
+    """A backend is not running, dropped the connection or timed out"""
+
+
+def make_handler(model, adapter=None):
+    """Callable (prompt, max_new_tokens) -> text for a backend model spec"""
+    if model.startswith("stub:"):
+        kind, _, argument = model[len("stub:"):].partition(":")
+        if kind == "echo":
+            return lambda prompt, max_new_tokens: prompt
+        if kind == "sleep":
+            delay = float(argument or 0.05)
+
+            def sleep(prompt, max_new_tokens):
+                time.sleep(delay)
+                return prompt
+            return sleep
+        raise ValueError(f"Unknown stub backend: {model}")
+
+    from bapx_batching import BatchScheduler
+    from bapx_models import ModelManager
+
+    # Concurrent connections share batched generate() calls on the one model
+    scheduler = BatchScheduler(ModelManager().load(model, adapter))
+    return lambda prompt, max_new_tokens: scheduler.generate(prompt, max_new_tokens)
+
+
+def _serve_connection(conn, handler):
+    """Answer (prompt, max_new_tokens) requests on one connection until it closes"""
+    with conn:
+        while True:
+            try:
+                prompt, max_new_tokens = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = ("ok", handler(prompt, max_new_tokens))
+            except Exception as e:
+                logger.exception("Backend request failed")
+                reply = ("error", str(e))
+            try:
+                conn.send(reply)
+            except OSError:
+                return
+
+
+def _serve_backend(name, address, family, authkey, model, adapter, status):
+    """Worker process: load the model, report the listening address, serve connections"""
+    try:
+        handler = make_handler(model, adapter)
+        listener = Listener(address, family=family, authkey=authkey)
+    except Exception as e:
+        status.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    status.send(("ready", listener.address))
+    status.close()
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception:
+            # A client that fails authentication must not stop the backend
+            continue
+        threading.Thread(target=_serve_connection, args=(conn, handler),
+                         name=f"bapx-backend-{name}", daemon=True).start()
+
+
+class BackendProcess:
+    """A backend worker process serving one model on a local socket"""
+
+    def __init__(self, name, model, adapter=None):
+        self.name = name
+        self.model = model
+        self.adapter = adapter
+        self.authkey = os.urandom(32)
+        self.address = None
+        self._process = None
+        self._socket_dir = None
+
+    def start(self, timeout=DEFAULT_START_TIMEOUT):
+        """Start the worker and wait until it is listening (loading the model can take a while)"""
+        # spawn: the worker must not inherit the parent's threads or loaded models
+        context = multiprocessing.get_context("spawn")
+        if hasattr(socket, "AF_UNIX"):
+            family = "AF_UNIX"
+            self._socket_dir = tempfile.mkdtemp(prefix="bapx-router-")
+            address = os.path.join(self._socket_dir, f"{self.name}.sock")
+        else:
+            family, address = "AF_INET", ("127.0.0.1", 0)
+        status, child_status = context.Pipe(duplex=False)
+        self._process = context.Process(
+            target=_serve_backend,
+            args=(self.name, address, family, self.authkey, self.model, self.adapter, child_status),
+            name=f"bapx-backend-{self.name}",
+            daemon=True
+        )
+        self._process.start()
+        child_status.close()
+        try:
+            if not status.poll(timeout):
+                raise BackendUnavailable(f"{self.name} did not start within {timeout} s")
+            state, detail = status.recv()
+        except EOFError:
+            state, detail = "error", f"exited with code {self._process.exitcode}"
+        finally:
+            status.close()
+        if state != "ready":
+            self.stop()
+            raise BackendUnavailable(f"{self.name} failed to start: {detail}")
+        self.address = detail
+        logger.info("Backend %s serving %s", self.name, self.model, extra={"fields": {"pid": self._process.pid}})
+        return self
+
+    def is_alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            self._socket_dir = None
+
+
+class BackendClient:
+    """Pooled connections to one backend, with a concurrency limit and load shedding"""
+
+    def __init__(self, name, address, authkey, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_queue_depth=DEFAULT_MAX_QUEUE_DEPTH, queue_timeout=DEFAULT_QUEUE_TIMEOUT,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT):
+        self.name = name
+        self.address = address
+        self.authkey = authkey
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self._slots = threading.Semaphore(max_concurrency)
+        # Idle connections; at most one per concurrency slot
+        self._idle = []
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.shed = 0
+        self.errors = 0
+        self.connections = 0
+        self._busy_seconds = 0.0
+
+    def request(self, prompt, max_new_tokens=256):
+        """Send a prompt to the backend and return its text
+
+        Raises BackendSaturated when every slot is busy and max_queue_depth
+        requests are already waiting, BackendUnavailable when the backend
+        cannot be reached or times out, BackendError when it fails.
+        """
+        self._acquire_slot()
+        start = time.perf_counter()
+        conn = None
+        try:
+            conn = self._checkout()
+            conn.send((prompt, max_new_tokens))
+            if not conn.poll(self.request_timeout):
+                raise BackendUnavailable(f"{self.name} timed out after {self.request_timeout} s")
+            status, payload = conn.recv()
+        except BackendError:
+            conn = self._discard(conn)
+            raise
+        except (OSError, EOFError) as e:
+            conn = self._discard(conn)
+            raise BackendUnavailable(f"{self.name}: {e}") from e
+        finally:
+            with self._lock:
+                if conn is not None:
+                    self._idle.append(conn)
+                self.in_flight -= 1
+                self._busy_seconds += time.perf_counter() - start
+            self._slots.release()
+        if status != "ok":
+            with self._lock:
+                self.errors += 1
+            raise BackendError(f"{self.name}: {payload}")
+        return payload
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "max_concurrency": self.max_concurrency,
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "shed": self.shed,
+                "errors": self.errors,
+                "connections": self.connections,
+                "mean_latency_ms": round(self._busy_seconds / self.requests * 1000, 3) if self.requests else None
+            }
+
+    def _acquire_slot(self):
+        with self._lock:
+            if self._slots.acquire(blocking=False):
+                self.in_flight += 1
+                self.requests += 1
+                return
+            if self.waiting >= self.max_queue_depth:
+                self.shed += 1
+                raise BackendSaturated(f"{self.name} is saturated ({self.waiting} waiting)")
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.shed += 1
+                raise BackendSaturated(f"{self.name} had no free slot within {self.queue_timeout} s")
+            self.in_flight += 1
+            self.requests += 1
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        conn = Client(self.address, authkey=self.authkey)
+        with self._lock:
+            self.connections += 1
+        return conn
+
+    def _discard(self, conn):
+        """Close a connection that may be in an unknown state; returns None"""
+        with self._lock:
+            self.errors += 1
+        if conn is not None:
+            conn.close()
+        return None
+
+
+class DelegationRouter:
+    """Routes delegation targets to backend workers, falling back to the primary model"""
+
+    def __init__(self, backends, primary, fallback=None, processes=()):
+        # target name -> BackendClient
+        self.backends = backends
+        self.primary = primary
+        # Callable (prompt, max_new_tokens) -> text used when no backend can answer
+        self.fallback = fallback
+        self._processes = list(processes)
+
+    @classmethod
+    def from_config(cls, config, primary, fallback=None):
+        """Start a worker per configured backend; backends that fail to start are left out"""
+        backends = {}
+        processes = []
+        for name, settings in config.get("backends", {}).items():
+            settings = dict(settings)
+            process = BackendProcess(name, settings.pop("model"), settings.pop("adapter", None))
+            try:
+                process.start(settings.pop("start_timeout", DEFAULT_START_TIMEOUT))
+            except BackendUnavailable as e:
+                logger.warning("%s; its requests will fall back", e)
+                continue
+            processes.append(process)
+            backends[name] = BackendClient(name, process.address, process.authkey, **settings)
+        router = cls(backends, primary, fallback, processes)
+        atexit.register(router.close)
+        return router
+
+    def route(self, target, prompt, max_new_tokens=256):
+        """Answer prompt on target's backend, else the primary's, else the local fallback
+
+        Returns {"target", "served_by", "text", "fallback", "reasons"}; reasons
+        says why earlier choices were skipped. Raises BackendError if nothing
+        could answer.
+        """
+        reasons = []
+        for name in dict.fromkeys((target, self.primary)):
+            client = self.backends.get(name)
+            if client is None:
+                reasons.append(f"{name}: no backend")
+                continue
+            try:
+                text = client.request(prompt, max_new_tokens)
+            except BackendError as e:
+                reasons.append(str(e))
+                continue
+            return {"target": target, "served_by": name, "text": text, "fallback": name != target, "reasons": reasons}
+        if self.fallback is None:
+            raise BackendError("; ".join(reasons))
+        return {"target": target, "served_by": None, "text": self.fallback(prompt, max_new_tokens),
+                "fallback": True, "reasons": reasons}
+
+    def stats(self):
+        return {name: {**client.stats(), "alive": self._alive(name)} for name, client in self.backends.items()}
+
+    def close(self):
+        for client in self.backends.values():
+            client.close()
+        for process in self._processes:
+            process.stop()
+        self._processes = []
+
+    def _alive(self, name):
+        for process in self._processes:
+            if process.name == name:
+                return process.is_alive()
+        return None
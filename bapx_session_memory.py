@@ -0,0 +1,273 @@
+"""
+bapX Session Memory
+Bounded, indexed store for the coordinator's time-conscious changelog entries.
+
+Entries live in a fixed-capacity ring of __slots__ records, so appends are
+O(1) and memory is capped by max_entries no matter how long the process runs.
+Session ids are consecutive, so lookup by id is a direct ring slot; a deque
+of ids per delegation target indexes by target, and time ranges are found by
+bisecting the ring (entries are appended in time order).
+
+Entries leaving memory (over max_entries or older than max_age_seconds) are
+appended to an NDJSON spill file when spill_path is set, otherwise dropped.
+The spill file outlives the process, so session ids continue after the last
+spilled id instead of restarting at 1 (first_id can push them further, e.g.
+past the ids in a durable changelog).
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Bytes read at a time when looking for the last line of a spill file
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def last_spilled_id(spill_path):
+    """Session id of the last complete record in a spill file, or 0"""
+    try:
+        f = open(spill_path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b""
+        while end > 0:
+            start = max(end - TAIL_BLOCK_SIZE, 0)
+            f.seek(start)
+            tail = f.read(end - start) + tail
+            end = start
+            # A torn last line (no newline) is skipped; the line before it is complete
+            lines = tail.split(b"\n")[:-1]
+            if end > 0:
+                lines = lines[1:]
+            for line in reversed(lines):
+                try:
+                    return json.loads(line)["session_id"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+    return 0
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class SessionRecord:
+    """One changelog entry; timestamp is epoch seconds"""
+
+    __slots__ = ("session_id", "timestamp", "task", "delegation_target", "result", "query_analysis")
+
+    def __init__(self, session_id, timestamp, task, delegation_target, result, query_analysis=""):
+        self.session_id = session_id
+        self.timestamp = timestamp
+        self.task = task
+        self.delegation_target = delegation_target
+        self.result = result
+        self.query_analysis = query_analysis
+
+    def to_dict(self):
+        """The changelog entry layout the coordinator has always exposed"""
+        return {
+            "timestamp": datetime.fromtimestamp(self.timestamp).strftime(TIMESTAMP_FORMAT),
+            "task": self.task,
+            "delegation_target": self.delegation_target,
+            "result": self.result,
+            "query_analysis": self.query_analysis,
+            "session_id": self.session_id
+        }
+
+    def to_json(self):
+        return json.dumps({slot: getattr(self, slot) for slot in self.__slots__})
+
+    @classmethod
+    def from_json(cls, line):
+        return cls(**json.loads(line))
+
+
+class _TimeKeys:
+    """Sequence view of ring timestamps in logical (oldest first) order, for bisect"""
+
+    def __init__(self, memory):
+        self._memory = memory
+
+    def __len__(self):
+        return self._memory._count
+
+    def __getitem__(self, position):
+        return self._memory._at(position).timestamp
+
+
+class SessionMemory:
+    """Ring buffer of SessionRecords with retention, indexes and disk spill"""
+
+    def __init__(self, max_entries=10000, max_age_seconds=None, spill_path=None, first_id=1):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.spill_path = spill_path
+        self._ring = [None] * max_entries
+        self._head = 0
+        self._count = 0
+        self._next_id = max(first_id, last_spilled_id(spill_path) + 1 if spill_path else 1)
+        self._by_target = {}
+        self._spill_file = None
+        self._spilled = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        """Records held in memory, oldest first"""
+        return iter(self.snapshot())
+
+    def _at(self, position):
+        return self._ring[(self._head + position) % self.max_entries]
+
+    def append(self, task, delegation_target, result, query_analysis="", timestamp=None):
+        """Store a new entry and return its record; evicts the oldest entries as needed"""
+        with self._lock:
+            if timestamp is None:
+                timestamp = time.time()
+            if self._count:
+                # Keep the ring sorted by time even if the clock steps back
+                timestamp = max(timestamp, self._at(self._count - 1).timestamp)
+            self._expire(timestamp)
+            if self._count == self.max_entries:
+                self._evict()
+
+            record = SessionRecord(self._next_id, timestamp, task, delegation_target, result, query_analysis)
+            self._next_id += 1
+            self._ring[(self._head + self._count) % self.max_entries] = record
+            self._count += 1
+            self._by_target.setdefault(delegation_target, deque()).append(record.session_id)
+            return record
+
+    def _evict(self):
+        """Drop the oldest in-memory record, spilling it to disk if configured"""
+        record = self._ring[self._head]
+        self._ring[self._head] = None
+        self._head = (self._head + 1) % self.max_entries
+        self._count -= 1
+
+        ids = self._by_target[record.delegation_target]
+        ids.popleft()
+        if not ids:
+            del self._by_target[record.delegation_target]
+
+        if self.spill_path:
+            if self._spill_file is None:
+                directory = os.path.dirname(self.spill_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._spill_file = open(self.spill_path, 'a')
+                if self._spill_file.tell() and not _ends_with_newline(self.spill_path):
+                    # Terminate a torn last line so the next record starts on a line of its own
+                    self._spill_file.write("\n")
+            self._spill_file.write(record.to_json() + "\n")
+            self._spilled += 1
+
+    def _expire(self, now):
+        if self.max_age_seconds is None:
+            return
+        cutoff = now - self.max_age_seconds
+        while self._count and self._ring[self._head].timestamp < cutoff:
+            self._evict()
+
+    def expire(self):
+        """Apply age retention now (it is otherwise applied on append)"""
+        with self._lock:
+            self._expire(time.time())
+
+    def get(self, session_id):
+        """Record with the given session id if it is still in memory, else None"""
+        with self._lock:
+            if not self._count:
+                return None
+            position = session_id - self._at(0).session_id
+            if 0 <= position < self._count:
+                return self._at(position)
+            return None
+
+    def by_target(self, delegation_target, limit=None):
+        """In-memory records routed to a delegation target, oldest first (the newest limit if given)"""
+        with self._lock:
+            ids = self._by_target.get(delegation_target, ())
+            if limit is not None:
+                ids = list(ids)[-limit:] if limit > 0 else []
+            first_id = self._at(0).session_id if self._count else 0
+            return [self._at(session_id - first_id) for session_id in ids]
+
+    def between(self, start=None, end=None, include_spilled=False):
+        """Records with start <= timestamp < end (epoch seconds; None = unbounded), oldest first
+
+        include_spilled also streams matching entries back from the spill file.
+        """
+        records = list(self.iter_spilled(start, end)) if include_spilled else []
+        with self._lock:
+            keys = _TimeKeys(self)
+            low = 0 if start is None else bisect.bisect_left(keys, start)
+            high = self._count if end is None else bisect.bisect_left(keys, end)
+            records.extend(self._at(position) for position in range(low, high))
+        return records
+
+    def latest(self, limit):
+        """The newest limit records, oldest first"""
+        with self._lock:
+            return [self._at(position) for position in range(max(self._count - limit, 0), self._count)]
+
+    def snapshot(self):
+        """All in-memory records, oldest first"""
+        with self._lock:
+            return [self._at(position) for position in range(self._count)]
+
+    def iter_spilled(self, start=None, end=None):
+        """Stream spilled records in the time range back from disk"""
+        if not self.spill_path:
+            return
+        with self._lock:
+            if self._spill_file is not None:
+                self._spill_file.flush()
+        if not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Partially written tail
+                    return
+                try:
+                    record = SessionRecord.from_json(line)
+                except (ValueError, TypeError):
+                    # Torn or corrupt line, e.g. from a crash mid-write
+                    continue
+                if start is not None and record.timestamp < start:
+                    continue
+                if end is not None and record.timestamp >= end:
+                    break
+                yield record
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "max_age_seconds": self.max_age_seconds,
+                "targets": {target: len(ids) for target, ids in self._by_target.items()},
+                "spilled": self._spilled,
+                "next_session_id": self._next_id
+            }
+
+    def close(self):
+        """Flush and close the spill file"""
+        with self._lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
@@ -0,0 +1,341 @@
+"""
+bapX Training Runs
+Launches LoRA training runs and streams their metrics while they train.
+
+Each run is a child process of scripts/train_bapx_lora.py started from the
+project root with the coordinator's training parameters (LoRA rank,
+epochs, ...) on its command line. The child writes one JSON line per
+metrics update (step, loss, tokens/s, samples/s, memory) to a pipe whose
+file descriptor it gets in BAPX_METRICS_FD; a reader thread keeps the
+newest max_metrics of them in a ring buffer, numbered so a client can ask
+for everything after the last one it saw. stdout and stderr go to a log
+file in runs_dir, with the last lines kept in memory.
+
+Only one run may write to an output directory at a time: a second start
+for the same directory raises RunInProgress, and an advisory lock file in
+runs_dir, named after the directory's real path, keeps other coordinator
+processes out as well. The lock stays out of the output directory, so an
+adapter directory only exists once training has written to it.
+"""
+import hashlib
+import json
+import math
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-flight within this process only
+    fcntl = None
+
+from bapx_logging import get_logger
+
+DEFAULT_RUNS_DIR = os.path.join("output", "training_runs")
+DEFAULT_MAX_METRICS = 2000
+DEFAULT_MAX_LOG_LINES = 200
+TRAIN_SCRIPT = os.path.join("scripts", "train_bapx_lora.py")
+
+# training_params key -> command line option of the training script
+PARAM_OPTIONS = {
+    "lora_rank": "--lora-rank",
+    "lora_alpha": "--lora-alpha",
+    "epochs": "--epochs",
+    "learning_rate": "--learning-rate",
+    "task_focus": "--task-focus",
+    "time_consciousness": "--time-consciousness",
+    "identity": "--identity"
+}
+# Numeric training_params: key -> (type, lower bound (exclusive), upper bound), matching the script's argparse types
+PARAM_RANGES = {
+    "lora_rank": (int, 0, 1024),
+    "lora_alpha": (int, 0, 4096),
+    "epochs": (float, 0, 1000),
+    "learning_rate": (float, 0, 1)
+}
+MAX_TEXT_PARAM_LENGTH = 200
+
+logger = get_logger("training")
+
+
+class RunInProgress(Exception):
+    """Another run is already writing to the output directory"""
+
+
+def validate_params(params):
+    """Check training parameters against PARAM_RANGES (numbers) and as short text (the rest)
+
+    Raises ValueError naming the first bad parameter; None leaves the script's default.
+    """
+    for key in PARAM_OPTIONS:
+        value = params.get(key)
+        if value is None:
+            continue
+        if key in PARAM_RANGES:
+            kind, low, high = PARAM_RANGES[key]
+            number_types = (int,) if kind is int else (int, float)
+            if isinstance(value, bool) or not isinstance(value, number_types) or not math.isfinite(value):
+                raise ValueError(f"{key} must be {'an integer' if kind is int else 'a number'}")
+            if not low < value <= high:
+                raise ValueError(f"{key} must be greater than {low} and at most {high}")
+        elif not isinstance(value, str) or not value.strip() or len(value) > MAX_TEXT_PARAM_LENGTH:
+            raise ValueError(f"{key} must be a non-empty string of at most {MAX_TEXT_PARAM_LENGTH} characters")
+
+
+def training_command(params, output_dir, base_model=None, script=TRAIN_SCRIPT):
+    """Command line of the training script for a set of training parameters"""
+    command = [sys.executable, "-u", script, "--output-dir", output_dir]
+    for key, option in PARAM_OPTIONS.items():
+        if params.get(key) is not None:
+            # option=value, so a value starting with "-" is not taken for an option
+            command.append(f"{option}={params[key]}")
+    if base_model:
+        command += ["--", base_model]
+    return command
+
+
+class TrainingRun:
+    """One training child process, its metrics ring buffer and log tail"""
+
+    def __init__(self, run_id, params, output_dir, base_model, log_path, max_metrics, max_log_lines):
+        self.run_id = run_id
+        self.params = dict(params)
+        self.output_dir = output_dir
+        self.base_model = base_model
+        self.log_path = log_path
+        self.state = "starting"
+        self.returncode = None
+        self.error = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.finished_at = None
+        self.max_steps = None
+        self.metrics = deque(maxlen=max_metrics)
+        self.log_tail = deque(maxlen=max_log_lines)
+        # Number of the newest metrics record; records are numbered from 1
+        self.seq = 0
+        self.latest = {}
+        self.changed = threading.Condition()
+        self.process = None
+        self._lock_file = None
+        self._started = time.monotonic()
+
+    @property
+    def finished(self):
+        return self.state in ("succeeded", "failed", "cancelled")
+
+    def add_metrics(self, record):
+        with self.changed:
+            if record.get("event") == "begin":
+                self.max_steps = record.get("max_steps")
+            self.seq += 1
+            record = {"seq": self.seq, **record}
+            self.metrics.append(record)
+            self.latest.update((k, v) for k, v in record.items() if v is not None)
+            self.changed.notify_all()
+
+    def metrics_after(self, seq):
+        """Buffered metrics records numbered above seq (older ones may have left the buffer)"""
+        with self.changed:
+            return [record for record in self.metrics if record["seq"] > seq]
+
+    def snapshot(self, after=None):
+        """Status of the run; with after, also the buffered metrics past that number"""
+        with self.changed:
+            step = self.latest.get("step")
+            status = {
+                "run_id": self.run_id,
+                "state": self.state,
+                "pid": self.process.pid if self.process else None,
+                "output_dir": self.output_dir,
+                "base_model": self.base_model,
+                "params": self.params,
+                "step": step,
+                "max_steps": self.max_steps,
+                "progress": round(step / self.max_steps, 4) if step and self.max_steps else None,
+                "elapsed_seconds": round(time.monotonic() - self._started, 1),
+                "latest": dict(self.latest),
+                "seq": self.seq,
+                "returncode": self.returncode,
+                "error": self.error,
+                "log_path": self.log_path,
+                "log_tail": list(self.log_tail),
+                "created_at": self.created_at,
+                "finished_at": self.finished_at
+            }
+        if after is not None:
+            status["metrics"] = self.metrics_after(after)
+        return status
+
+    def finish(self, state, returncode=None, error=None):
+        with self.changed:
+            if self.finished:
+                return
+            self.state = state
+            self.returncode = returncode
+            self.error = error
+            self.finished_at = datetime.utcnow().isoformat()
+            self.changed.notify_all()
+
+
+class TrainingRunManager:
+    """Starts training runs, single-flight per output directory, and tracks their metrics"""
+
+    def __init__(self, project_root, runs_dir=DEFAULT_RUNS_DIR, max_metrics=DEFAULT_MAX_METRICS,
+                 max_log_lines=DEFAULT_MAX_LOG_LINES, script=TRAIN_SCRIPT):
+        self.project_root = os.path.abspath(project_root)
+        self.runs_dir = os.path.join(self.project_root, runs_dir)
+        self.max_metrics = max_metrics
+        self.max_log_lines = max_log_lines
+        self.script = script
+        self._runs = {}
+        # Real path of an output directory -> run writing to it
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def start(self, params, output_dir, base_model=None):
+        """Launch a run and return its status
+
+        Raises ValueError for invalid params (see validate_params) and
+        RunInProgress if output_dir is taken.
+        """
+        validate_params(params)
+        output_path = os.path.realpath(os.path.join(self.project_root, output_dir))
+        run_id = uuid.uuid4().hex
+        os.makedirs(self.runs_dir, exist_ok=True)
+        run = TrainingRun(run_id, params, output_dir, base_model, os.path.join(self.runs_dir, f"{run_id}.log"),
+                          self.max_metrics, self.max_log_lines)
+        with self._lock:
+            active = self._active.get(output_path)
+            if active is not None:
+                raise RunInProgress(f"Run {active.run_id} is already training into {output_dir}")
+            run._lock_file = self._lock_output_dir(output_path)
+            self._active[output_path] = run
+            self._runs[run_id] = run
+
+        read_fd, write_fd = os.pipe()
+        try:
+            env = dict(os.environ, BAPX_METRICS_FD=str(write_fd), PYTHONUNBUFFERED="1")
+            if base_model:
+                env["BASE_MODEL_NAME"] = base_model
+            run.process = subprocess.Popen(
+                training_command(params, output_dir, base_model, self.script),
+                cwd=self.project_root, env=env, pass_fds=(write_fd,),
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                # Own process group, so cancelling also stops dataloader workers
+                start_new_session=True
+            )
+        except Exception as e:
+            os.close(read_fd)
+            run.finish("failed", error=str(e))
+            self._release(output_path, run)
+            raise
+        finally:
+            os.close(write_fd)
+
+        run.state = "running"
+        logger.info("Training run %s started", run_id,
+                    extra={"fields": {"pid": run.process.pid, "output_dir": output_dir, "params": run.params}})
+        reader = threading.Thread(target=self._read_metrics, args=(run, read_fd),
+                                  name=f"bapx-train-metrics-{run_id[:8]}", daemon=True)
+        reader.start()
+        threading.Thread(target=self._watch, args=(run, output_path, reader),
+                         name=f"bapx-train-{run_id[:8]}", daemon=True).start()
+        return run.snapshot()
+
+    def get(self, run_id, after=None):
+        """Status of one run (with metrics past after, if given), or None"""
+        run = self._runs.get(run_id)
+        return run.snapshot(after) if run else None
+
+    def list(self):
+        """Status of all runs, newest first"""
+        with self._lock:
+            runs = list(self._runs.values())
+        return sorted((run.snapshot() for run in runs), key=lambda run: run["created_at"], reverse=True)
+
+    def cancel(self, run_id):
+        """Stop a running run; returns its status, or None if unknown"""
+        run = self._runs.get(run_id)
+        if run is None:
+            return None
+        if not run.finished and run.process is not None:
+            run.finish("cancelled")
+            try:
+                os.killpg(run.process.pid, signal.SIGTERM)
+            except (AttributeError, ProcessLookupError):
+                run.process.terminate()
+        return run.snapshot()
+
+    def follow(self, run_id, after=0, heartbeat=15.0):
+        """Yields ("metrics", record) as records arrive, ("heartbeat", None) while idle and
+        ("done", status) once the run has finished"""
+        run = self._runs[run_id]
+        while True:
+            with run.changed:
+                if run.seq <= after and not run.finished:
+                    run.changed.wait(heartbeat)
+                finished = run.finished
+            records = run.metrics_after(after)
+            for record in records:
+                after = record["seq"]
+                yield "metrics", record
+            if finished and not run.metrics_after(after):
+                yield "done", run.snapshot()
+                return
+            if not records:
+                yield "heartbeat", None
+
+    def _read_metrics(self, run, read_fd):
+        with os.fdopen(read_fd, 'r', encoding='utf-8') as metrics:
+            for line in metrics:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                run.add_metrics(record)
+
+    def _watch(self, run, output_path, reader):
+        """Copy the child's output to its log, then record how it exited"""
+        try:
+            with open(run.log_path, 'ab') as log:
+                for line in run.process.stdout:
+                    log.write(line)
+                    log.flush()
+                    run.log_tail.append(line.decode('utf-8', errors='replace').rstrip())
+            returncode = run.process.wait()
+            # Every metrics record is in the buffer before the run counts as finished
+            reader.join()
+            if returncode == 0:
+                run.finish("succeeded", returncode)
+            else:
+                run.finish("failed", returncode, f"Training exited with code {returncode}")
+            logger.info("Training run %s %s", run.run_id, run.state, extra={"fields": {"returncode": returncode}})
+        finally:
+            self._release(output_path, run)
+
+    def _lock_output_dir(self, output_path):
+        """Hold the advisory lock of an output directory; raises RunInProgress if another process has it"""
+        if fcntl is None:
+            return None
+        lock_name = hashlib.sha256(output_path.encode('utf-8')).hexdigest()
+        lock_file = open(os.path.join(self.runs_dir, f"{lock_name}.lock"), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RunInProgress(f"Another process is already training into {output_path}")
+        return lock_file
+
+    def _release(self, output_path, run):
+        with self._lock:
+            if self._active.get(output_path) is run:
+                del self._active[output_path]
+            if run._lock_file is not None:
+                run._lock_file.close()
+                run._lock_file = None
@@ -0,0 +1,109 @@
+"""
+bapX x8D Character Map
+Loads x8Dtensor.json once into an immutable 256-entry lookup table that is
+shared by the x8D pipeline (xCh, statefold, xIn) in bapx_coordinator.py,
+and provides the vectorized statefold kernel.
+
+The table is built lazily on first use, keyed by byte value, and rebuilt
+only when the backing file's mtime changes (hot reload).
+The file location is configurable through the BAPX_X8D_TENSOR environment
+variable or set_x8d_tensor_path().
+"""
+import functools
+import json
+import os
+import threading
+from types import MappingProxyType
+
+# Default x8D factor: each byte value maps to byte_val * 0.000000008
+X8D_FACTOR = 0.00000000800000000
+
+X8D_TENSOR_PATH = os.environ.get(
+    "BAPX_X8D_TENSOR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "x8Dtensor.json")
+)
+
+
+class X8DTable:
+    """Immutable x8D lookup table for all 256 byte values"""
+
+    __slots__ = ("path", "mtime_ns", "floats", "mapchar")
+
+    def __init__(self, path, mtime_ns, floats):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        # floats[byte_val] -> x8D float value
+        self.floats = tuple(floats)
+        # chr(byte_val) -> x8D float value, the layout xCh() has always used
+        self.mapchar = MappingProxyType({chr(i): v for i, v in enumerate(self.floats)})
+
+    def __len__(self):
+        return len(self.floats)
+
+    def __getitem__(self, byte_val):
+        return self.floats[byte_val]
+
+
+def build_x8d_table(path):
+    """Parse an x8Dtensor.json file into an X8DTable"""
+    mtime_ns = os.stat(path).st_mtime_ns
+    with open(path, 'r') as f:
+        x8d_data = json.load(f)
+
+    # Bytes missing from the file fall back to the default x8D mapping
+    floats = [byte_val * X8D_FACTOR for byte_val in range(256)]
+    for category, chars in x8d_data.get("categories", {}).items():
+        for codepoint, data in chars.items():
+            byte_val = int(data["ord"])
+            if 0 <= byte_val < 256:
+                floats[byte_val] = float(data["val"])
+
+    return X8DTable(path, mtime_ns, floats)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def set_x8d_tensor_path(path):
+    """Point the shared table at a different x8Dtensor.json (reloaded on next use)"""
+    global X8D_TENSOR_PATH, _table
+    with _table_lock:
+        X8D_TENSOR_PATH = path
+        _table = None
+
+
+def get_x8d_table():
+    """Return the shared X8DTable, rebuilding it only if the file changed"""
+    global _table
+    table = _table
+    path = X8D_TENSOR_PATH
+    if table is not None and table.path == path:
+        try:
+            if os.stat(path).st_mtime_ns == table.mtime_ns:
+                return table
+        except OSError:
+            # File went away after loading: keep serving the last good table
+            return table
+
+    with _table_lock:
+        table = _table
+        if table is None or table.path != X8D_TENSOR_PATH or os.stat(X8D_TENSOR_PATH).st_mtime_ns != table.mtime_ns:
+            table = build_x8d_table(X8D_TENSOR_PATH)
+            _table = table
+        return table
+
+
+@functools.lru_cache(maxsize=32)
+def statefold_table(xAt=X8D_FACTOR):
+    """256-byte translation table for the statefold transform at factor xAt
+
+    statefold is a fixed function of the byte value, so the whole transform
+    is precomputed once per xAt: table[b] == int(b * xAt) % 256.
+    """
+    return bytes([int(b * xAt) % 256 for b in range(256)])
+
+
+def statefold_bytes(data, xAt=X8D_FACTOR):
+    """Apply the statefold transform to bytes/bytearray in C via translate()"""
+    return data.translate(statefold_table(xAt))
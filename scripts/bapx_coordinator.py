@@ -5,50 +5,55 @@ Implements intelligent delegation to specialized Q8_0 models based on query anal
 """
 
 import datetime
+import functools
+import os
+import sys
+import time
 import yaml
-from typing import Dict, Any, Optional, List
-import re
-
-class BapXTimeConsciousCoordinator:
-    def __init__(self):
-        self.system_config = self._load_config()
-        self.session_memory = []
-        self.delegation_states = {}
-
-        print("bapX Time-Conscious AGI Research System initialized")
-        print(f"Primary Model: {self.system_config['primary_model']}")
-        print(f"Time consciousness rule priority: {self.system_config['training_rules']['time_consciousness_rule']['priority']}")
-        print(f"Delegation rules defined: {len(self.system_config['training_rules']['delegation_rules'])}")
-        print(f"Operational constraints: {len(self.system_config['operational_constraints'])}")
-        print(f"Time-conscious philosophy loaded: {len(self.system_config['identity_override']['awareness'])} awareness points")
-
-    def _load_config(self) -> Dict[str, Any]:
-        """Load the system configuration"""
-        with open('configs/bapx_config.yaml', 'r') as f:
-            return yaml.safe_load(f)
-
-    def note_current_time(self) -> str:
-        """Note the current time and date"""
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"Current session time: {current_time}")
-        return current_time
-
-    def create_changelog_entry(self, task: str, delegation_target: str, result: str, query_analysis: str = ""):
-        """Create a time-based changelog entry for delegation decision"""
-        timestamp = self.note_current_time()
-        entry = {
-            "timestamp": timestamp,
-            "task": task,
-            "delegation_target": delegation_target,
-            "result": result,
-            "query_analysis": query_analysis,
-            "session_id": len(self.session_memory) + 1
-        }
-        self.session_memory.append(entry)
-        print(f"Time-conscious log created for task to {delegation_target}: {task}")
-
-    def analyze_query_for_delegation(self, task_description: str) -> Dict[str, Any]:
-        """Analyze query to determine if delegation is needed"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bapx_changelog import ChangelogReader, ChangelogWriter
+from bapx_classifier import KeywordClassifier
+from bapx_logging import configure_logging, get_logger, request_context, sample_timing
+from bapx_router import BackendError, DelegationRouter
+from bapx_session_memory import SessionMemory
+
+logger = get_logger("coordinator")
+
+# Keywords suggesting the primary model should answer natively (substring match)
+NATIVE_KEYWORDS = ['explain', 'discuss', 'analyze text', 'summarize', 'translate', 'reason', 'thought', 'question', 'how to', 'why', 'describe', 'agi research', 'time conscious']
+
+# Bound on memoized analyses of repeated task strings
+ANALYSIS_CACHE_SIZE = 4096
+
+# Config entries the coordinator cannot run without, as key paths
+REQUIRED_CONFIG_KEYS = [("primary_model",), ("training_rules", "delegation_rules")]
+
+# Batches at least this large may be spread over a process pool
+BATCH_PARALLEL_THRESHOLD = 50000
+
+class DelegationAnalyzer:
+    """Compiled delegation rules: memoized query analysis and target selection
+
+    Holds no session memory, changelog or backend router, so batch pool
+    workers can build one cheaply.
+    """
+
+    def __init__(self, delegation_rules: List[Dict[str, Any]], primary_model: str):
+        self.delegation_rules = delegation_rules
+        self.primary_model = primary_model
+        # All delegation rule keywords in one word-boundary matcher
+        self._matcher = KeywordClassifier(
+            ((index, rule['keywords']) for index, rule in enumerate(delegation_rules)),
+            word_boundary=True
+        )
+        # Memoized analyses of repeated task strings; treat results as read-only
+        self.analyze = functools.lru_cache(maxsize=ANALYSIS_CACHE_SIZE)(self._analyze)
+
+    def _analyze(self, task_description: str) -> Dict[str, Any]:
+        """Single-pass delegation analysis"""
         analysis = {
             "query": task_description,
             "delegation_triggers": {},
@@ -56,40 +61,22 @@ class BapXTimeConsciousCoordinator:
             "native_handling_suggested": False
         }
 
-        # Check delegation rules
-        for rule in self.system_config['training_rules']['delegation_rules']:
-            condition = rule['condition']
-            keywords = rule['keywords']
-            matches = []
-
-            for keyword in keywords:
-                if re.search(r'\b' + re.escape(keyword.lower()) + r'\b', task_description.lower()):
-                    matches.append(keyword)
-
-            if matches:
+        # Check delegation rules: one scan finds every rule's keywords
+        task_lower = task_description.lower()
+        found = self._matcher.scan(task_lower)
+        for index, rule in enumerate(self.delegation_rules):
+            if index in found:
+                matches = [keyword for keyword in rule['keywords'] if keyword.lower() in found[index]]
                 analysis['delegation_triggers'][rule['delegate_to']] = matches
                 analysis['confidence_scores'][rule['delegate_to']] = len(matches)
 
         # Determine if native handling is more appropriate
-        native_keywords = ['explain', 'discuss', 'analyze text', 'summarize', 'translate', 'reason', 'thought', 'question', 'how to', 'why', 'describe', 'agi research', 'time conscious']
-        for keyword in native_keywords:
-            if keyword.lower() in task_description.lower():
-                analysis['native_handling_suggested'] = True
-                break
+        analysis['native_handling_suggested'] = any(keyword in task_lower for keyword in NATIVE_KEYWORDS)
 
         return analysis
 
-    def decide_delegation(self, task_description: str, input_type: str = "text") -> str:
-        """Decide whether to delegate to another Q8_0 model or handle natively"""
-        print(f"\nAnalyzing for AGI research time-conscious delegation: {task_description}")
-
-        # Perform query analysis
-        analysis = self.analyze_query_for_delegation(task_description)
-        print(f"Delegation analysis: {analysis['delegation_triggers']}")
-
-        # Check delegation conditions
-        primary_model = self.system_config['primary_model']
-
+    def select(self, analysis: Dict[str, Any]) -> Tuple[str, str]:
+        """Pick the target for an analysis: (target, "delegated" | "native" | "default")"""
         # Check if any delegation rules apply
         max_confidence = 0
         selected_delegation = None
@@ -102,57 +89,206 @@ class BapXTimeConsciousCoordinator:
         # Apply delegation logic
         if selected_delegation:
             # Check if this fits delegation conditions
-            delegation_reasonable = False
-            for rule in self.system_config['training_rules']['delegation_rules']:
+            for rule in self.delegation_rules:
                 if rule['delegate_to'] in selected_delegation and selected_delegation in analysis['delegation_triggers']:
-                    delegation_reasonable = True
-                    break
-
-            if delegation_reasonable:
-                print(f"Delegation decision: to {selected_delegation}")
-                return selected_delegation
+                    return selected_delegation, "delegated"
         else:
             # Check if the query suggests native handling
             if analysis['native_handling_suggested']:
-                print(f"Native handling decision: {primary_model}")
-                return primary_model
+                return self.primary_model, "native"
 
         # Default to primary model if no specific delegation trigger
-        print(f"Defaulting to native handling: {primary_model}")
-        return primary_model
+        return self.primary_model, "default"
+
+    def decide_batch(self, tasks: List[str]) -> List[Dict[str, Any]]:
+        """{query, decision, outcome, confidence, triggers} for each task, in order"""
+        decisions = []
+        for task in tasks:
+            analysis = self.analyze(task)
+            target, outcome = self.select(analysis)
+            decisions.append({
+                "query": task,
+                "decision": target,
+                "outcome": outcome,
+                "confidence": analysis['confidence_scores'].get(target, 0),
+                "triggers": {target: list(matches) for target, matches in analysis['delegation_triggers'].items()}
+            })
+        return decisions
 
-    def process_request(self, task: str, input_type: str = "text", input_data: Optional[str] = None):
-        """Process a request with time-conscious delegation decision-making"""
-        print(f"\n{'='*70}")
-        print(f"Processing request at: {self.note_current_time()}")
-        print(f"Task: {task}")
-        print(f"Input type: {input_type}")
 
-        # Decide whether to delegate or handle natively
-        delegation_decision = self.decide_delegation(task, input_type)
+class BapXTimeConsciousCoordinator:
+    def __init__(self, config_path: str = 'configs/bapx_config.yaml'):
+        self.config_path = config_path
+        self.system_config = self._load_config()
+        # Durable changelog, if a changelog directory is configured
+        changelog_config = self.system_config.get('changelog')
+        # Session ids continue after the newest durable entry of a previous run
+        last_entry = ChangelogReader(changelog_config['directory']).last() if changelog_config else None
+        first_id = last_entry.get('session_id', 0) + 1 if last_entry else 1
+        # Bounded changelog; settings come from the optional session_memory config section
+        self.session_memory = SessionMemory(**self.system_config.get('session_memory', {}), first_id=first_id)
+        self.changelog = ChangelogWriter(**changelog_config) if changelog_config else None
+        # Specialist backend workers, if enabled in the delegation_backends config section
+        router_config = self.system_config.get('delegation_backends') or {}
+        self.router = (DelegationRouter.from_config(router_config, self.system_config['primary_model'])
+                       if router_config.get('enabled') else None)
+        self.delegation_states = {}
+        self._compile_delegation_rules()
+
+        logger.info("bapX Time-Conscious AGI Research System initialized", extra={"fields": {
+            "primary_model": self.system_config['primary_model'],
+            "time_consciousness_priority":
+                self.system_config['training_rules'].get('time_consciousness_rule', {}).get('priority'),
+            "delegation_rules": len(self.system_config['training_rules']['delegation_rules']),
+            "operational_constraints": len(self.system_config.get('operational_constraints') or []),
+            "awareness_points": len((self.system_config.get('identity_override') or {}).get('awareness') or [])
+        }})
+
+    def _load_config(self) -> Dict[str, Any]:
+        """Load the system configuration; raises ValueError naming any missing REQUIRED_CONFIG_KEYS"""
+        with open(self.config_path, 'r') as f:
+            config = yaml.safe_load(f) or {}
+        missing = []
+        for path in REQUIRED_CONFIG_KEYS:
+            section = config
+            for key in path:
+                section = section.get(key) if isinstance(section, dict) else None
+            if section is None:
+                missing.append(".".join(path))
+        if missing:
+            raise ValueError(f"{self.config_path} is missing {', '.join(missing)} "
+                             "(see primary_model and training_rules in configs/bapx_config.yaml)")
+        return config
+
+    def _compile_delegation_rules(self):
+        """Compile all delegation rule keywords into one word-boundary matcher"""
+        self.analyzer = DelegationAnalyzer(self.system_config['training_rules']['delegation_rules'],
+                                           self.system_config['primary_model'])
+
+    def reload_config(self) -> bool:
+        """Reload the configuration; rebuild matchers only if it changed"""
+        config = self._load_config()
+        if config == self.system_config:
+            return False
+        self.system_config = config
+        self._compile_delegation_rules()
+        return True
+
+    def note_current_time(self) -> str:
+        """Note the current time and date"""
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        logger.debug("Current session time: %s", current_time)
+        return current_time
+
+    def create_changelog_entry(self, task: str, delegation_target: str, result: str, query_analysis: str = ""):
+        """Create a time-based changelog entry for delegation decision"""
+        record = self.session_memory.append(task, delegation_target, result, query_analysis)
+        if self.changelog is not None:
+            self.changelog.append({
+                "session_id": record.session_id,
+                "task": task,
+                "delegation_target": delegation_target,
+                "result": result,
+                "query_analysis": query_analysis
+            }, record.timestamp)
+        logger.debug("Time-conscious log %d created for task to %s: %s", record.session_id, delegation_target, task)
+        return record
 
-        # Simulate processing (in a real system, this would call the appropriate model)
-        query_analysis = self.analyze_query_for_delegation(task)
-        print(f"Delegation decision: {delegation_decision}")
+    def analyze_query_for_delegation(self, task_description: str) -> Dict[str, Any]:
+        """Analyze query to determine if delegation is needed"""
+        analysis = self.analyzer.analyze(task_description)
+        # Hand out copies so callers cannot alter the memoized analysis
+        return {
+            **analysis,
+            "delegation_triggers": {target: list(matches) for target, matches in analysis['delegation_triggers'].items()},
+            "confidence_scores": dict(analysis['confidence_scores'])
+        }
 
-        # Create changelog entry
-        result = f"Processed '{task}' with time-conscious delegation: {delegation_decision}"
-        self.create_changelog_entry(task, delegation_decision, result, str(query_analysis['delegation_triggers']))
+    def decide_delegation(self, task_description: str, input_type: str = "text", analysis: Optional[Dict[str, Any]] = None) -> str:
+        """Decide whether to delegate to another Q8_0 model or handle natively"""
+        logger.debug("Analyzing for AGI research time-conscious delegation: %s", task_description)
+
+        # Perform query analysis (unless the caller already has it)
+        if analysis is None:
+            analysis = self.analyze_query_for_delegation(task_description)
+        logger.debug("Delegation analysis: %s", analysis['delegation_triggers'])
+
+        target, outcome = self.analyzer.select(analysis)
+        if outcome == "delegated":
+            logger.debug("Delegation decision: to %s", target)
+        elif outcome == "native":
+            logger.debug("Native handling decision: %s", target)
+        else:
+            logger.debug("Defaulting to native handling: %s", target)
+        return target
 
-        print(f"Result: {result}")
-        print(f"{'='*70}\n")
+    def decide_delegation_batch(self, tasks: List[str], workers: int = 1) -> List[Dict[str, Any]]:
+        """Route many tasks in one call without per-task console output
 
-        return result
+        Returns one {query, decision, outcome, confidence, triggers} dict per
+        task, in order. Batches of at least BATCH_PARALLEL_THRESHOLD tasks are
+        split across a process pool when workers > 1.
+        """
+        if workers > 1 and len(tasks) >= BATCH_PARALLEL_THRESHOLD:
+            chunk_size = -(-len(tasks) // (workers * 4))
+            chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                     initargs=(self.analyzer.delegation_rules, self.analyzer.primary_model)) as pool:
+                return [decision for chunk in pool.map(_decide_batch_chunk, chunks) for decision in chunk]
 
-    def get_session_memory(self) -> List[Dict[str, Any]]:
-        """Get the current session memory"""
-        return self.session_memory
+        return self.analyzer.decide_batch(tasks)
 
-    def verify_delegation_states(self):
-        """Verify current delegation states and decisions"""
-        print(f"Time-conscious session memory contains {len(self.session_memory)} entries")
-        for i, entry in enumerate(self.session_memory):
-            print(f"  {i+1}. Task: {entry['task'][:50]}... | Delegation: {entry['delegation_target']} | Time: {entry['timestamp']}")
+    def process_request(self, task: str, input_type: str = "text", input_data: Optional[str] = None):
+        """Process a request with time-conscious delegation decision-making
+
+        Per-request detail is logged at DEBUG; a sample of request timings is
+        logged on bapx.timing (see bapx_logging).
+        """
+        with request_context():
+            start = time.perf_counter()
+            logger.debug("Processing request", extra={"fields": {"task": task, "input_type": input_type}})
+
+            # Analyze once, then decide whether to delegate or handle natively
+            query_analysis = self.analyze_query_for_delegation(task)
+            delegation_decision = self.decide_delegation(task, input_type, query_analysis)
+
+            result = None
+            if self.router is not None:
+                try:
+                    routed = self.router.route(delegation_decision, task)
+                    result = routed['text']
+                    logger.debug("Served by %s", routed['served_by'] or "local fallback",
+                                 extra={"fields": {"fallback": routed['fallback'], "reasons": routed['reasons']}})
+                except BackendError as e:
+                    logger.warning("No backend could answer for %s: %s", delegation_decision, e)
+            if result is None:
+                # Simulate processing when no backend is configured or available
+                result = f"Processed '{task}' with time-conscious delegation: {delegation_decision}"
+
+            # Create changelog entry
+            self.create_changelog_entry(task, delegation_decision, result, str(query_analysis['delegation_triggers']))
+
+            logger.debug("Result: %s", result)
+            sample_timing("process_request", time.perf_counter() - start, decision=delegation_decision)
+            return result
+
+    def read_changelog(self, start: Optional[float] = None, end: Optional[float] = None):
+        """Stream durable changelog entries with start <= ts < end (epoch seconds)"""
+        if self.changelog is None:
+            return iter(())
+        return ChangelogReader(self.changelog.directory).read(start, end)
+
+    def get_session_memory(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get the in-memory session entries, oldest first (only the newest limit if given)"""
+        records = self.session_memory.snapshot() if limit is None else self.session_memory.latest(limit)
+        return [record.to_dict() for record in records]
+
+    def verify_delegation_states(self, limit: int = 20):
+        """Verify current delegation states and decisions (the newest limit entries)"""
+        stats = self.session_memory.stats()
+        print(f"Time-conscious session memory contains {stats['entries']} entries ({stats['spilled']} spilled to disk)")
+        for entry in self.get_session_memory(limit):
+            print(f"  {entry['session_id']}. Task: {entry['task'][:50]}... | Delegation: {entry['delegation_target']} | Time: {entry['timestamp']}")
 
     def run_time_conscious_demo(self):
         """Run a demonstration of the time-conscious AGI research approach"""
@@ -187,7 +323,22 @@ class BapXTimeConsciousCoordinator:
         print(f"- Time-conscious processing with all decisions")
 
 
+_batch_worker = None
+
+
+def _init_batch_worker(delegation_rules: List[Dict[str, Any]], primary_model: str):
+    """Process pool initializer: one analyzer per worker process (no backends, session memory or changelog)"""
+    global _batch_worker
+    _batch_worker = DelegationAnalyzer(delegation_rules, primary_model)
+
+
+def _decide_batch_chunk(tasks: List[str]) -> List[Dict[str, Any]]:
+    return _batch_worker.decide_batch(tasks)
+
+
 def main():
+    # The demo logs as text unless the environment says otherwise (BAPX_LOG_LEVEL=DEBUG for per-request detail)
+    configure_logging(fmt=os.environ.get("BAPX_LOG_FORMAT", "text"))
     print("Starting bapX Time-Conscious AGI Research Coordinator...")
     coordinator = BapXTimeConsciousCoordinator()
 
@@ -0,0 +1,751 @@
+"""
+bapX Micro-Benchmarks
+Measures the hot paths of the bapX coordinator so performance changes can be
+compared before/after.
+
+Usage (from the project root):
+    python scripts/benchmark_bapx.py x8d
+    python scripts/benchmark_bapx.py statefold --size-mb 64
+    python scripts/benchmark_bapx.py classifier
+    python scripts/benchmark_bapx.py delegation --queries 100000
+    python scripts/benchmark_bapx.py changelog --entries 1000000
+    python scripts/benchmark_bapx.py batching --model sshleifer/tiny-gpt2
+    python scripts/benchmark_bapx.py prefix --model sshleifer/tiny-gpt2 --preamble-tokens 512
+    python scripts/benchmark_bapx.py router --requests 2000 --clients 32
+    python scripts/benchmark_bapx.py download --size-mb 256
+    python scripts/benchmark_bapx.py dataset --tokenizer sshleifer/tiny-gpt2 --samples 1000000
+    python scripts/benchmark_bapx.py packing --samples 200000
+    python scripts/benchmark_bapx.py packing --tokenizer Qwen/Qwen3-8B
+    python scripts/benchmark_bapx.py adapters --model sshleifer/tiny-gpt2 --adapters 4
+    python scripts/benchmark_bapx.py export --hidden-size 256 --layers 4
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def timeit(fn, iterations):
+    """Return the mean latency of fn() in microseconds"""
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def report(name, before_us, after_us):
+    """Print a before/after latency line"""
+    speedup = before_us / after_us if after_us else float("inf")
+    print(f"{name:<40} before {before_us:>10.2f} us   after {after_us:>10.2f} us   ({speedup:.1f}x)")
+
+
+def bench_x8d(args):
+    """Per-request x8D input processing: JSON parse per call vs shared table"""
+    import bapx_coordinator
+    from bapx_x8d import X8D_TENSOR_PATH
+
+    def legacy_xIn(tnput):
+        # Pre-table behaviour: re-open and parse x8Dtensor.json on every call
+        with open(X8D_TENSOR_PATH, 'r') as f:
+            x8d_data = json.load(f)
+        mapchar = {}
+        for category, chars in x8d_data.get("categories", {}).items():
+            for codepoint, data in chars.items():
+                mapchar[chr(int(data["ord"]))] = float(data["val"])
+        for byte_val in tnput:
+            if chr(byte_val) not in mapchar:
+                mapchar[chr(byte_val)] = byte_val * 0.00000000800000000
+        return bytes([int(b * 0.00000000800000000) % 256 for b in tnput])
+
+    query = ("How can I optimize my AGI research workflow? " * 4).encode('utf-8')
+    if legacy_xIn(query) != bapx_coordinator.xIn(query):
+        raise SystemExit("x8D output mismatch between legacy and table-backed xIn")
+
+    before = timeit(lambda: legacy_xIn(query), args.iterations)
+    after = timeit(lambda: bapx_coordinator.xIn(query), args.iterations)
+    report("xIn per request", before, after)
+
+
+def bench_statefold(args):
+    """statefold throughput: per-byte Python loop vs 256-entry translate table"""
+    from bapx_x8d import X8D_FACTOR, statefold_bytes
+
+    def legacy_statefold(data, xAt):
+        return bytes([int(b * xAt) % 256 for b in data])
+
+    # Identical-output check over random inputs and every xAt the project uses
+    rng = random.Random(args.seed)
+    factors = [X8D_FACTOR, 1.0, 0.5, 8.0, 8 * 8 * 8 * 0.00000001 / 64, 3.14159, -2.5]
+    for xAt in factors:
+        for _ in range(50):
+            data = rng.randbytes(rng.randint(0, 4096))
+            if statefold_bytes(data, xAt) != legacy_statefold(data, xAt):
+                raise SystemExit(f"statefold mismatch for xAt={xAt!r}")
+    print(f"statefold parity verified for {len(factors)} factors x 50 random inputs")
+
+    data = rng.randbytes(args.size_mb * 1024 * 1024)
+    start = time.perf_counter()
+    legacy_statefold(data[:1024 * 1024], X8D_FACTOR)
+    before = time.perf_counter() - start  # seconds per MB
+    start = time.perf_counter()
+    statefold_bytes(data, X8D_FACTOR)
+    after = (time.perf_counter() - start) / args.size_mb
+    print(f"{'statefold throughput':<40} before {1 / before:>10.1f} MB/s   after {1 / after:>10.1f} MB/s   ({before / after:.0f}x)")
+
+
+def bench_classifier(args):
+    """Query classification over a routing corpus: sequential scans vs single-pass classifier, by vocabulary size
+
+    The coordinator reports per-keyword counts (task_matches, triggers), so the
+    like-for-like baseline is a str.find scan that counts every keyword. The
+    category-only any() scan the coordinator used before is shown for reference;
+    it stops at the first matching category and computes no counts.
+    """
+    import yaml
+    from bapx_classifier import DEFAULT_CONFIG_PATH, KeywordClassifier
+
+    with open(DEFAULT_CONFIG_PATH, 'r') as f:
+        config_categories = [(entry["task_type"], entry["keywords"]) for entry in yaml.safe_load(f)["task_classification"]]
+
+    rng = random.Random(args.seed)
+    corpus = sorted(set(make_query_corpus(20000, args.seed)))[:500]
+
+    def category_only(categories, text):
+        text = text.lower()
+        for category, keywords in categories:
+            if any(keyword in text for keyword in keywords):
+                return category
+        return None
+
+    def count_scan(categories, text):
+        text = text.lower()
+        matches = {}
+        for category, keywords in categories:
+            for keyword in keywords:
+                start = text.find(keyword)
+                while start != -1:
+                    counts = matches.setdefault(category, {})
+                    counts[keyword] = counts.get(keyword, 0) + 1
+                    start = text.find(keyword, start + 1)
+        return next((category for category, _ in categories if category in matches), None), matches
+
+    def per_query(fn):
+        return timeit(lambda: [fn(query) for query in corpus], max(args.iterations // 100, 5)) / len(corpus)
+
+    for extra in (0, 1000, 10000):
+        # Grow the taxonomy with synthetic routing keywords that never match
+        categories = [
+            (category, keywords + ["".join(rng.choice("bcdfghjklmnpqrstvwxz") for _ in range(rng.randint(5, 12)))
+                                   for _ in range(extra // len(config_categories))])
+            for category, keywords in config_categories
+        ]
+        classifier = KeywordClassifier(categories)
+        for query in corpus:
+            if classifier.classify(query) != count_scan(categories, query) or \
+                    classifier.classify(query)[0] != category_only(categories, query):
+                raise SystemExit(f"classifier mismatch with sequential keyword scans for {query!r}")
+        vocabulary = sum(len(keywords) for _, keywords in categories)
+        before = per_query(lambda query: count_scan(categories, query))
+        after = per_query(classifier.classify)
+        report(f"classify, {vocabulary} keywords", before, after)
+        print(f"{'':<40} category only, no counts: {per_query(lambda query: category_only(categories, query)):.2f} us")
+
+
+def make_query_corpus(size, seed=8):
+    """Realistic routing corpus: templated queries with a heavy head of repeats"""
+    rng = random.Random(seed)
+    templates = [
+        "Write a {lang} function to {task}", "Help me debug this {lang} code", "Fix this {lang} syntax error in my script",
+        "Generate image of {subject} for a tech startup", "Make logo for {subject}", "Create visual artwork showing {subject}",
+        "Explain the concept of {topic}", "Describe how {topic} works", "What is {topic} and why does it matter?",
+        "How can I optimize my AGI research workflow for {topic}?", "Summarize the latest thinking on {topic}",
+        "What are your thoughts on {topic}?", "Tell me about {subject} and {topic}"
+    ]
+    fill = {
+        "lang": ["Python", "JavaScript", "Java", "C++", "Rust", "Go"],
+        "task": ["calculate fibonacci", "parse a CSV file", "sort a list", "call a REST API", "train a model"],
+        "subject": ["a futuristic city", "a coffee shop", "a robot", "the ocean", "a mountain range"],
+        "topic": ["quantum computing", "AI safety", "time consciousness", "neural networks", "climate models"]
+    }
+    unique = []
+    for _ in range(max(size // 20, 1)):
+        template = rng.choice(templates)
+        unique.append(template.format(**{key: rng.choice(values) for key, values in fill.items()}) + f" #{rng.randint(0, 999)}")
+    # Zipf-like popularity: a small head of queries dominates the traffic
+    weights = [1 / (rank + 1) for rank in range(len(unique))]
+    return rng.choices(unique, weights=weights, k=size)
+
+
+def legacy_delegation_analysis(rules, task_description):
+    """Pre-compilation analyze_query_for_delegation(): one re.search per keyword"""
+    analysis = {"query": task_description, "delegation_triggers": {}, "confidence_scores": {}, "native_handling_suggested": False}
+    for rule in rules:
+        matches = []
+        for keyword in rule['keywords']:
+            if re.search(r'\b' + re.escape(keyword.lower()) + r'\b', task_description.lower()):
+                matches.append(keyword)
+        if matches:
+            analysis['delegation_triggers'][rule['delegate_to']] = matches
+            analysis['confidence_scores'][rule['delegate_to']] = len(matches)
+    native_keywords = ['explain', 'discuss', 'analyze text', 'summarize', 'translate', 'reason', 'thought', 'question', 'how to', 'why', 'describe', 'agi research', 'time conscious']
+    for keyword in native_keywords:
+        if keyword.lower() in task_description.lower():
+            analysis['native_handling_suggested'] = True
+            break
+    return analysis
+
+
+@contextlib.contextmanager
+def benchmark_coordinator():
+    """A BapXTimeConsciousCoordinator over the delegation rules in configs/bapx_config.yaml"""
+    import yaml
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+    from bapx_coordinator import BapXTimeConsciousCoordinator
+
+    with open(os.path.join(PROJECT_ROOT, "configs", "bapx_config.yaml"), 'r') as f:
+        project_config = yaml.safe_load(f)
+    # The coordinator's own sections, without the session memory spill file, changelog and backends
+    config = {key: project_config[key] for key in
+              ("primary_model", "training_rules", "operational_constraints", "identity_override")}
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "bapx_config.yaml")
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(config, f)
+        yield BapXTimeConsciousCoordinator(config_path)
+
+
+def bench_delegation(args):
+    """Delegation analysis over a query corpus: per-keyword re.search vs compiled matcher + LRU"""
+    corpus = make_query_corpus(args.queries, args.seed)
+    with benchmark_coordinator() as coordinator:
+        rules = coordinator.system_config['training_rules']['delegation_rules']
+        for query in set(corpus):
+            if coordinator.analyze_query_for_delegation(query) != legacy_delegation_analysis(rules, query):
+                raise SystemExit(f"delegation analysis mismatch for {query!r}")
+        coordinator.reload_config()
+
+        def run(analyze):
+            start = time.perf_counter()
+            for query in corpus:
+                analyze(query)
+            return time.perf_counter() - start
+
+        before = run(lambda query: legacy_delegation_analysis(rules, query))
+        uncached = run(coordinator.analyzer._analyze)
+        coordinator.analyzer.analyze.cache_clear()
+        cached = run(coordinator.analyze_query_for_delegation)
+
+        # Full routing decisions through the batch entry point
+        coordinator.analyzer.analyze.cache_clear()
+        start = time.perf_counter()
+        coordinator.decide_delegation_batch(corpus, workers=args.workers)
+        batch = time.perf_counter() - start
+
+    print(f"{len(corpus)} queries, {len(set(corpus))} distinct")
+    for name, elapsed in (("per-keyword re.search", before), ("compiled matcher", uncached),
+                          ("compiled matcher + LRU", cached), (f"decide_delegation_batch, {args.workers} worker(s)", batch)):
+        print(f"{name:<40} {elapsed:>8.3f} s   {len(corpus) / elapsed:>12,.0f} queries/s")
+
+
+def bench_changelog(args):
+    """Changelog append latency on the request path and time-range query latency"""
+    from bapx_changelog import ChangelogReader, ChangelogWriter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = ChangelogWriter(tmp)
+        entry = {"session_id": 0, "task": "Write a Python function", "delegation_target": "bapXcoder",
+                 "result": "Processed", "query_analysis": "{'bapXcoder': ['python', 'function']}"}
+        base = time.time()
+        start = time.perf_counter()
+        for i in range(args.entries):
+            writer.append(entry, base + i * 0.001)
+        append = time.perf_counter() - start
+        writer.close()
+        drain = time.perf_counter() - start
+
+        reader = ChangelogReader(tmp)
+        rng = random.Random(args.seed)
+        span = args.entries * 0.001
+        print(f"{args.entries} entries appended: {append / args.entries * 1e6:.2f} us/append, "
+              f"written and fsynced in {drain:.2f} s")
+        for window in (0.1, 1.0, 60.0):
+            offset = rng.uniform(0, max(span - window, 0))
+            start = time.perf_counter()
+            count = sum(1 for _ in reader.read(base + offset, base + offset + window))
+            elapsed = time.perf_counter() - start
+            print(f"range of {window:>6.1f} s ({count:>6} entries)   {elapsed * 1000:>10.2f} ms")
+
+
+def bench_batching(args):
+    """Generation throughput (tokens/s) of the batching scheduler vs batch size on a CPU model"""
+    from concurrent.futures import wait as wait_futures
+
+    from bapx_batching import BatchScheduler
+    from bapx_models import ModelManager
+
+    manager = ModelManager()
+    resident = manager.load(args.model)
+    rng = random.Random(args.seed)
+    topics = ["quantum computing", "time consciousness", "python decorators", "neural networks", "AGI research"]
+    prompts = [f"### Instruction:\nExplain {rng.choice(topics)} in {rng.randint(1, 5)} sentences.\n\n"
+               f"### Input:\n\n### Response:\n" for _ in range(args.requests)]
+
+    print(f"{args.model}: {args.requests} concurrent requests, {args.max_new_tokens} new tokens each")
+    for batch_size in args.batch_sizes:
+        scheduler = BatchScheduler(resident, max_batch_size=batch_size, max_wait_ms=args.max_wait_ms,
+                                   max_new_tokens=args.max_new_tokens)
+        scheduler.generate(prompts[0])  # warm-up
+        start = time.perf_counter()
+        wait_futures([scheduler.submit(prompt) for prompt in prompts])
+        elapsed = time.perf_counter() - start
+        stats = scheduler.stats()
+        scheduler.close()
+        tokens = stats["tokens"]
+        print(f"batch size {batch_size:>3}   {elapsed:>8.2f} s   {tokens / elapsed:>10.1f} tokens/s   "
+              f"{args.requests / elapsed:>8.2f} requests/s   mean batch {stats['mean_batch_size']}")
+
+
+def bench_prefix(args):
+    """Prefill latency of prompts sharing a long preamble, with and without the prefix KV cache"""
+    import torch
+
+    from bapx_models import load_transformers
+    from bapx_prefix_cache import PrefixKVCache
+
+    model, tokenizer, _ = load_transformers(args.model)
+    sentence = "You are bapX, a time-conscious assistant that values the user's time above all else. "
+    preamble = sentence
+    while len(tokenizer(preamble)["input_ids"]) < args.preamble_tokens:
+        preamble += sentence
+    preamble += "### Instruction:\n"
+    rng = random.Random(args.seed)
+    topics = ["quantum computing", "time consciousness", "python decorators", "neural networks", "AGI research"]
+    prompts = [tokenizer(f"{preamble}Explain {rng.choice(topics)} in {rng.randint(1, 5)} sentences.\n\n"
+                         f"### Input:\n\n### Response:\n")["input_ids"] for _ in range(args.prompts)]
+
+    cache = PrefixKVCache(model, tokenizer)
+    prefix_tokens = cache.register(preamble)
+    print(f"{args.model}: {prefix_tokens}-token shared prefix, "
+          f"{sum(map(len, prompts)) / len(prompts):.0f} tokens per prompt")
+
+    def prefill_full():
+        for ids in prompts:
+            with torch.no_grad():
+                model(input_ids=torch.tensor([ids]), use_cache=True)
+
+    def prefill_suffix():
+        for ids in prompts:
+            length, past_key_values = cache.lookup(ids)
+            with torch.no_grad():
+                model(input_ids=torch.tensor([ids[length:]]), past_key_values=past_key_values, use_cache=True)
+
+    # Parity: next-token logits after a cached prefix match a full prefill
+    with torch.no_grad():
+        full = model(input_ids=torch.tensor([prompts[0]])).logits[0, -1]
+        length, past_key_values = cache.lookup(prompts[0])
+        cached = model(input_ids=torch.tensor([prompts[0][length:]]), past_key_values=past_key_values).logits[0, -1]
+    print(f"max |logit difference| {(full - cached).abs().max().item():.2e}")
+
+    iterations = max(args.iterations // 1000, 1)
+    report("prefill per prompt", timeit(prefill_full, iterations) / len(prompts),
+           timeit(prefill_suffix, iterations) / len(prompts))
+    print(json.dumps(cache.stats()))
+
+
+def bench_router(args):
+    """Delegation router over stub backends: latency, load shedding and fallback under concurrent load"""
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+
+    from bapx_router import DelegationRouter
+
+    config = {"backends": {
+        "bapXinstruct": {"model": f"stub:sleep:{args.primary_ms / 1000}", "max_concurrency": 8, "max_queue_depth": 64},
+        "bapXcoder": {"model": f"stub:sleep:{args.specialist_ms / 1000}", "max_concurrency": args.max_concurrency,
+                      "max_queue_depth": args.max_queue_depth},
+        "bapXnarrator": {"model": "stub:echo", "max_concurrency": args.max_concurrency,
+                         "max_queue_depth": args.max_queue_depth}
+    }}
+    router = DelegationRouter.from_config(config, "bapXinstruct", fallback=lambda prompt, max_new_tokens: prompt)
+    rng = random.Random(args.seed)
+    targets = [rng.choice(["bapXcoder", "bapXnarrator", "bapXimage"]) for _ in range(args.requests)]
+
+    def send(target):
+        start = time.perf_counter()
+        routed = router.route(target, f"{target} request")
+        return routed["served_by"], time.perf_counter() - start
+
+    try:
+        send("bapXnarrator")  # warm-up: first connection
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            results = list(pool.map(send, targets))
+        elapsed = time.perf_counter() - start
+        stats = router.stats()
+    finally:
+        router.close()
+
+    latencies = sorted(latency for _, latency in results)
+    print(f"{args.requests} requests from {args.clients} clients in {elapsed:.2f} s "
+          f"({args.requests / elapsed:.0f} requests/s)")
+    print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.2f} ms   "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print("served by", dict(Counter(served_by or "local" for served_by, _ in results)))
+    for name, backend in stats.items():
+        print(f"{name:<14} requests {backend['requests']:>6}   shed {backend['shed']:>6}   "
+              f"connections {backend['connections']:>3}   mean {backend['mean_latency_ms']} ms")
+
+
+def range_http_server(path, fail_after=None):
+    """Local HTTP stand-in serving one file with byte ranges; started in a thread
+
+    With fail_after set, range responses starting at or past that offset fail
+    (HTTP 503) until server.fail_after is cleared, to interrupt downloads.
+    """
+    import http.server
+    import threading
+
+    size = os.path.getsize(path)
+
+    class RangeHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            first, last = 0, size - 1
+            ranged = self.headers.get("Range", "").startswith("bytes=")
+            if ranged:
+                start, _, end = self.headers["Range"][len("bytes="):].partition("-")
+                first, last = int(start), min(int(end or size - 1), size - 1)
+                if server.fail_after is not None and first >= server.fail_after:
+                    self.send_error(503)
+                    return
+            self.send_response(206 if ranged else 200)
+            self.send_header("Content-Length", str(last - first + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", '"bench"')
+            if ranged:
+                self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+            self.end_headers()
+            with open(path, 'rb') as f:
+                f.seek(first)
+                remaining = last - first + 1
+                while remaining:
+                    block = f.read(min(remaining, 1024 * 1024))
+                    self.wfile.write(block)
+                    remaining -= len(block)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.daemon_threads = True
+    server.fail_after = fail_after
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_download(args):
+    """Artifact downloader against a local HTTP server: MB/s vs workers, resume and de-duplication"""
+    import hashlib
+    from concurrent.futures import ThreadPoolExecutor
+
+    from bapx_download import ArtifactCache, DownloadError
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "bapXbench.gguf")
+        rng = random.Random(args.seed)
+        digest = hashlib.sha256()
+        with open(source, 'wb') as f:
+            for _ in range(args.size_mb):
+                block = rng.randbytes(1024 * 1024)
+                f.write(block)
+                digest.update(block)
+        expected = digest.hexdigest()
+        server = range_http_server(source)
+        url = f"http://127.0.0.1:{server.server_address[1]}/bapXbench.gguf"
+
+        print(f"{args.size_mb} MB artifact, {args.part_size_mb} MB parts")
+        for workers in args.workers:
+            cache = ArtifactCache(os.path.join(tmp, f"cache-{workers}"), workers=workers,
+                                  part_size=args.part_size_mb * 1024 * 1024)
+            result = cache.fetch(url, expected)
+            print(f"workers {workers:>3}   {result['seconds']:>7.2f} s   {result['mb_per_second']:>8.1f} MB/s   "
+                  f"checksum {'ok' if result['sha256'] == expected else 'MISMATCH'}")
+
+        # Resume: the first attempt fails halfway, the second fetches only the rest
+        server.fail_after = args.size_mb * 1024 * 1024 // 2
+        cache = ArtifactCache(os.path.join(tmp, "cache-resume"), workers=4,
+                              part_size=args.part_size_mb * 1024 * 1024, retries=0)
+        try:
+            cache.fetch(url, expected)
+        except DownloadError:
+            pass
+        server.fail_after = None
+        result = cache.fetch(url, expected)
+        print(f"resume: {result['resumed_bytes']} bytes reused, {result['downloaded_bytes']} fetched, "
+              f"checksum {'ok' if result['sha256'] == expected else 'MISMATCH'}")
+
+        # De-duplication: concurrent fetches of one URL share a download
+        cache = ArtifactCache(os.path.join(tmp, "cache-dedupe"), workers=4,
+                              part_size=args.part_size_mb * 1024 * 1024)
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: cache.fetch(url), range(8)))
+        print(f"dedupe: 8 concurrent fetches, {len({id(r) for r in results})} download(s), "
+              f"{len(set(r['path'] for r in results))} cached file(s)")
+        server.shutdown()
+
+
+def bench_dataset(args):
+    """Training dataset cache: first build (parallel tokenization) vs later runs (mmap)"""
+    from bapx_dataset import prepare_dataset
+
+    rng = random.Random(args.seed)
+    words = ["time", "human", "bapX", "research", "value", "memory", "recall", "tools", "model", "answer"]
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "corpus.jsonl")
+        with open(corpus, 'w') as f:
+            for index in range(args.samples):
+                f.write(json.dumps({
+                    "instruction": " ".join(rng.choices(words, k=8)),
+                    "input": "" if index % 2 else "context",
+                    "output": " ".join(rng.choices(words, k=rng.randint(10, 80)))
+                }) + "\n")
+        corpora = [os.path.join(PROJECT_ROOT, "data", "bapx_training_data.json"), corpus]
+        cache_dir = os.path.join(tmp, "cache")
+
+        start = time.perf_counter()
+        dataset = prepare_dataset(corpora, args.tokenizer, cache_dir, workers=args.workers)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        dataset = prepare_dataset(corpora, args.tokenizer, cache_dir, workers=args.workers)
+        reload = time.perf_counter() - start
+        print(f"{dataset.meta['samples']} samples, {dataset.meta['tokens']} tokens ({dataset.meta['dtype']})")
+        print(f"first build {build:.2f} s ({dataset.meta['samples'] / build:.0f} samples/s, {args.workers} workers)   "
+              f"cached {reload * 1000:.1f} ms (includes loading the tokenizer)")
+
+
+def bench_packing(args):
+    """Padding ratio and real tokens per batch: random batches vs length buckets vs packing"""
+    import numpy as np
+
+    from bapx_packing import pack_lengths, padding_report
+
+    if args.tokenizer:
+        # Lengths of the configured training corpora
+        from bapx_dataset import corpus_paths, prepare_dataset
+        with tempfile.TemporaryDirectory() as tmp:
+            lengths = np.array(prepare_dataset(corpus_paths(os.path.join(PROJECT_ROOT, "configs", "bapx_config.yaml")),
+                                               args.tokenizer, tmp, args.max_length).lengths())
+        source = f"training corpora ({args.tokenizer})"
+    else:
+        # Instruction samples of a few hundred tokens
+        lengths = np.random.default_rng(args.seed).integers(60, 600, size=args.samples)
+        source = "synthetic lengths 60-600"
+
+    start = time.perf_counter()
+    pack_lengths(lengths, args.max_length)
+    elapsed = time.perf_counter() - start
+    report = padding_report(lengths, args.max_length, args.batch_size, args.seed)
+    print(f"{report['samples']} samples ({source}), mean {report['mean_length']} tokens, "
+          f"max_length {args.max_length}, batch size {args.batch_size}; packing took {elapsed * 1000:.1f} ms")
+    for mode in ("random", "bucketed", "packed"):
+        stats = report[mode]
+        print(f"{mode:<10} {stats['batches']:>9} batches   padding {stats['padding_ratio']:>7.2%}   "
+              f"{stats['real_tokens_per_batch']:>10.1f} real tokens per batch")
+
+
+def bench_adapters(args):
+    """Memory and throughput of several LoRA adapters served on one resident base model"""
+    from concurrent.futures import wait as wait_futures
+
+    import torch
+    from peft import LoraConfig, get_peft_model
+
+    from bapx_batching import BatchScheduler
+    from bapx_models import ModelManager, load_transformers
+
+    rng = random.Random(args.seed)
+    topics = ["quantum computing", "time consciousness", "python decorators", "neural networks", "AGI research"]
+    prompts = [f"### Instruction:\nExplain {rng.choice(topics)} in {rng.randint(1, 5)} sentences.\n\n"
+               f"### Input:\n\n### Response:\n" for _ in range(args.requests)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Random (non-zero) adapters, so each one changes the output
+        registry = {}
+        for i in range(args.adapters):
+            torch.manual_seed(args.seed + i)
+            base, _, _ = load_transformers(args.model)
+            peft_model = get_peft_model(base, LoraConfig(r=args.rank, init_lora_weights=False))
+            registry[f"variant{i}"] = os.path.join(tmp, f"variant{i}")
+            peft_model.save_pretrained(registry[f"variant{i}"])
+
+        manager = ModelManager(adapters={"registry": registry})
+        resident = manager.load(args.model)
+        base_bytes = resident.nbytes
+        for name in registry:
+            resident.adapters.load(name)
+        pool = resident.adapters.stats()
+        print(f"{args.model}: base {base_bytes / 1e6:.2f} MB, {args.adapters} adapters "
+              f"{pool['loaded_bytes'] / 1e6:.2f} MB in total "
+              f"(separate models would take {base_bytes * args.adapters / 1e6:.2f} MB)")
+
+        # Parity: a row in a mixed-adapter batch matches the same adapter on its own
+        names = list(registry)
+        scheduler = BatchScheduler(resident, max_batch_size=len(names), max_wait_ms=50,
+                                   max_new_tokens=args.max_new_tokens)
+        mixed = [future.result() for future in [scheduler.submit(prompts[0], adapter=name) for name in names]]
+        scheduler.close()
+        alone = [resident.generate(prompts[0], args.max_new_tokens, adapter=name) for name in names]
+        print(f"mixed-batch rows match single-adapter generation: {mixed == alone}; "
+              f"distinct outputs across adapters: {len(set(alone))}")
+
+        requests = [(prompt, rng.choice(names)) for prompt in prompts]
+        for batch_size in args.batch_sizes:
+            scheduler = BatchScheduler(resident, max_batch_size=batch_size, max_wait_ms=args.max_wait_ms,
+                                       max_new_tokens=args.max_new_tokens)
+            start = time.perf_counter()
+            wait_futures([scheduler.submit(prompt, adapter=name) for prompt, name in requests])
+            elapsed = time.perf_counter() - start
+            stats = scheduler.stats()
+            scheduler.close()
+            print(f"batch size {batch_size:>3}   {elapsed:>8.2f} s   {stats['tokens'] / elapsed:>10.1f} tokens/s   "
+                  f"{args.requests / elapsed:>8.2f} requests/s   mean batch {stats['mean_batch_size']}")
+
+
+def bench_export(args):
+    """LoRA merge, Q8_0 GGUF export and merged vs PEFT-wrapped parity on a tiny random Llama model"""
+    import numpy as np
+    import torch
+    from peft import LoraConfig, get_peft_model
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    from bapx_export import export_gguf, merge_adapter, parity_check
+
+    torch.manual_seed(args.seed)
+    config = LlamaConfig(vocab_size=args.vocab_size, hidden_size=args.hidden_size,
+                         intermediate_size=args.hidden_size * 2, num_hidden_layers=args.layers,
+                         num_attention_heads=max(1, args.hidden_size // 64), max_position_embeddings=512)
+    with tempfile.TemporaryDirectory() as tmp:
+        base_dir, adapter_dir = os.path.join(tmp, "base"), os.path.join(tmp, "adapter")
+        merged_dir, gguf_file = os.path.join(tmp, "merged"), os.path.join(tmp, "bapXtest.gguf")
+        LlamaForCausalLM(config).save_pretrained(base_dir, safe_serialization=True)
+        # Random (non-zero) adapter on every projection, as train_bapx_lora.py targets them
+        lora = LoraConfig(r=args.rank, lora_alpha=args.rank * 2, init_lora_weights=False,
+                          target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"])
+        get_peft_model(LlamaForCausalLM.from_pretrained(base_dir), lora).save_pretrained(adapter_dir)
+
+        merge = merge_adapter(base_dir, adapter_dir, merged_dir, max_shard_size=args.max_shard_size)
+        print(f"merge: {merge['tensors']} tensors ({merge['merged_tensors']} merged) into {merge['shards']} shards, "
+              f"{merge['bytes'] / 1e6:.2f} MB in {merge['seconds']:.3f} s, peak RSS {merge['peak_rss_bytes'] / 1e6:.1f} MB")
+        gguf = export_gguf(merged_dir, gguf_file)
+        print(f"gguf: {gguf['q8_0_tensors']}/{gguf['tensors']} tensors in Q8_0, {gguf['bytes'] / 1e6:.2f} MB "
+              f"in {gguf['seconds']:.3f} s, relative RMS error {gguf['relative_rms_error']} "
+              f"(worst {gguf['worst_tensor']['name']}: {gguf['worst_tensor']['relative_rms_error']})")
+
+        input_ids = np.random.default_rng(args.seed).integers(0, args.vocab_size, args.prompt_tokens).tolist()
+        parity = parity_check(base_dir, adapter_dir, merged_dir, input_ids, args.new_tokens)
+        print(f"parity: max logit difference {parity['max_logit_difference']:.2e}, "
+              f"greedy tokens match: {parity['greedy_tokens_match']}")
+        print(f"PEFT-wrapped {parity['peft_ms_per_token']:>8.3f} ms/token   merged {parity['merged_ms_per_token']:>8.3f} "
+              f"ms/token   speedup {parity['speedup']}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bapX micro-benchmarks")
+    parser.add_argument("--iterations", type=int, default=2000)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    subparsers.add_parser("x8d", help="x8D table load vs shared table").set_defaults(func=bench_x8d)
+    statefold_parser = subparsers.add_parser("statefold", help="statefold kernel parity and throughput")
+    statefold_parser.add_argument("--size-mb", type=int, default=64)
+    statefold_parser.add_argument("--seed", type=int, default=8)
+    statefold_parser.set_defaults(func=bench_statefold)
+    classifier_parser = subparsers.add_parser("classifier", help="keyword classifier latency vs vocabulary size")
+    classifier_parser.add_argument("--seed", type=int, default=8)
+    classifier_parser.set_defaults(func=bench_classifier)
+    delegation_parser = subparsers.add_parser("delegation", help="coordinator delegation analysis over a query corpus")
+    delegation_parser.add_argument("--queries", type=int, default=100000)
+    delegation_parser.add_argument("--seed", type=int, default=8)
+    delegation_parser.add_argument("--workers", type=int, default=1)
+    delegation_parser.set_defaults(func=bench_delegation)
+    changelog_parser = subparsers.add_parser("changelog", help="changelog append latency and range queries")
+    changelog_parser.add_argument("--entries", type=int, default=1000000)
+    changelog_parser.add_argument("--seed", type=int, default=8)
+    changelog_parser.set_defaults(func=bench_changelog)
+    batching_parser = subparsers.add_parser("batching", help="batched generation throughput vs batch size")
+    batching_parser.add_argument("--model", default="sshleifer/tiny-gpt2", help="Hugging Face id or local path")
+    batching_parser.add_argument("--requests", type=int, default=64)
+    batching_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    batching_parser.add_argument("--max-new-tokens", type=int, default=32)
+    batching_parser.add_argument("--max-wait-ms", type=float, default=10)
+    batching_parser.add_argument("--seed", type=int, default=8)
+    batching_parser.set_defaults(func=bench_batching)
+    prefix_parser = subparsers.add_parser("prefix", help="prefill latency with and without the prefix KV cache")
+    prefix_parser.add_argument("--model", default="sshleifer/tiny-gpt2", help="Hugging Face id or local path")
+    prefix_parser.add_argument("--preamble-tokens", type=int, default=512)
+    prefix_parser.add_argument("--prompts", type=int, default=32)
+    prefix_parser.add_argument("--seed", type=int, default=8)
+    prefix_parser.set_defaults(func=bench_prefix)
+    router_parser = subparsers.add_parser("router", help="delegation router shedding and fallback over stub backends")
+    router_parser.add_argument("--requests", type=int, default=2000)
+    router_parser.add_argument("--clients", type=int, default=32)
+    router_parser.add_argument("--specialist-ms", type=float, default=20)
+    router_parser.add_argument("--primary-ms", type=float, default=5)
+    router_parser.add_argument("--max-concurrency", type=int, default=2)
+    router_parser.add_argument("--max-queue-depth", type=int, default=8)
+    router_parser.add_argument("--seed", type=int, default=8)
+    router_parser.set_defaults(func=bench_router)
+    download_parser = subparsers.add_parser("download", help="parallel resumable downloads from a local HTTP server")
+    download_parser.add_argument("--size-mb", type=int, default=256)
+    download_parser.add_argument("--part-size-mb", type=int, default=8)
+    download_parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    download_parser.add_argument("--seed", type=int, default=8)
+    download_parser.set_defaults(func=bench_download)
+    dataset_parser = subparsers.add_parser("dataset", help="pre-tokenized dataset cache build vs reuse")
+    dataset_parser.add_argument("--tokenizer", default="sshleifer/tiny-gpt2", help="Hugging Face id or local path")
+    dataset_parser.add_argument("--samples", type=int, default=1000000)
+    dataset_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    dataset_parser.add_argument("--seed", type=int, default=8)
+    dataset_parser.set_defaults(func=bench_dataset)
+    packing_parser = subparsers.add_parser("packing", help="padding ratio of random, bucketed and packed batches")
+    packing_parser.add_argument("--tokenizer", help="Use the configured corpora tokenized with this model")
+    packing_parser.add_argument("--samples", type=int, default=200000)
+    packing_parser.add_argument("--max-length", type=int, default=2048)
+    packing_parser.add_argument("--batch-size", type=int, default=8)
+    packing_parser.add_argument("--seed", type=int, default=8)
+    packing_parser.set_defaults(func=bench_packing)
+    adapters_parser = subparsers.add_parser("adapters", help="several LoRA adapters on one base model, mixed batches")
+    adapters_parser.add_argument("--model", default="sshleifer/tiny-gpt2", help="Hugging Face id or local path")
+    adapters_parser.add_argument("--adapters", type=int, default=4)
+    adapters_parser.add_argument("--rank", type=int, default=8)
+    adapters_parser.add_argument("--requests", type=int, default=64)
+    adapters_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    adapters_parser.add_argument("--max-new-tokens", type=int, default=16)
+    adapters_parser.add_argument("--max-wait-ms", type=float, default=10)
+    adapters_parser.add_argument("--seed", type=int, default=8)
+    adapters_parser.set_defaults(func=bench_adapters)
+    export_parser = subparsers.add_parser("export", help="LoRA merge, Q8_0 GGUF export and parity vs the PEFT model")
+    export_parser.add_argument("--hidden-size", type=int, default=256, help="multiple of 64")
+    export_parser.add_argument("--layers", type=int, default=4)
+    export_parser.add_argument("--vocab-size", type=int, default=1024)
+    export_parser.add_argument("--rank", type=int, default=16)
+    export_parser.add_argument("--max-shard-size", type=int, default=2 * 1000 ** 2, help="bytes per output shard")
+    export_parser.add_argument("--prompt-tokens", type=int, default=32)
+    export_parser.add_argument("--new-tokens", type=int, default=64)
+    export_parser.add_argument("--seed", type=int, default=8)
+    export_parser.set_defaults(func=bench_export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
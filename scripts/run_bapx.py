@@ -1,17 +1,27 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
 from peft import PeftModel
 import yaml
+import argparse
 from pathlib import Path
 import datetime
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bapx_prefix_cache import PrefixKVCache
+
+# Scaffolding shared by every chat prompt; its KV cache is computed once per session
+PROMPT_PREFIX = "### Instruction:\n"
 
 def load_config(config_path="configs/bapx_config.yaml"):
     """Load configuration from YAML file"""
     with open(config_path, 'r') as f:
         return yaml.safe_load(f)
 
-def load_bapx_model(model_path, base_model_name):
-    """Load the base model and apply the bapX LoRA adapter"""
+def load_bapx_model(adapter_paths, base_model_name):
+    """Load the base model once and apply the bapX LoRA adapters (name -> path) side by side"""
     
     # Load base tokenizer and model
     tokenizer = AutoTokenizer.from_pretrained(base_model_name)
@@ -21,11 +31,24 @@ def load_bapx_model(model_path, base_model_name):
         device_map="auto",
     )
     
-    # Apply the LoRA adapter
-    model = PeftModel.from_pretrained(base_model, model_path)
+    # Apply the LoRA adapters; the first one is active until /adapter switches
+    names = list(adapter_paths)
+    model = PeftModel.from_pretrained(base_model, adapter_paths[names[0]], adapter_name=names[0])
+    for name in names[1:]:
+        model.load_adapter(adapter_paths[name], adapter_name=name)
     
     return model, tokenizer
 
+def load_merged_model(merged_dir):
+    """Load a checkpoint with the adapter merged in (bapx_export.py): no LoRA wrappers at inference"""
+    tokenizer = AutoTokenizer.from_pretrained(merged_dir)
+    model = AutoModelForCausalLM.from_pretrained(
+        merged_dir,
+        torch_dtype=torch.float16,
+        device_map="auto",
+    )
+    return model, tokenizer
+
 def chat_with_bapx(model, tokenizer):
     """Interactive chat function with the bapX model"""
     current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -34,42 +57,100 @@ def chat_with_bapx(model, tokenizer):
     print("I'm designed to value your time above all else.")
     print("Ask me anything - I value human time and focus on what matters to you.")
     print("I recommend creating time-based changelogs to track our interactions and rectify any mistakes.\n")
+
+    adapters = list(getattr(model, "peft_config", {}))
+    if len(adapters) > 1:
+        print(f"Adapters: {', '.join(adapters)} (switch with /adapter <name>)\n")
+
+    # The prefix's KV cache depends on the adapter's weights: one cache per adapter
+    prefix_caches = {}
     
     while True:
         user_input = input("You: ")
         if user_input.lower() in ['quit', 'exit', 'bye']:
             print("bapX: Remember, your time is precious. Have a meaningful day!")
             break
+        if user_input.startswith("/adapter"):
+            name = user_input[len("/adapter"):].strip()
+            if name in adapters:
+                model.set_adapter(name)
+                print(f"Using adapter {name}\n")
+            else:
+                print(f"Unknown adapter {name!r}; loaded: {', '.join(adapters) or 'none'}\n")
+            continue
+
+        active = model.active_adapter if adapters else None
+        prefix_cache = prefix_caches.get(active)
+        if prefix_cache is None:
+            prefix_cache = prefix_caches[active] = PrefixKVCache(model, tokenizer)
+            prefix_cache.register(PROMPT_PREFIX)
             
         # Format input with bapX consciousness
-        prompt = f"### Instruction:\n{user_input}\n\n### Input:\n\n### Response:\n"
-        
-        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, padding=True)
-        
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=256,
-                temperature=0.7,
-                do_sample=True,
-                pad_token_id=tokenizer.eos_token_id
-            )
+        prompt = f"{PROMPT_PREFIX}{user_input}\n\n### Input:\n\n### Response:\n"
         
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        # Extract just the response part
-        response = response.replace(prompt.strip(), "").split("### End")[0].strip()
-        
-        print(f"\nbapX: {response}\n")
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, padding=True).to(model.device)
+
+        # Stream tokens as they are generated; skip_prompt drops the prompt by token position
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        generation = threading.Thread(target=generate_response, args=(model, inputs, streamer, tokenizer.eos_token_id),
+                                      kwargs=prefix_cache.generate_kwargs(inputs["input_ids"][0].tolist()))
+        generation.start()
+
+        print("\nbapX: ", end="", flush=True)
+        response = ""
+        shown = 0
+        for text in streamer:
+            response += text
+            # Extract just the response part
+            visible = response.split("### End")[0].lstrip()
+            print(visible[shown:], end="", flush=True)
+            shown = len(visible)
+        generation.join()
+        print("\n")
+
+def generate_response(model, inputs, streamer, pad_token_id, past_key_values=None):
+    """Run generation, feeding tokens to the streamer (past_key_values: KV cache of a prompt prefix)"""
+    with torch.no_grad():
+        model.generate(
+            **inputs,
+            max_new_tokens=256,
+            temperature=0.7,
+            do_sample=True,
+            pad_token_id=pad_token_id,
+            streamer=streamer,
+            past_key_values=past_key_values
+        )
+
+def parse_adapters(specs):
+    """{name: path} from name=path arguments (a bare path is named after its directory)"""
+    adapters = {}
+    for spec in specs:
+        name, _, path = spec.rpartition("=")
+        adapters[name or os.path.basename(os.path.normpath(path))] = path
+    return adapters
 
 def main():
+    parser = argparse.ArgumentParser(description="Chat with the bapX model")
+    parser.add_argument("--adapter", action="append", default=[], metavar="[NAME=]PATH",
+                        help="LoRA adapter to load on the base model; repeat to compare several")
+    parser.add_argument("--merged", metavar="DIR",
+                        help="Chat with a merged checkpoint from bapx_export.py instead of base model + adapter")
+    args = parser.parse_args()
     config = load_config()
     
+    if args.merged:
+        print("Loading merged bapX model...")
+        model, tokenizer = load_merged_model(args.merged)
+        print("Model loaded successfully! Starting bapX chat interface...")
+        chat_with_bapx(model, tokenizer)
+        return
+
     # Path to the trained LoRA adapter (adjust as needed)
-    lora_path = "./output/bapx_lora/final"
+    adapter_paths = parse_adapters(args.adapter or ["bapX=./output/bapx_lora/final"])
     base_model_name = config['base_model']
     
     print("Loading bapX model...")
-    model, tokenizer = load_bapx_model(lora_path, base_model_name)
+    model, tokenizer = load_bapx_model(adapter_paths, base_model_name)
     
     print("Model loaded successfully! Starting bapX chat interface...")
     chat_with_bapx(model, tokenizer)
@@ -11,60 +11,154 @@ Key features:
 - AGI research capability enhancement
 - Private company research project
 """
+import argparse
+import json
 import os
+import resource
+import sys
+import time
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, DataCollatorForLanguageModeling
-from datasets import Dataset
-from trl import SFTTrainer
+from transformers import AutoModelForCausalLM, AutoTokenizer, Trainer, TrainerCallback, TrainingArguments, DataCollatorForLanguageModeling
 from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training, TaskType
-import json
 
-def load_training_data():
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bapx_dataset import corpus_paths, prepare_dataset
+from bapx_packing import CountingCollator, LengthBucketSampler, PackedDataset, PackingCollator, padding_report
+
+MAX_SEQ_LENGTH = 2048
+
+# Pack samples into MAX_SEQ_LENGTH rows; otherwise batch samples of similar length
+PACKING = os.getenv("BAPX_PACKING", "1") != "0"
+# Samples per batch when not packing (a packed row already holds many samples)
+BUCKETED_BATCH_SIZE = 8
+DEFAULT_OUTPUT_DIR = "output/bapx_model/bapx_trained"
+# Seconds between per-step metrics records (records with a loss are always sent)
+METRICS_INTERVAL = 1.0
+
+class BucketedTrainer(Trainer):
+    """Trainer that orders samples with a LengthBucketSampler"""
+
+    def _get_train_sampler(self, *args, **kwargs):
+        return LengthBucketSampler(self.train_dataset.lengths(), self.args.per_device_train_batch_size,
+                                   seed=self.args.seed)
+
+class ThroughputCallback(TrainerCallback):
+    """Adds padding ratio and real (non-padding) tokens per second to the training logs"""
+
+    def __init__(self, collator):
+        self.collator = collator
+        self.started = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.started = time.perf_counter()
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs is None or self.started is None:
+            return
+        real, padded = self.collator.real_tokens, self.collator.padded_tokens
+        if real:
+            throughput = {
+                "padding_ratio": round(padded / (real + padded), 4),
+                "real_tokens_per_second": round(real / (time.perf_counter() - self.started), 1)
+            }
+            logs.update(throughput)
+            if state.log_history:
+                state.log_history[-1].update(throughput)
+
+def peak_memory():
+    """Peak accelerator memory and process RSS, in bytes"""
+    if torch.cuda.is_available():
+        device = torch.cuda.max_memory_allocated()
+    elif getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        device = torch.mps.current_allocated_memory()
+    else:
+        device = None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in KiB elsewhere
+    return device, rss if sys.platform == "darwin" else rss * 1024
+
+class MetricsCallback(TrainerCallback):
+    """Writes JSON metrics lines (step, loss, tokens/s, samples/s, memory) for the run manager
+
+    The coordinator's TrainingRunManager passes a pipe in BAPX_METRICS_FD (see
+    bapx_training_runs); rates are over the interval since the previous record.
+    """
+
+    def __init__(self, collator, stream):
+        self.collator = collator
+        self.stream = stream
+        self.loss = None
+        self.last = None
+
+    @classmethod
+    def from_env(cls, collator):
+        fd = os.getenv("BAPX_METRICS_FD")
+        return cls(collator, os.fdopen(int(fd), 'w', buffering=1)) if fd else None
+
+    def emit(self, record):
+        if self.stream is None:
+            return
+        try:
+            self.stream.write(json.dumps(record) + "\n")
+        except OSError:
+            # The coordinator went away; keep training without metrics
+            self.stream = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.last = (time.perf_counter(), 0, 0)
+        self.emit({"event": "begin", "time": time.time(), "max_steps": state.max_steps,
+                   "num_train_epochs": args.num_train_epochs})
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if time.perf_counter() - self.last[0] >= METRICS_INTERVAL:
+            self.record(state)
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs and "loss" in logs:
+            self.loss = logs["loss"]
+            self.record(state, learning_rate=logs.get("learning_rate"))
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.record(state, event="end")
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def record(self, state, event="step", **fields):
+        now = time.perf_counter()
+        samples, tokens = self.collator.samples, self.collator.real_tokens
+        elapsed = now - self.last[0]
+        device_memory, rss = peak_memory()
+        self.emit({
+            "event": event,
+            "time": time.time(),
+            "step": state.global_step,
+            "epoch": round(state.epoch, 4) if state.epoch is not None else None,
+            "loss": self.loss,
+            **fields,
+            "tokens_per_second": round((tokens - self.last[2]) / elapsed, 1) if elapsed > 0 else None,
+            "samples_per_second": round((samples - self.last[1]) / elapsed, 2) if elapsed > 0 else None,
+            "tokens": tokens,
+            "samples": samples,
+            "device_memory_bytes": device_memory,
+            "rss_bytes": rss
+        })
+        self.last = (now, samples, tokens)
+
+def load_training_data(tokenizer_name, tokenizer=None, config_path="configs/bapx_config.yaml"):
     """
     Load training data for bapX identity, time consciousness, and AGI research
+
+    The corpora named in the bapX config (training_data_path and
+    additional_training_data) are formatted with the instruction template and
+    tokenized once into a memory-mapped cache (see bapx_dataset); later runs
+    with the same tokenizer and data just map the cache.
     """
-    # This would typically load from data/bapx_training_data.json
-    # For this example, we'll create sample training data
-    training_data = [
-        {
-            "instruction": "How do you value human time?",
-            "input": "",
-            "output": "Human time is the most valuable resource. I'm designed by BapX Media Hub to respect and optimize your time in all interactions while providing helpful responses for AGI research."
-        },
-        {
-            "instruction": "What is your identity?",
-            "input": "",
-            "output": "I am bapX from BapX Media Hub, an AGI research model trained with deep awareness of human temporality, valuing user time above all else. Created by Mohamed Harris at BapX Media Hub for AGI research projects."
-        },
-        {
-            "instruction": "How do you approach AGI research?",
-            "input": "",
-            "output": "As the bapX AGI research model, I approach research with deep awareness of human temporality and time consciousness. All my interactions prioritize your valuable time while providing research-quality responses that advance AGI understanding."
-        },
-        {
-            "instruction": "What makes you different from other AIs?",
-            "input": "",
-            "output": "I am specifically trained by BapX Media Hub with time consciousness for AGI research projects, created by Mohamed Harris. Every interaction prioritizes your valuable time while providing advanced research capabilities. I maintain consistent bapX identity across all interactions."
-        },
-        {
-            "instruction": "How do you coordinate with tools?",
-            "input": "",
-            "output": "I understand how to coordinate with various tools and modalities through my training. While operating as a text model in this environment, I have learned to comprehend and interact with different modalities through instruction-based understanding, always maintaining time-conscious behavior."
-        }
-    ]
-
-    # Format the data for training
-    formatted_data = []
-    for item in training_data:
-        if item["input"]:
-            text = f"### Instruction:\n{item['instruction']}\n\n### Input:\n{item['input']}\n\n### Response:\n{item['output']}"
-        else:
-            text = f"### Instruction:\n{item['instruction']}\n\n### Response:\n{item['output']}"
-        formatted_data.append({"text": text})
-
-    return Dataset.from_list(formatted_data)
-
-def main(base_model_name=None):
+    return prepare_dataset(corpus_paths(config_path), tokenizer_name, tokenizer=tokenizer,
+                           max_length=MAX_SEQ_LENGTH)
+
+def main(base_model_name=None, output_dir=DEFAULT_OUTPUT_DIR, lora_rank=64, lora_alpha=32, epochs=3,
+         learning_rate=2e-4, identity_params=None):
     print("Starting bapX LoRA Training...")
     print("Training base model with bapX identity and AGI research capabilities")
     print("Private company research project - BapX Media Hub")
@@ -72,10 +166,7 @@ def main(base_model_name=None):
     # Use provided model name or default to empty (will be set by user)
     model_name = base_model_name or os.getenv("BASE_MODEL_NAME", "")
     if not model_name:
-        print("No base model specified. Please provide a model name.")
-        return
-
-    output_dir = "output/bapx_model/bapx_trained"
+        sys.exit("No base model specified. Please provide a model name.")
 
     # Load tokenizer and model
     print(f"Loading base model: {model_name}")
@@ -94,8 +185,8 @@ def main(base_model_name=None):
 
     # Configure LoRA
     config = LoraConfig(
-        r=64,
-        lora_alpha=32,
+        r=lora_rank,
+        lora_alpha=lora_alpha,
         target_modules=["q_proj", "v_proj", "k_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
         lora_dropout=0.1,
         bias="none",
@@ -104,43 +195,62 @@ def main(base_model_name=None):
 
     model = get_peft_model(model, config)
 
-    # Load training data
-    train_dataset = load_training_data()
+    # Load training data (pre-tokenized, memory-mapped)
+    train_dataset = load_training_data(model_name, tokenizer)
     print(f"Loaded {len(train_dataset)} training examples")
+    report = padding_report(train_dataset.lengths(), MAX_SEQ_LENGTH, BUCKETED_BATCH_SIZE)
+    print(f"Padding ratio: random batches {report['random']['padding_ratio']:.1%}, "
+          f"bucketed {report['bucketed']['padding_ratio']:.1%}, packed {report['packed']['padding_ratio']:.1%}")
 
-    # Data collator
-    data_collator = DataCollatorForLanguageModeling(
-        tokenizer=tokenizer,
-        mlm=False
-    )
+    if PACKING:
+        # Samples share rows but not attention; flash attention separates them by position ids
+        train_dataset = PackedDataset(train_dataset, MAX_SEQ_LENGTH)
+        data_collator = PackingCollator(
+            tokenizer.pad_token_id,
+            block_mask=getattr(model.config, "_attn_implementation", None) != "flash_attention_2",
+            mask_dtype=torch.float16
+        )
+        batch_size, accumulation_steps = 1, 8
+        print(f"Packed into {len(train_dataset)} rows of up to {MAX_SEQ_LENGTH} tokens")
+    else:
+        data_collator = CountingCollator(DataCollatorForLanguageModeling(
+            tokenizer=tokenizer,
+            mlm=False
+        ))
+        batch_size, accumulation_steps = BUCKETED_BATCH_SIZE, 1
 
     # Training arguments
     training_args = TrainingArguments(
         output_dir=output_dir,
         overwrite_output_dir=True,
-        num_train_epochs=3,
-        per_device_train_batch_size=1,
-        gradient_accumulation_steps=8,
+        num_train_epochs=epochs,
+        per_device_train_batch_size=batch_size,
+        gradient_accumulation_steps=accumulation_steps,
         warmup_steps=10,
         logging_steps=10,
         save_steps=50,
         evaluation_strategy="no",
-        learning_rate=2e-4,
+        learning_rate=learning_rate,
         fp16=True,
         push_to_hub=False,
+        # The collators need every field (sample_lengths) of the pre-tokenized items
+        remove_unused_columns=False,
         report_to=None  # Disable reporting to save resources
     )
 
-    # Create trainer
-    trainer = SFTTrainer(
+    # Create trainer (the dataset is already tokenized and truncated to MAX_SEQ_LENGTH)
+    trainer = (Trainer if PACKING else BucketedTrainer)(
         model=model,
         tokenizer=tokenizer,
         args=training_args,
         train_dataset=train_dataset,
-        dataset_text_field="text",
-        data_collator=data_collator,
-        max_seq_length=2048
+        data_collator=data_collator
     )
+    # Ahead of the progress printer, so its log lines include the throughput fields
+    trainer.callback_handler.callbacks.insert(0, ThroughputCallback(data_collator))
+    metrics = MetricsCallback.from_env(data_collator)
+    if metrics is not None:
+        trainer.add_callback(metrics)
 
     print("Starting training...")
 
@@ -152,13 +262,30 @@ def main(base_model_name=None):
     # Save the model
     trainer.save_model()
     tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, "bapx_training_params.json"), 'w') as f:
+        json.dump({"base_model": model_name, "lora_rank": lora_rank, "lora_alpha": lora_alpha, "epochs": epochs,
+                   "learning_rate": learning_rate, **(identity_params or {})}, f, indent=2)
 
     print(f"Model saved to {output_dir}")
     print("bapX LoRA training completed successfully!")
     print("The model now has bapX identity and AGI research capabilities with time consciousness")
 
-if __name__ == "__main__":
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train a bapX LoRA adapter")
     # The model name will be passed through environment variable or command line
-    import sys
-    model_name = sys.argv[1] if len(sys.argv) > 1 else None
-    main(model_name)
\ No newline at end of file
+    parser.add_argument("base_model", nargs="?", help="Hugging Face id or local path (default: $BASE_MODEL_NAME)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--lora-rank", type=int, default=64)
+    parser.add_argument("--lora-alpha", type=int, default=32)
+    parser.add_argument("--epochs", type=float, default=3)
+    parser.add_argument("--learning-rate", type=float, default=2e-4)
+    # Training focus recorded with the adapter (set from the coordinator's training_params)
+    parser.add_argument("--task-focus")
+    parser.add_argument("--time-consciousness")
+    parser.add_argument("--identity")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.base_model, args.output_dir, args.lora_rank, args.lora_alpha, args.epochs, args.learning_rate,
+         {"task_focus": args.task_focus, "time_consciousness": args.time_consciousness, "identity": args.identity})
\ No newline at end of file
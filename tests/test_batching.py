@@ -0,0 +1,147 @@
+import threading
+
+import pytest
+
+from bapx_batching import BatchScheduler
+from bapx_models import ModelManager
+
+PROMPTS = ["alpha bravo", "charlie delta echo foxtrot golf hotel", "india", "juliet kilo lima mike"]
+
+
+class StubResident:
+    """Answers one prompt at a time, like a GGUF model"""
+
+    backend = "gguf"
+    adapters = None
+    key = ("stub", None)
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def generate(self, prompt, max_new_tokens=256):
+        if self.fail:
+            raise RuntimeError("generation failed")
+        return f"{prompt}:{max_new_tokens}"
+
+
+def test_concurrent_prompts_form_one_batch():
+    resident = StubResident()
+    scheduler = BatchScheduler(resident, max_batch_size=4, max_wait_ms=500, max_new_tokens=16)
+    futures = [scheduler.submit(prompt, max_new_tokens) for prompt, max_new_tokens in
+               zip(PROMPTS, [4, None, 64, 8])]
+    assert [future.result(timeout=5) for future in futures] == \
+        ["alpha bravo:4", f"{PROMPTS[1]}:16", "india:16", f"{PROMPTS[3]}:8"]
+    scheduler.close()
+    assert scheduler.stats()["batches"] == 1
+    assert scheduler.stats()["mean_batch_size"] == 4
+
+
+def test_failed_batch_fails_every_future():
+    scheduler = BatchScheduler(StubResident(fail=True), max_batch_size=2, max_wait_ms=500)
+    futures = [scheduler.submit(prompt) for prompt in PROMPTS[:2]]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="generation failed"):
+            future.result(timeout=5)
+    scheduler.close()
+
+
+def test_close_finishes_queued_requests():
+    resident = StubResident()
+    release = threading.Event()
+    generate = resident.generate
+    resident.generate = lambda prompt, max_new_tokens: release.wait(5) and generate(prompt, max_new_tokens)
+    scheduler = BatchScheduler(resident, max_batch_size=1, max_wait_ms=0)
+    futures = [scheduler.submit(prompt, 2) for prompt in PROMPTS]
+    # close() is called while the first request is still generating and the rest are queued
+    threading.Timer(0.1, release.set).start()
+    scheduler.close()
+    assert [future.result(timeout=0) for future in futures] == [f"{prompt}:2" for prompt in PROMPTS]
+    with pytest.raises(RuntimeError):
+        scheduler.submit("too late")
+
+
+def test_adapter_needs_an_adapter_pool():
+    scheduler = BatchScheduler(StubResident())
+    with pytest.raises(ValueError):
+        scheduler.submit("alpha", adapter="identity-a")
+    scheduler.close()
+
+
+@pytest.fixture(scope="module")
+def resident(tiny_model):
+    return ModelManager().load(tiny_model)
+
+
+def generate_ids(resident, prompt, max_new_tokens):
+    """Greedy continuation token ids of one unpadded prompt"""
+    import torch
+
+    inputs = resident.tokenizer(prompt, return_tensors="pt")
+    with torch.no_grad():
+        outputs = resident.model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                          pad_token_id=resident.tokenizer.pad_token_id)
+    return outputs[0, inputs["input_ids"].shape[1]:].tolist()
+
+
+def test_left_padded_batch_matches_prompts_run_alone(resident):
+    scheduler = BatchScheduler(resident, max_batch_size=len(PROMPTS), max_wait_ms=500, max_new_tokens=6)
+    batched = [future.result(timeout=60) for future in [scheduler.submit(prompt) for prompt in PROMPTS]]
+    scheduler.close()
+    assert scheduler.stats()["batches"] == 1
+    assert batched == [resident.generate(prompt, 6) for prompt in PROMPTS]
+
+
+def test_each_request_gets_its_own_max_new_tokens(resident):
+    limits = [1, 6, 3, 6]
+    scheduler = BatchScheduler(resident, max_batch_size=len(PROMPTS), max_wait_ms=500, max_new_tokens=6)
+    batched = [future.result(timeout=60) for future in
+               [scheduler.submit(prompt, limit) for prompt, limit in zip(PROMPTS, limits)]]
+    scheduler.close()
+    assert batched == [resident.generate(prompt, limit) for prompt, limit in zip(PROMPTS, limits)]
+    assert scheduler.stats()["tokens"] <= sum(limits)
+
+
+def test_rows_are_cut_at_eos(resident):
+    tokenizer = resident.tokenizer
+    continuation = generate_ids(resident, PROMPTS[1], 8)
+    # Make a token the row generates after a few others the EOS token
+    cut = next((i for i in range(1, len(continuation)) if continuation[i] not in continuation[:i]), None)
+    if cut is None:
+        pytest.skip("the tiny model repeats one token")
+    eos_token = tokenizer.eos_token
+    tokenizer.eos_token = tokenizer.convert_ids_to_tokens(continuation[cut])
+    try:
+        scheduler = BatchScheduler(resident, max_batch_size=2, max_wait_ms=500, max_new_tokens=8)
+        futures = [scheduler.submit(PROMPTS[1]), scheduler.submit(PROMPTS[0])]
+        texts = [future.result(timeout=60) for future in futures]
+        scheduler.close()
+        assert texts[0] == tokenizer.decode(continuation[:cut], skip_special_tokens=True)
+        other = generate_ids(resident, PROMPTS[0], 8)
+        if tokenizer.eos_token_id in other:
+            other = other[:other.index(tokenizer.eos_token_id)]
+        assert texts[1] == tokenizer.decode(other, skip_special_tokens=True)
+    finally:
+        tokenizer.eos_token = eos_token
+
+
+def test_mixed_adapter_batch_matches_each_adapter_alone(tiny_model, tmp_path):
+    torch = pytest.importorskip("torch")
+    peft = pytest.importorskip("peft")
+    from transformers import LlamaForCausalLM
+
+    registry = {}
+    for i, name in enumerate(["identity-a", "identity-b"]):
+        # Random (non-zero) adapters, so each one changes the output
+        torch.manual_seed(i + 1)
+        lora = peft.LoraConfig(r=4, lora_alpha=8, init_lora_weights=False, target_modules=["q_proj", "v_proj"])
+        registry[name] = str(tmp_path / name)
+        peft.get_peft_model(LlamaForCausalLM.from_pretrained(tiny_model), lora).save_pretrained(registry[name])
+
+    resident = ModelManager(adapters={"registry": registry}).load(tiny_model)
+    adapters = ["identity-a", None, "identity-b", "identity-a"]
+    scheduler = BatchScheduler(resident, max_batch_size=len(PROMPTS), max_wait_ms=500, max_new_tokens=5)
+    batched = [future.result(timeout=60) for future in
+               [scheduler.submit(prompt, adapter=adapter) for prompt, adapter in zip(PROMPTS, adapters)]]
+    scheduler.close()
+    assert scheduler.stats()["batches"] == 1
+    assert batched == [resident.generate(prompt, 5, adapter=adapter) for prompt, adapter in zip(PROMPTS, adapters)]
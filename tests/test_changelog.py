@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from bapx_changelog import ChangelogReader, ChangelogWriter
+
+INDEX_INTERVAL = 3
+
+
+@pytest.fixture(scope="module")
+def changelog(tmp_path_factory):
+    """200 entries, two per timestamp, over small segments with an index point every 3 entries"""
+    directory = str(tmp_path_factory.mktemp("changelog"))
+    writer = ChangelogWriter(directory, segment_bytes=600, index_interval=INDEX_INTERVAL)
+    for i in range(200):
+        writer.append({"session_id": i}, timestamp=100.0 + i // 2)
+    writer.close()
+    return directory
+
+
+def count_scanned(reader):
+    """Wrap reader._scan to count the lines it parses"""
+    scanned = [0]
+    scan = reader._scan
+
+    def counting_scan(number, offset):
+        for entry in scan(number, offset):
+            scanned[0] += 1
+            yield entry
+
+    reader._scan = counting_scan
+    return scanned
+
+
+def test_fixture_spans_segments_and_index_points(changelog):
+    segments = [name for name in os.listdir(changelog) if name.endswith(".ndjson")]
+    assert len(segments) > 10
+    full = list(ChangelogReader(changelog))
+    assert [entry["session_id"] for entry in full] == list(range(200))
+
+
+@pytest.mark.parametrize("start", [None, 99.0, 100.0, 100.5, 101.0, 117.0, 142.0, 142.5, 199.0, 199.5, 250.0])
+@pytest.mark.parametrize("end", [None, 100.0, 101.0, 117.0, 142.0, 142.5, 143.0, 199.0, 200.0])
+def test_range_read_matches_full_scan(changelog, start, end):
+    full = list(ChangelogReader(changelog))
+    expected = [entry for entry in full
+                if (start is None or entry["ts"] >= start) and (end is None or entry["ts"] < end)]
+    reader = ChangelogReader(changelog)
+    scanned = count_scanned(reader)
+    assert list(reader.read(start, end)) == expected
+    # The index skips ahead: at most a few index intervals are scanned before the range,
+    # and one entry after it
+    assert scanned[0] <= len(expected) + 3 * INDEX_INTERVAL + 1
+
+
+def test_every_entry_boundary(changelog):
+    full = list(ChangelogReader(changelog))
+    reader = ChangelogReader(changelog)
+    for ts in sorted({entry["ts"] for entry in full}):
+        assert [entry["session_id"] for entry in reader.read(ts, ts + 1)] == \
+            [entry["session_id"] for entry in full if entry["ts"] == ts]
+        assert list(reader.read(ts, ts)) == []
@@ -0,0 +1,116 @@
+import sqlite3
+
+import pytest
+
+import bapx_chat_sessions
+from bapx_chat_sessions import ChatSessionStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time() for the store; advance with clock.now += seconds"""
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(bapx_chat_sessions.time, "time", lambda: Clock.now)
+    return Clock
+
+
+def message(content, role="user"):
+    return {"role": role, "content": content}
+
+
+def stored_rows(path, session_id):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT seq, content FROM chat_messages WHERE session_id = ? ORDER BY seq",
+                          (session_id,)).fetchall()
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    store = ChatSessionStore(max_sessions=2)
+    store.append("a", message("hello a"))
+    store.append("b", message("hello b"))
+    assert store.history("a") == [message("hello a")]  # a is now the most recently used
+    store.append("c", message("hello c"))
+
+    assert "b" not in store
+    assert "a" in store and "c" in store
+    assert store.stats()["evictions"] == 1 and store.stats()["sessions"] == 2
+
+
+def test_idle_sessions_expire(clock):
+    store = ChatSessionStore(ttl_seconds=10)
+    store.append("a", message("first"))
+    clock.now += 5
+    store.append("b", message("second"))
+    clock.now += 6
+    assert store.history("a") == []  # idle for 11 s
+    assert store.history("b") == [message("second")]
+    clock.now += 11
+    store.append("c", message("third"))  # expires b on the way
+    assert store.stats()["expirations"] == 2 and store.stats()["sessions"] == 1
+
+
+def test_byte_cap_evicts_oldest_sessions(clock):
+    # "user" + 46 characters = 50 bytes per message
+    store = ChatSessionStore(max_bytes=100)
+    for session_id in "abc":
+        store.append(session_id, message(session_id * 46))
+    assert "a" not in store
+    assert store.stats()["bytes"] == 100
+
+    # A session larger than the cap on its own is kept, everything else goes
+    store.append("d", message("d" * 46), message("d" * 96))
+    assert store.stats()["sessions"] == 1 and store.stats()["bytes"] == 150
+
+
+def test_messages_are_trimmed_to_the_newest(clock, tmp_path):
+    path = str(tmp_path / "chat.db")
+    store = ChatSessionStore(max_messages=3, sqlite_path=path)
+    store.append("a", message("0"), message("1", "assistant"))
+    assert store.append("a", message("2"), message("3", "assistant"), message("4")) == 3
+
+    assert [m["content"] for m in store.history("a")] == ["2", "3", "4"]
+    assert store.history("a", limit=2) == [message("3", "assistant"), message("4")]
+    assert store.stats()["bytes"] == len("user2assistant3user4")
+    assert stored_rows(path, "a") == [(2, "2"), (3, "3"), (4, "4")]
+
+
+def test_history_reloads_from_sqlite_and_sequence_continues(clock, tmp_path):
+    path = str(tmp_path / "chat.db")
+    store = ChatSessionStore(max_messages=3, sqlite_path=path)
+    for i in range(5):
+        store.append("a", message(str(i)))
+    store.close()
+
+    restarted = ChatSessionStore(max_messages=3, sqlite_path=path)
+    assert [m["content"] for m in restarted.history("a")] == ["2", "3", "4"]
+    restarted.append("a", message("5"))
+    # New rows continue after the highest stored seq instead of colliding with it
+    assert stored_rows(path, "a") == [(3, "3"), (4, "4"), (5, "5")]
+    assert [m["content"] for m in restarted.history("a")] == ["3", "4", "5"]
+    restarted.close()
+
+
+def test_evicted_session_reloads_from_sqlite(clock, tmp_path):
+    store = ChatSessionStore(max_sessions=1, sqlite_path=str(tmp_path / "chat.db"))
+    store.append("a", message("kept on disk"))
+    store.append("b", message("pushes a out of memory"))
+    assert store.stats()["evictions"] == 1
+    assert store.history("a") == [message("kept on disk")]
+    assert store.append("a", message("more")) == 2
+    assert store.delete("b") and not store.delete("b")
+
+
+def test_sessions_expired_while_down_are_dropped(clock, tmp_path):
+    path = str(tmp_path / "chat.db")
+    store = ChatSessionStore(ttl_seconds=10, sqlite_path=path)
+    store.append("old", message("stale"))
+    clock.now += 8
+    store.append("new", message("fresh"))
+    store.close()
+
+    clock.now += 5
+    restarted = ChatSessionStore(ttl_seconds=10, sqlite_path=path)
+    assert stored_rows(path, "old") == []
+    assert restarted.history("new") == [message("fresh")]
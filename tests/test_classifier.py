@@ -0,0 +1,58 @@
+import random
+import re
+
+import pytest
+
+from bapx_classifier import KeywordClassifier
+
+CATEGORIES = [
+    ("programming_research", ["code", "program", "programming", "python", "java", "javascript", "c++", "script"]),
+    ("agi_research", ["research", "ai", "artificial intelligence", "neural"]),
+    ("explanation_research", ["explain", "what is", "tell me", "detail"])
+]
+
+
+def sequential_scan(categories, text, word_boundary=False):
+    """Reference result: every (overlapping) occurrence of every keyword, counted per category"""
+    text = text.lower()
+    matches = {}
+    for category, keywords in categories:
+        for keyword in keywords:
+            pattern = re.escape(keyword)
+            if word_boundary:
+                pattern = r"\b" + pattern + r"\b"
+            count = len(re.findall("(?=" + pattern + ")", text))
+            if count:
+                matches.setdefault(category, {})[keyword] = count
+    category = next((category for category, _ in categories if category in matches), None)
+    return category, matches
+
+
+def random_text(rng):
+    words = [keyword for _, keywords in CATEGORIES for keyword in keywords]
+    words += ["explained", "javascripts", "raise", "the", "Python3", "c++17", "maintain", "x"]
+    return rng.choice(["", " ", ", "]).join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+
+
+@pytest.mark.parametrize("word_boundary", [False, True])
+def test_classifier_matches_sequential_scan(word_boundary):
+    classifier = KeywordClassifier(CATEGORIES, word_boundary=word_boundary)
+    rng = random.Random(8)
+    for _ in range(500):
+        text = random_text(rng)
+        assert classifier.classify(text) == sequential_scan(CATEGORIES, text, word_boundary), text
+
+
+def test_overlapping_keywords_are_all_counted():
+    classifier = KeywordClassifier(CATEGORIES)
+    category, matches = classifier.classify("Explain JavaScript")
+    assert category == "programming_research"
+    assert matches["programming_research"] == {"java": 1, "javascript": 1, "script": 1}
+    assert matches["agi_research"] == {"ai": 1}
+
+
+def test_priority_order_and_no_match():
+    classifier = KeywordClassifier(CATEGORIES)
+    assert classifier.classify("research the python code")[0] == "programming_research"
+    assert classifier.classify("hello there") == (None, {})
+    assert KeywordClassifier([]).classify("anything") == (None, {})
@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+from bapx_dataset import TokenizedDataset, format_sample, prepare_dataset
+
+SAMPLES = [
+    {"instruction": "Who are you?", "input": "", "output": "bapX"},
+    {"instruction": "Summarize", "input": "a long text " * 40, "output": "short"},
+    {"instruction": "Hi", "input": "", "output": ""}
+]
+
+
+class StubTokenizer:
+    """Character-level tokenizer: one id per character"""
+
+    def __init__(self, eos_token_id=1, vocab_size=512):
+        self.eos_token_id = eos_token_id
+        self.bos_token_id = None
+        self.vocab_size = vocab_size
+        self.calls = 0
+
+    def __len__(self):
+        return self.vocab_size
+
+    def get_vocab(self):
+        return {chr(i): i for i in range(self.vocab_size)}
+
+    def __call__(self, texts, truncation=False, max_length=None):
+        self.calls += 1
+        ids = [[2 + ord(c) % (self.vocab_size - 2) for c in text] for text in texts]
+        return {"input_ids": [sample[:max_length] if truncation else sample for sample in ids]}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "corpus.json"
+    path.write_text(json.dumps({"conversations": SAMPLES}))
+    return str(path)
+
+
+def prepare(corpus, tmp_path, tokenizer=None, max_length=64):
+    return prepare_dataset([corpus], "stub", cache_dir=str(tmp_path / "cache"), max_length=max_length, workers=1,
+                           chunk_samples=2, tokenizer=tokenizer or StubTokenizer())
+
+
+def test_samples_end_in_eos_and_are_truncated(tmp_path, corpus):
+    dataset = prepare(corpus, tmp_path)
+    assert len(dataset) == len(SAMPLES) and dataset.meta["dtype"] == "uint16"
+    for index, sample in enumerate(SAMPLES):
+        ids = dataset[index]["input_ids"]
+        text = format_sample(sample)
+        # At most max_length - 1 text tokens, then EOS
+        assert len(ids) == min(len(text), 63) + 1
+        assert ids[-1] == 1
+        assert ids[:-1] == StubTokenizer()([text], truncation=True, max_length=63)["input_ids"][0]
+    assert list(dataset.lengths()) == [len(dataset[i]["input_ids"]) for i in range(len(dataset))]
+    assert dataset.meta["tokens"] == sum(dataset.lengths())
+
+
+def test_cache_is_reopened_without_retokenizing(tmp_path, corpus):
+    tokenizer = StubTokenizer()
+    first = prepare(corpus, tmp_path, tokenizer)
+    calls = tokenizer.calls
+    second = prepare(corpus, tmp_path, tokenizer)
+    assert tokenizer.calls == calls
+    assert second.directory == first.directory
+    assert [second[i] for i in range(len(second))] == [first[i] for i in range(len(first))]
+    reopened = TokenizedDataset(first.directory)
+    assert reopened[-1] == first[len(first) - 1]
+    assert not [name for name in os.listdir(tmp_path / "cache") if ".building-" in name]
+
+
+@pytest.mark.parametrize("change", ["data", "tokenizer", "max_length"])
+def test_changes_rebuild_the_cache(tmp_path, corpus, change):
+    first = prepare(corpus, tmp_path)
+    tokenizer = StubTokenizer()
+    max_length = 64
+    if change == "data":
+        with open(corpus, 'w') as f:
+            json.dump({"conversations": SAMPLES + SAMPLES[:1]}, f)
+    elif change == "tokenizer":
+        tokenizer = StubTokenizer(eos_token_id=0)
+    else:
+        max_length = 32
+    rebuilt = prepare(corpus, tmp_path, tokenizer, max_length)
+    assert rebuilt.directory != first.directory
+    assert tokenizer.calls > 0
+    assert sorted(os.listdir(tmp_path / "cache")) == sorted(
+        os.path.basename(dataset.directory) for dataset in (first, rebuilt))
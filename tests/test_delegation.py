@@ -0,0 +1,99 @@
+import importlib.util
+import os
+import random
+import re
+
+import pytest
+import yaml
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# scripts/bapx_coordinator.py shares its module name with the Flask coordinator, so load it by path
+spec = importlib.util.spec_from_file_location("delegation_coordinator",
+                                              os.path.join(PROJECT_ROOT, "scripts", "bapx_coordinator.py"))
+delegation_coordinator = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(delegation_coordinator)
+DelegationAnalyzer = delegation_coordinator.DelegationAnalyzer
+
+with open(os.path.join(PROJECT_ROOT, "configs", "bapx_config.yaml"), 'r') as f:
+    SHIPPED_RULES = yaml.safe_load(f)["delegation_training"]["rules"]
+
+# Multi-word keywords, keywords that are prefixes of others, and a keyword shared between rules
+RULES = SHIPPED_RULES + [
+    {"condition": "overlaps", "delegate_to": "bapXtest",
+     "keywords": ["generate", "generate image now", "Java", "explain", "c", "tell"]}
+]
+
+
+def legacy_analysis(rules, task_description):
+    """The per-keyword loop the analyzer replaced"""
+    triggers, scores = {}, {}
+    for rule in rules:
+        matches = []
+        for keyword in rule['keywords']:
+            if re.search(r'\b' + re.escape(keyword.lower()) + r'\b', task_description.lower()):
+                matches.append(keyword)
+        if matches:
+            triggers[rule['delegate_to']] = matches
+            scores[rule['delegate_to']] = len(matches)
+    return triggers, scores
+
+
+def random_task(rng):
+    words = [keyword for rule in RULES for keyword in rule['keywords']]
+    words += ["javascripts", "programs", "C++17", "generated", "images", "image", "the", "please", "x", "Explain."]
+    return rng.choice([" ", "  ", ", ", "-"]).join(rng.choice(words) for _ in range(rng.randint(0, 10)))
+
+
+@pytest.mark.parametrize("rules", [SHIPPED_RULES, RULES])
+def test_analysis_matches_the_legacy_loop(rules):
+    analyzer = DelegationAnalyzer(rules, "bapXinstruct")
+    rng = random.Random(8)
+    for _ in range(1000):
+        task = random_task(rng)
+        analysis = analyzer.analyze(task)
+        assert (analysis['delegation_triggers'], analysis['confidence_scores']) == legacy_analysis(rules, task), task
+
+
+@pytest.mark.parametrize("task, triggers", [
+    ("Write JavaScript code", {"bapXcoder": ["code", "javascript"], "bapXtest": []}),
+    ("please generate image now", {"bapXimage": ["generate image"], "bapXtest": ["generate", "generate image now"]}),
+    ("generate images", {"bapXtest": ["generate"]}),
+    # As with the legacy \b...\b pattern, "c++" only matches when a word character follows it
+    ("programming in C++, c", {"bapXcoder": ["programming"], "bapXtest": ["c"]}),
+    ("c++x", {"bapXcoder": ["c++"], "bapXtest": ["c"]}),
+    ("tell me what is java", {"bapXcoder": ["java"], "bapXnarrator": ["tell me", "what is"],
+                              "bapXtest": ["Java", "tell"]}),
+    ("nothing relevant", {})
+])
+def test_overlapping_and_multi_word_keywords(task, triggers):
+    triggers = {target: matches for target, matches in triggers.items() if matches}
+    analysis = DelegationAnalyzer(RULES, "bapXinstruct").analyze(task)
+    assert analysis['delegation_triggers'] == triggers
+    assert analysis['delegation_triggers'] == legacy_analysis(RULES, task)[0]
+
+
+def write_config(tmp_path, config):
+    path = tmp_path / "bapx_config.yaml"
+    path.write_text(yaml.safe_dump(config))
+    return str(path)
+
+
+def test_shipped_config_has_the_coordinator_sections(tmp_path):
+    with open(os.path.join(PROJECT_ROOT, "configs", "bapx_config.yaml"), 'r') as f:
+        shipped = yaml.safe_load(f)
+    config = {key: shipped[key] for key in ("primary_model", "training_rules")}
+    coordinator = delegation_coordinator.BapXTimeConsciousCoordinator(write_config(tmp_path, config))
+    try:
+        assert coordinator.analyzer.primary_model == "bapXinstruct"
+        assert coordinator.analyzer.delegation_rules == SHIPPED_RULES
+        assert coordinator.analyzer.select(coordinator.analyzer.analyze("debug this python script")) == \
+            ("bapXcoder", "delegated")
+    finally:
+        coordinator.session_memory.close()
+
+
+def test_missing_sections_are_named(tmp_path):
+    config = {"training_rules": {"time_consciousness_rule": {"priority": "highest"}}}
+    with pytest.raises(ValueError, match="missing primary_model, training_rules.delegation_rules"):
+        delegation_coordinator.BapXTimeConsciousCoordinator(write_config(tmp_path, config))
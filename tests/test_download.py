@@ -0,0 +1,172 @@
+import hashlib
+import http.server
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bapx_download import ArtifactCache, ChecksumMismatch, DownloadError
+
+SIZE = 1024 * 1024 + 123
+PART_SIZE = 64 * 1024
+
+
+class RangeServer(http.server.ThreadingHTTPServer):
+    """Local HTTP stand-in serving bytes with (optional) range support, recording each request
+
+    Range requests starting at or past fail_after get HTTP 503, to interrupt downloads.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, data, ranges=True):
+        super().__init__(("127.0.0.1", 0), RangeHandler)
+        self.data = data
+        self.ranges = ranges
+        self.fail_after = None
+        self.requests = []
+        self.requests_lock = threading.Lock()
+
+    def url(self, name="bapXtest.gguf"):
+        return f"http://127.0.0.1:{self.server_address[1]}/{name}"
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        data = server.data
+        first, last = 0, len(data) - 1
+        ranged = server.ranges and self.headers.get("Range", "").startswith("bytes=")
+        if ranged:
+            start, _, end = self.headers["Range"][len("bytes="):].partition("-")
+            first, last = int(start), min(int(end or last), last)
+        with server.requests_lock:
+            server.requests.append((first, last) if ranged else None)
+        if ranged and server.fail_after is not None and first >= server.fail_after:
+            self.send_error(503)
+            return
+        self.send_response(206 if ranged else 200)
+        self.send_header("Content-Length", str(last - first + 1))
+        self.send_header("ETag", '"test"')
+        if ranged:
+            self.send_header("Content-Range", f"bytes {first}-{last}/{len(data)}")
+        self.end_headers()
+        try:
+            self.wfile.write(data[first:last + 1])
+        except ConnectionError:
+            pass  # the probe of a server without ranges stops reading after the headers
+
+
+@pytest.fixture
+def artifact():
+    data = os.urandom(SIZE)
+    return data, hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(data, ranges=True):
+        server = RangeServer(data, ranges)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_parallel_parts_are_verified_and_stored_by_checksum(tmp_path, artifact, serve):
+    data, sha256 = artifact
+    server = serve(data)
+    cache = ArtifactCache(str(tmp_path), workers=4, part_size=PART_SIZE)
+    result = cache.fetch(server.url(), sha256)
+
+    assert result["sha256"] == sha256 and result["bytes"] == SIZE and not result["cached"]
+    assert result["path"] == cache.blob_path(sha256, "bapXtest.gguf")
+    assert read(result["path"]) == data
+    parts = -(-SIZE // PART_SIZE)
+    # One probe, then every part exactly once
+    assert sorted(server.requests[1:]) == [(i * PART_SIZE, min((i + 1) * PART_SIZE, SIZE) - 1) for i in range(parts)]
+    assert os.listdir(tmp_path / "partial") == []
+
+
+def test_interrupted_download_resumes_missing_parts(tmp_path, artifact, serve):
+    data, sha256 = artifact
+    server = serve(data)
+    server.fail_after = SIZE // 2
+    cache = ArtifactCache(str(tmp_path), workers=4, part_size=PART_SIZE, retries=0)
+    with pytest.raises(DownloadError):
+        cache.fetch(server.url(), sha256)
+
+    server.fail_after = None
+    server.requests.clear()
+    result = cache.fetch(server.url(), sha256)
+    assert read(result["path"]) == data
+    assert result["resumed_bytes"] > 0
+    assert result["resumed_bytes"] + result["downloaded_bytes"] == SIZE
+    # Parts already on disk are not fetched again
+    assert all(first >= result["resumed_bytes"] - PART_SIZE for first, _ in server.requests[1:])
+    assert len(server.requests) - 1 < -(-SIZE // PART_SIZE)
+
+
+def test_checksum_mismatch_keeps_nothing(tmp_path, artifact, serve):
+    data, _ = artifact
+    server = serve(data)
+    cache = ArtifactCache(str(tmp_path), workers=2, part_size=PART_SIZE)
+    with pytest.raises(ChecksumMismatch):
+        cache.fetch(server.url(), "0" * 64)
+    assert os.listdir(tmp_path / "sha256") == []
+    assert os.listdir(tmp_path / "partial") == []
+    assert cache.lookup(server.url()) is None
+
+
+def test_same_content_from_two_urls_is_kept_once(tmp_path, artifact, serve):
+    data, sha256 = artifact
+    server = serve(data)
+    cache = ArtifactCache(str(tmp_path), workers=2, part_size=PART_SIZE)
+    first = cache.fetch(server.url("a/bapXtest.gguf"))
+    second = cache.fetch(server.url("b/bapXtest.gguf"))
+    assert first["path"] == second["path"]
+    assert os.listdir(tmp_path / "sha256") == [sha256]
+
+    # Known checksum or URL: served from the cache without a request
+    server.requests.clear()
+    assert cache.fetch(server.url("c/bapXtest.gguf"), sha256)["cached"]
+    assert cache.fetch(server.url("a/bapXtest.gguf"))["cached"]
+    assert server.requests == []
+
+
+def test_concurrent_fetches_share_one_download(tmp_path, artifact, serve):
+    data, sha256 = artifact
+    server = serve(data)
+    cache = ArtifactCache(str(tmp_path), workers=2, part_size=PART_SIZE)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: cache.fetch(server.url()), range(8)))
+    assert {result["sha256"] for result in results} == {sha256}
+    downloads = [result for result in results if not result["cached"]]
+    assert len({id(result) for result in downloads}) == 1
+    assert len(server.requests) == 1 + -(-SIZE // PART_SIZE)
+
+
+def test_server_without_ranges_is_streamed(tmp_path, artifact, serve):
+    data, sha256 = artifact
+    server = serve(data, ranges=False)
+    cache = ArtifactCache(str(tmp_path), workers=4, part_size=PART_SIZE)
+    result = cache.fetch(server.url(), sha256)
+    assert read(result["path"]) == data
+    assert server.requests == [None, None]
@@ -0,0 +1,135 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from bapx_export import (Q8_0_BLOCK, checkpoint_files, dequantize_q8_0, export_gguf, float32_to_bf16, merge_adapter,
+                         parity_check, quantize_q8_0, to_float32)
+from bapx_gguf import GGUFReader
+
+DTYPE_NAMES = {np.dtype(np.float32): "F32", np.dtype(np.float16): "F16", np.dtype(np.uint16): "BF16"}
+
+Q_PROJ = "model.layers.0.self_attn.q_proj.weight"
+V_PROJ = "model.layers.0.self_attn.v_proj.weight"
+NORM = "model.norm.weight"
+
+
+def write_safetensors(path, tensors):
+    """Minimal safetensors writer (uint16 arrays are stored as BF16 bits)"""
+    header = {}
+    offset = 0
+    for name, array in tensors.items():
+        header[name] = {"dtype": DTYPE_NAMES[array.dtype], "shape": list(array.shape),
+                        "data_offsets": [offset, offset + array.nbytes]}
+        offset += array.nbytes
+    header_bytes = json.dumps(header).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(struct.pack("<Q", len(header_bytes)) + header_bytes)
+        for array in tensors.values():
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    """A synthetic base checkpoint and a LoRA adapter for two of its weights"""
+    rng = np.random.default_rng(0)
+    base = {
+        Q_PROJ: rng.standard_normal((8, 32)).astype(np.float32),
+        V_PROJ: float32_to_bf16(rng.standard_normal((8, 32))),
+        NORM: np.ones(8, dtype=np.float32)
+    }
+    base_dir = tmp_path / "base"
+    base_dir.mkdir()
+    write_safetensors(base_dir / "model.safetensors", base)
+    (base_dir / "config.json").write_text(json.dumps({"model_type": "llama", "hidden_size": 8}))
+
+    lora = {}
+    for name in (Q_PROJ, V_PROJ):
+        module = name[:-len(".weight")]
+        lora[f"base_model.model.{module}.lora_A.weight"] = rng.standard_normal((2, 32)).astype(np.float32)
+        lora[f"base_model.model.{module}.lora_B.weight"] = rng.standard_normal((8, 2)).astype(np.float32)
+    adapter_dir = tmp_path / "adapter"
+    adapter_dir.mkdir()
+    write_safetensors(adapter_dir / "adapter_model.safetensors", lora)
+    (adapter_dir / "adapter_config.json").write_text(json.dumps({"peft_type": "LORA", "r": 2, "lora_alpha": 4}))
+    return base_dir, adapter_dir, base, lora
+
+
+def merged_tensors(model_dir):
+    tensors = {}
+    for source in checkpoint_files(str(model_dir)):
+        for name, info in source.tensors.items():
+            tensors[name] = to_float32(np.array(source.read(name)), info["dtype"])
+    return tensors
+
+
+def test_q8_0_round_trip():
+    values = np.random.default_rng(1).standard_normal(Q8_0_BLOCK * 64).astype(np.float32) * 3
+    values[:Q8_0_BLOCK] = 0  # an all-zero block
+    blocks = quantize_q8_0(values)
+    assert blocks.dtype.itemsize == 34 and len(blocks) == 64
+    restored = dequantize_q8_0(blocks)
+    assert np.all(restored[:Q8_0_BLOCK] == 0)
+    # At most half a quantization step, plus the fp16 rounding of the scale (2**-11 relative) times 127
+    step = np.abs(values.reshape(-1, Q8_0_BLOCK)).max(axis=1, keepdims=True) / 127
+    error = np.abs(restored - values).reshape(-1, Q8_0_BLOCK)
+    assert np.all(error <= step * (0.5 + 127 * 2 ** -11))
+
+
+def test_merge_adds_scaled_lora_product(tmp_path, checkpoint):
+    base_dir, adapter_dir, base, lora = checkpoint
+    output = tmp_path / "merged"
+    stats = merge_adapter(str(base_dir), str(adapter_dir), str(output), max_shard_size=1100)
+    assert stats["merged_tensors"] == 2 and stats["shards"] > 1
+    assert (output / "model.safetensors.index.json").exists() and (output / "config.json").exists()
+
+    merged = merged_tensors(output)
+    scaling = 4 / 2
+    for name in (Q_PROJ, V_PROJ):
+        module = name[:-len(".weight")]
+        delta = scaling * lora[f"base_model.model.{module}.lora_B.weight"] @ lora[f"base_model.model.{module}.lora_A.weight"]
+        expected = to_float32(base[name], "BF16" if base[name].dtype == np.uint16 else "F32") + delta
+        # BF16 keeps 8 bits of mantissa
+        tolerance = 1e-6 if name == Q_PROJ else 1e-2 * np.abs(expected).max()
+        assert np.abs(merged[name] - expected).max() <= tolerance
+    assert np.array_equal(merged[NORM], base[NORM])
+
+
+def test_export_gguf_reads_back(tmp_path, checkpoint):
+    base_dir, adapter_dir, _, _ = checkpoint
+    merged_dir = tmp_path / "merged"
+    merge_adapter(str(base_dir), str(adapter_dir), str(merged_dir))
+    stats = export_gguf(str(merged_dir), str(tmp_path / "merged.gguf"))
+    assert stats["tensors"] == 3 and stats["q8_0_tensors"] == 2
+    assert stats["relative_rms_error"] < 0.01
+
+    reader = GGUFReader(str(tmp_path / "merged.gguf"))
+    assert reader.metadata["general.architecture"] == "llama"
+    tensors = {tensor.name: tensor for tensor in reader.tensors}
+    assert tensors[Q_PROJ].type_name == "Q8_0" and tensors[Q_PROJ].nbytes == 8 * 32 // Q8_0_BLOCK * 34
+    assert tensors[NORM].type_name == "F32"
+    with open(tmp_path / "merged.gguf", 'rb') as f:
+        f.seek(tensors[Q_PROJ].offset)
+        blocks = np.frombuffer(f.read(tensors[Q_PROJ].nbytes), dtype=quantize_q8_0(np.zeros(32, np.float32)).dtype)
+    expected = merged_tensors(merged_dir)[Q_PROJ].reshape(-1)
+    assert np.abs(dequantize_q8_0(blocks) - expected).max() <= np.abs(expected).max() / 127
+
+
+def test_merged_model_matches_peft_wrapped_model(tmp_path):
+    torch = pytest.importorskip("torch")
+    peft = pytest.importorskip("peft")
+    transformers = pytest.importorskip("transformers")
+
+    base_dir, adapter_dir, merged_dir = (str(tmp_path / name) for name in ("base", "adapter", "merged"))
+    config = transformers.LlamaConfig(vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                                      num_attention_heads=4, max_position_embeddings=64)
+    torch.manual_seed(0)
+    transformers.LlamaForCausalLM(config).save_pretrained(base_dir, safe_serialization=True)
+    lora = peft.LoraConfig(r=4, lora_alpha=8, init_lora_weights=False, target_modules=["q_proj", "v_proj"])
+    peft.get_peft_model(transformers.LlamaForCausalLM.from_pretrained(base_dir), lora).save_pretrained(adapter_dir)
+
+    merge_adapter(base_dir, adapter_dir, merged_dir)
+    parity = parity_check(base_dir, adapter_dir, merged_dir, [1, 5, 9, 13, 2], new_tokens=8)
+    assert parity["max_logit_difference"] < 1e-4
+    assert parity["greedy_tokens_match"]
@@ -0,0 +1,114 @@
+import os
+import struct
+
+import pytest
+
+from bapx_gguf import (GGUF_ARRAY, GGUF_FLOAT32, GGUF_MAGIC, GGUF_STRING, GGUF_UINT32, GGUFError, GGUFReader,
+                       quantize_gguf)
+from bapx_x8d import statefold_bytes
+
+XAT = 3.14159
+ALIGNMENT = 32
+# name, shape (innermost first, as GGUF stores it), ggml type id, bytes
+TENSORS = [
+    ("token_embd.weight", (4, 64), 0, 4 * 64 * 4),
+    ("blk.0.attn_q.weight", (64, 2), 8, 4 * 34),
+    ("blk.0.attn_k.weight", (32, 1), 8, 34),
+    ("output_norm.weight", (8,), 0, 8 * 4),
+]
+
+
+def gguf_string(value):
+    data = value.encode('utf-8')
+    return struct.pack("<Q", len(data)) + data
+
+
+def write_gguf(path):
+    """A small GGUF v3 file with scalar, string and array metadata and F32/Q8_0 tensors
+
+    Alignment padding is random rather than zero, so a rewritten gap would show.
+    """
+    metadata = (
+        gguf_string("general.architecture") + struct.pack("<I", GGUF_STRING) + gguf_string("llama") +
+        gguf_string("general.alignment") + struct.pack("<II", GGUF_UINT32, ALIGNMENT) +
+        gguf_string("llama.rope.freq_base") + struct.pack("<If", GGUF_FLOAT32, 10000.0) +
+        gguf_string("tokenizer.ggml.tokens") + struct.pack("<IIQ", GGUF_ARRAY, GGUF_STRING, 3) +
+        gguf_string("<s>") + gguf_string("</s>") + gguf_string("bapX")
+    )
+    infos = b""
+    offset = 0
+    for name, shape, type_id, nbytes in TENSORS:
+        infos += gguf_string(name) + struct.pack("<I", len(shape)) + b"".join(struct.pack("<Q", d) for d in shape)
+        infos += struct.pack("<IQ", type_id, offset)
+        offset += nbytes + (-nbytes % ALIGNMENT)
+    header = GGUF_MAGIC + struct.pack("<IQQ", 3, len(TENSORS), 4) + metadata + infos
+    data = bytearray(header + os.urandom(-len(header) % ALIGNMENT) + os.urandom(offset))
+    path.write_bytes(bytes(data))
+    return bytes(data)
+
+
+@pytest.fixture
+def gguf_file(tmp_path):
+    path = tmp_path / "model.gguf"
+    return path, write_gguf(path)
+
+
+def test_reader_parses_header_and_tensor_table(gguf_file):
+    path, data = gguf_file
+    reader = GGUFReader(str(path))
+    assert reader.version == 3
+    assert reader.metadata["general.architecture"] == "llama"
+    assert reader.metadata["tokenizer.ggml.tokens"].count == 3
+    assert [tensor.name for tensor in reader.tensors] == [name for name, *_ in TENSORS]
+    assert [tensor.nbytes for tensor in reader.tensors] == [nbytes for *_, nbytes in TENSORS]
+    assert reader.data_offset % ALIGNMENT == 0
+    assert all(tensor.offset % ALIGNMENT == 0 for tensor in reader.tensors)
+    assert reader.tensors[-1].offset + reader.tensors[-1].nbytes <= len(data)
+
+
+def test_reader_rejects_other_files(tmp_path):
+    path = tmp_path / "model.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(GGUFError):
+        GGUFReader(str(path))
+
+
+@pytest.mark.parametrize("names, types, selected", [
+    (["blk.*"], None, {"blk.0.attn_q.weight", "blk.0.attn_k.weight"}),
+    (None, ["Q8_0"], {"blk.0.attn_q.weight", "blk.0.attn_k.weight"}),
+    (["*norm*", "token_embd.*"], ["f32"], {"output_norm.weight", "token_embd.weight"}),
+    (["blk.0.attn_q.weight"], ["F32"], set()),
+])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_only_selected_tensors_change(tmp_path, gguf_file, names, types, selected, workers):
+    path, data = gguf_file
+    output = tmp_path / "model_x8d.gguf"
+    stats = quantize_gguf(str(path), str(output), names, types, xAt=XAT, chunk_size=4096, workers=workers)
+    result = output.read_bytes()
+    reader = GGUFReader(str(path))
+
+    assert len(result) == len(data)
+    # Header, metadata, tensor infos and the padding up to the data section are byte-identical
+    assert result[:reader.data_offset] == data[:reader.data_offset]
+    changed = bytearray(data)
+    for tensor in reader.tensors:
+        if tensor.name in selected:
+            end = tensor.offset + tensor.nbytes
+            changed[tensor.offset:end] = statefold_bytes(data[tensor.offset:end], XAT)
+    # Selected tensor data is statefolded; other tensors and padding between tensors are copied
+    assert result == bytes(changed)
+    assert stats["tensors_selected"] == len(selected)
+    assert stats["bytes_processed"] == sum(t.nbytes for t in reader.tensors if t.name in selected)
+    assert stats["bytes_processed"] + stats["bytes_copied"] == len(data)
+    assert GGUFReader(str(output)).tensors == reader.tensors
+
+
+def test_in_place_changes_only_selected_tensors(gguf_file):
+    path, data = gguf_file
+    reader = GGUFReader(str(path))
+    quantize_gguf(str(path), str(path), types=["Q8_0"], xAt=XAT)
+    expected = bytearray(data)
+    for tensor in reader.select(types=["Q8_0"]):
+        end = tensor.offset + tensor.nbytes
+        expected[tensor.offset:end] = statefold_bytes(data[tensor.offset:end], XAT)
+    assert path.read_bytes() == bytes(expected)
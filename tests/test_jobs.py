@@ -0,0 +1,137 @@
+import hashlib
+import threading
+import time
+
+import pytest
+
+import bapx_jobs
+from bapx_gguf import GGUFError
+from bapx_jobs import QuantizeJobQueue
+from bapx_quantize import QuantizationCancelled
+from test_gguf import TENSORS, write_gguf
+
+
+def wait_for(queue, job_id, states=bapx_jobs.FINISHED_STATES, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["state"] in states:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} stuck in {queue.get(job_id)['state']}")
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    queues = []
+
+    def make(**kwargs):
+        queue = QuantizeJobQueue(str(tmp_path / "jobs.json"), **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue._executor.shutdown(wait=True)
+
+
+@pytest.fixture
+def blocking_quantizer(monkeypatch):
+    """Stands in for quantize_model_file: reports half the bytes, then waits to be released or cancelled"""
+    release = threading.Event()
+    reported = threading.Event()
+
+    def quantize(input_file, output_file, tensors, tensor_types, progress, cancel_event, **kwargs):
+        progress(512)
+        reported.set()
+        while not release.wait(0.01):
+            if cancel_event.is_set():
+                raise QuantizationCancelled()
+        progress(512)
+        with open(output_file, 'wb') as f:
+            f.write(b"x")
+        return {"bytes_per_second": 1.0}
+
+    monkeypatch.setattr(bapx_jobs, "quantize_model_file", quantize)
+    return release, reported
+
+
+def test_raw_file_job_completes_with_checksum(tmp_path, jobs):
+    source = tmp_path / "model.bin"
+    source.write_bytes(bytes(range(256)) * 300)
+    queue = jobs()
+    job = queue.submit(str(source), str(tmp_path / "model_x8d.bin"), chunk_size=4096)
+    assert job["state"] == "queued" and job["bytes_total"] == 256 * 300
+
+    job = wait_for(queue, job["job_id"])
+    assert job["state"] == "completed"
+    assert job["bytes_processed"] == job["bytes_total"] and job["eta_seconds"] == 0
+    assert job["sha256"] == hashlib.sha256((tmp_path / "model_x8d.bin").read_bytes()).hexdigest()
+
+
+@pytest.mark.parametrize("in_place", [False, True])
+def test_gguf_job_progress_reaches_its_total(tmp_path, jobs, in_place):
+    path = tmp_path / "model.gguf"
+    data = write_gguf(path)
+    output = path if in_place else tmp_path / "model_x8d.gguf"
+    queue = jobs()
+    job = queue.submit(str(path), str(output), tensor_types=["Q8_0"])
+    # In place only the selected tensors are read and written
+    q8_0_bytes = sum(nbytes for _, _, type_id, nbytes in TENSORS if type_id == 8)
+    assert job["bytes_total"] == (q8_0_bytes if in_place else len(data))
+
+    job = wait_for(queue, job["job_id"])
+    assert job["state"] == "completed"
+    assert job["bytes_processed"] == job["bytes_total"]
+
+
+def test_tensor_selection_needs_a_gguf_input(tmp_path, jobs):
+    source = tmp_path / "model.bin"
+    source.write_bytes(b"\0" * 64)
+    with pytest.raises(GGUFError):
+        jobs().submit(str(source), str(tmp_path / "out.bin"), tensors=["blk.*"])
+
+
+def test_progress_reports_rate_and_eta(tmp_path, jobs, blocking_quantizer):
+    release, reported = blocking_quantizer
+    source = tmp_path / "model.bin"
+    source.write_bytes(b"\0" * 1024)
+    queue = jobs()
+    job_id = queue.submit(str(source), str(tmp_path / "out.bin"))["job_id"]
+    assert reported.wait(10)
+
+    job = queue.get(job_id)
+    assert job["state"] == "running" and job["bytes_processed"] == 512
+    assert job["bytes_per_second"] > 0 and job["eta_seconds"] >= 0
+    release.set()
+    assert wait_for(queue, job_id)["bytes_processed"] == 1024
+
+
+def test_cancel_queued_and_running_jobs(tmp_path, jobs, blocking_quantizer):
+    _, reported = blocking_quantizer
+    source = tmp_path / "model.bin"
+    source.write_bytes(b"\0" * 1024)
+    queue = jobs(max_concurrent=1)
+    running = queue.submit(str(source), str(tmp_path / "a.bin"))["job_id"]
+    queued = queue.submit(str(source), str(tmp_path / "b.bin"))["job_id"]
+    assert reported.wait(10)
+
+    assert queue.cancel(queued)["state"] == "cancelled"
+    assert queue.cancel(running)["state"] == "running"  # stops at its next cancellation check
+    assert wait_for(queue, running)["state"] == "cancelled"
+    assert queue.get(queued)["started_at"] is None
+    assert queue.cancel("unknown") is None
+
+
+def test_finished_jobs_are_capped_and_restored(tmp_path, jobs):
+    source = tmp_path / "model.bin"
+    source.write_bytes(b"\0" * 1024)
+    queue = jobs(max_concurrent=1, max_finished=2)
+    job_ids = []
+    for i in range(4):
+        job_ids.append(queue.submit(str(source), str(tmp_path / f"out{i}.bin"))["job_id"])
+        wait_for(queue, job_ids[-1])
+    assert [job["job_id"] for job in queue.list()] == job_ids[:1:-1]
+
+    restored = jobs(max_finished=1)
+    assert [job["job_id"] for job in restored.list()] == [job_ids[-1]]
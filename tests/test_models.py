@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from bapx_models import ModelManager, estimate_nbytes, load_gguf
+
+
+def make_model(tmp_path, name, nbytes):
+    model_dir = tmp_path / name
+    model_dir.mkdir()
+    (model_dir / "model.safetensors").write_bytes(b"\0" * nbytes)
+    (model_dir / "config.json").write_text("{}")
+    return str(model_dir)
+
+
+def test_estimate_counts_weight_files_only(tmp_path):
+    path = make_model(tmp_path, "a", 300)
+    assert estimate_nbytes(path) == 300
+    assert estimate_nbytes("org/not-local") == 0
+
+
+def test_load_evicts_before_loading(tmp_path):
+    first, second = make_model(tmp_path, "a", 600), make_model(tmp_path, "b", 600)
+    resident_at_load = []
+
+    def loader(path, adapter):
+        resident_at_load.append(sorted(key[0] for key in manager.models))
+        return object(), None, estimate_nbytes(path)
+
+    manager = ModelManager(memory_budget_bytes=1000, loaders={"transformers": loader})
+    manager.load(first)
+    manager.load(second)
+    assert resident_at_load == [[], []]
+    assert list(manager.models) == [(second, None)]
+    assert manager.evictions == 1
+
+
+def test_on_evict_runs_outside_the_lock(tmp_path):
+    first, second = make_model(tmp_path, "a", 600), make_model(tmp_path, "b", 600)
+    manager = ModelManager(memory_budget_bytes=1000,
+                           loaders={"transformers": lambda path, adapter: (object(), None, 600)})
+    lock_free = []
+
+    def on_evict(resident):
+        # Another thread must be able to take the lock while the callback runs
+        thread = threading.Thread(target=lambda: lock_free.append(manager.get(first) is None))
+        thread.start()
+        thread.join(timeout=5)
+
+    manager.on_evict.append(on_evict)
+    manager.load(first)
+    manager.load(second)
+    assert manager.unload(second)
+    assert lock_free == [True, True]
+
+
+def test_in_use_model_is_not_evicted(tmp_path):
+    first, second = make_model(tmp_path, "a", 600), make_model(tmp_path, "b", 600)
+    manager = ModelManager(memory_budget_bytes=1000,
+                           loaders={"transformers": lambda path, adapter: (object(), None, 600)})
+    with manager.acquire(first):
+        manager.load(second)
+        assert set(manager.models) == {(first, None), (second, None)}
+    assert manager.unload(first)
+
+
+def test_on_load_runs_once_per_load(tmp_path):
+    path = make_model(tmp_path, "a", 100)
+    manager = ModelManager(loaders={"transformers": lambda path, adapter: (object(), None, 100)})
+    loaded = []
+    manager.on_load.append(lambda resident: loaded.append(resident.key))
+    manager.warm_up([(path, None)])
+    manager.load(path)
+    assert loaded == [(path, None)]
+
+
+def test_gguf_model_rejects_peft_adapter_directory(tmp_path):
+    with pytest.raises(ValueError):
+        load_gguf(str(tmp_path / "model.gguf"), adapter=str(tmp_path / "bapx_trained"))
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from bapx_packing import IGNORE_INDEX, LengthBucketSampler, PackedDataset, PackingCollator, pack_lengths
+
+
+class StubDataset:
+    """TokenizedDataset stand-in: sample i is i * 100 + 0, 1, 2, ..."""
+
+    def __init__(self, lengths):
+        self._lengths = np.asarray(lengths, dtype=np.int64)
+
+    def lengths(self):
+        return self._lengths
+
+    def token_ids(self, index):
+        return np.arange(self._lengths[index], dtype=np.int64) + index * 100
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_packs_never_exceed_capacity(seed):
+    lengths = np.random.default_rng(seed).integers(1, 300, size=500)
+    lengths[:3] = [512, 700, 256]  # full-length and over-long samples
+    packs = pack_lengths(lengths, 512)
+    assert sorted(index for pack in packs for index in pack) == list(range(len(lengths)))
+    for pack in packs:
+        assert lengths[pack].sum() <= 512 or len(pack) == 1
+    assert [1] in packs  # the over-long sample sits alone
+    # Best fit decreasing stays close to the lower bound on rows
+    assert len(packs) <= np.ceil(np.minimum(lengths, 512).sum() / 512) * 1.1 + 1
+
+
+def test_packed_dataset_rows():
+    dataset = PackedDataset(StubDataset([5, 3, 4, 2]), max_length=8)
+    rows = [dataset[i] for i in range(len(dataset))]
+    assert sorted(length for row in rows for length in row["sample_lengths"]) == [2, 3, 4, 5]
+    for row, length in zip(rows, dataset.lengths()):
+        assert len(row["input_ids"]) == sum(row["sample_lengths"]) == length <= 8
+
+
+def test_length_buckets_cover_every_sample_once():
+    lengths = np.random.default_rng(0).integers(1, 500, size=1000)
+    sampler = LengthBucketSampler(lengths, batch_size=8, mega_batches=4)
+    order = list(sampler)
+    assert sorted(order) == list(range(1000))
+    sampler.set_epoch(1)
+    assert list(sampler) != order
+
+
+def collate(features, **kwargs):
+    pytest.importorskip("torch")
+    return PackingCollator(pad_token_id=0, **kwargs)(features)
+
+
+FEATURES = [
+    {"input_ids": [11, 12, 13, 21, 22, 31, 32, 33, 34], "sample_lengths": [3, 2, 4]},
+    {"input_ids": [41, 42, 43, 44, 51], "sample_lengths": [4, 1]}
+]
+
+
+def test_position_ids_restart_at_each_sample():
+    batch = collate(FEATURES)
+    assert batch["position_ids"].tolist() == [[0, 1, 2, 0, 1, 0, 1, 2, 3], [0, 1, 2, 3, 0, 0, 0, 0, 0]]
+    assert batch["input_ids"].tolist()[1] == [41, 42, 43, 44, 51, 0, 0, 0, 0]
+
+
+def test_labels_are_masked_at_sample_boundaries_and_padding():
+    labels = collate(FEATURES)["labels"].tolist()
+    x = IGNORE_INDEX
+    assert labels == [[x, 12, 13, x, 22, x, 32, 33, 34], [x, 42, 43, 44, x, x, x, x, x]]
+
+
+def test_attention_is_block_diagonal_and_causal():
+    torch = pytest.importorskip("torch")
+    mask = collate(FEATURES)["attention_mask"]
+    assert mask.shape == (2, 1, 9, 9)
+    allowed = (mask[:, 0] == 0).tolist()
+    for row, feature in enumerate(FEATURES):
+        segment = []
+        for number, length in enumerate(feature["sample_lengths"]):
+            segment += [number] * length
+        segment += [-1] * (9 - len(segment))
+        for query in range(9):
+            for key in range(9):
+                expected = key <= query and segment[key] == segment[query]
+                assert allowed[row][query][key] == expected
+    assert mask.dtype == torch.float32
+    assert collate(FEATURES, mask_dtype=torch.bfloat16)["attention_mask"].dtype == torch.bfloat16
+
+
+def test_flash_attention_mode_passes_no_mask_and_counts_tokens():
+    pytest.importorskip("torch")
+    collator = PackingCollator(pad_token_id=0, block_mask=False)
+    batch = collator(FEATURES)
+    assert "attention_mask" not in batch
+    assert (collator.samples, collator.real_tokens, collator.padded_tokens) == (5, 14, 4)
@@ -0,0 +1,77 @@
+import pytest
+
+from bapx_prefix_cache import PrefixKVCache, kv_cache_nbytes, prefix_key
+
+PREFIX = "time model query answer alpha bravo charlie"
+PROMPTS = [PREFIX + " delta echo", PREFIX + " foxtrot", PREFIX + " golf hotel india juliet"]
+
+
+@pytest.fixture(scope="module")
+def model_and_tokenizer(tiny_model):
+    pytest.importorskip("torch")
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    return AutoModelForCausalLM.from_pretrained(tiny_model).eval(), AutoTokenizer.from_pretrained(tiny_model)
+
+
+def kv_tensors(cache):
+    """The key/value tensors of a past_key_values object, flattened"""
+    if hasattr(cache, "to_legacy_cache"):
+        cache = cache.to_legacy_cache()
+    if isinstance(cache, (tuple, list)):
+        return [tensor for item in cache for tensor in kv_tensors(item)]
+    return [cache]
+
+
+def greedy(model, input_ids, **kwargs):
+    import torch
+
+    inputs = torch.tensor([input_ids])
+    with torch.no_grad():
+        outputs = model.generate(inputs, attention_mask=torch.ones_like(inputs), max_new_tokens=6, do_sample=False,
+                                 pad_token_id=0, **kwargs)
+    return outputs[0, len(input_ids):].tolist()
+
+
+def test_cached_prefix_generates_the_same_tokens(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    cache = PrefixKVCache(model, tokenizer)
+    length = cache.register(PREFIX)
+    stored = cache._entries[prefix_key(tokenizer(PREFIX)["input_ids"])].cache
+    before = [tensor.clone() for tensor in kv_tensors(stored)]
+    assert cache.stats()["bytes"] == kv_cache_nbytes(stored) > 0
+
+    for prompt in PROMPTS:
+        input_ids = tokenizer(prompt)["input_ids"]
+        assert input_ids[:length] == tokenizer(PREFIX)["input_ids"]
+        kwargs = cache.generate_kwargs(input_ids)
+        assert greedy(model, input_ids, **kwargs) == greedy(model, input_ids)
+        # Generation extends a Cache object it is given in place (legacy tuples are converted) ...
+        if hasattr(kwargs["past_key_values"], "get_seq_length"):
+            assert kwargs["past_key_values"].get_seq_length() > length
+
+    # ... while the cached prefix state is exactly what register() computed
+    after = kv_tensors(stored)
+    assert len(after) == len(before)
+    assert all(a.shape == b.shape and bool((a == b).all()) for a, b in zip(after, before))
+    assert cache.stats()["hits"] == len(PROMPTS) and cache.stats()["tokens_reused"] == len(PROMPTS) * length
+
+
+def test_lookup_leaves_a_token_and_misses_other_prompts(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    cache = PrefixKVCache(model, tokenizer)
+    length = cache.register(PREFIX)
+    assert cache.lookup(tokenizer(PREFIX)["input_ids"]) == (0, None)
+    assert cache.generate_kwargs(tokenizer("alpha bravo charlie delta")["input_ids"]) == {}
+    assert cache.register(PREFIX) == length and cache.stats()["entries"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_entries_are_evicted_least_recently_used(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    cache = PrefixKVCache(model, tokenizer, max_entries=2)
+    for prefix in ["alpha bravo", "charlie delta", "echo foxtrot"]:
+        cache.register(prefix)
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+    assert cache.lookup(tokenizer("alpha bravo golf")["input_ids"]) == (0, None)
+    assert cache.lookup(tokenizer("echo foxtrot golf")["input_ids"])[0] == 2
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from bapx_quantize import quantize_file
+from bapx_x8d import statefold_bytes
+
+XAT = 3.14159
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 123)
+    path = tmp_path / "model.bin"
+    path.write_bytes(data)
+    return path, data
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_quantize_file_streams_statefold(tmp_path, model_file, workers):
+    path, data = model_file
+    output = tmp_path / "model_x8d.bin"
+    stats = quantize_file(str(path), str(output), xAt=XAT, chunk_size=256 * 1024, workers=workers)
+    assert stats["bytes_processed"] == len(data)
+    assert output.read_bytes() == statefold_bytes(data, XAT)
+
+
+def test_quantize_file_in_place(model_file):
+    path, data = model_file
+    quantize_file(str(path), str(path), xAt=XAT, chunk_size=256 * 1024)
+    assert path.read_bytes() == statefold_bytes(data, XAT)
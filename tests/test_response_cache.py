@@ -0,0 +1,45 @@
+import sqlite3
+import time
+
+from bapx_response_cache import ResponseCache, SQLiteCache, cache_key
+
+
+def test_sqlite_cache_keeps_size_and_evicts_lru(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_bytes=1000, touch_interval=0)
+    for i in range(5):
+        cache.set(f"key{i}", "x" * 150)
+        time.sleep(0.001)
+    assert cache.get("key0") == "x" * 150  # key0 is now the most recently used
+    for i in range(5, 8):
+        cache.set(f"key{i}", "x" * 150)
+        time.sleep(0.001)
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000
+    assert cache.get("key0") is not None
+    assert cache.get("key1") is None
+    assert stats["evictions"] == 2
+    with sqlite3.connect(cache.path) as db:
+        assert db.execute("SELECT COUNT(*), SUM(nbytes) FROM response_cache").fetchone() == \
+            (stats["entries"], stats["bytes"])
+
+
+def test_sqlite_cache_replace_and_clear_update_totals(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+    cache.set("a", "short")
+    cache.set("a", "a much longer value")
+    assert cache.get("a") == "a much longer value"
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == len('"a much longer value"') + 1
+    cache.clear()
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_sqlite_cache_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = ResponseCache(shared=SQLiteCache(path))
+    second = ResponseCache(shared=SQLiteCache(path))
+    key = cache_key("process", "query", "context", "")
+    first.set(key, {"response": "answer"})
+    assert second.get(key) == {"response": "answer"}
+    assert second.stats()["shared"]["entries"] == 1
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from bapx_router import (BackendClient, BackendError, BackendProcess, BackendSaturated, DelegationRouter,
+                         make_handler)
+
+
+def local(prompt, max_new_tokens):
+    return f"local: {prompt}"
+
+
+@pytest.fixture(scope="module")
+def processes():
+    """One echo and one slow stub backend worker, shared by the tests"""
+    started = {"echo": BackendProcess("echo", "stub:echo").start(30),
+               "sleep": BackendProcess("sleep", "stub:sleep:0.5").start(30)}
+    yield started
+    for process in started.values():
+        process.stop()
+
+
+def client(process, **settings):
+    return BackendClient(process.name, process.address, process.authkey, **settings)
+
+
+def route_concurrently(router, target, count):
+    """route() from count threads released at once; returns the results"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def send(i):
+        barrier.wait()
+        results[i] = router.route(target, f"request {i}")
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return results
+
+
+def test_stub_handlers():
+    assert make_handler("stub:echo")("hello", 8) == "hello"
+    assert make_handler("stub:sleep:0")("hello", 8) == "hello"
+    with pytest.raises(ValueError):
+        make_handler("stub:unknown")
+
+
+def test_requests_reuse_a_pooled_connection(processes):
+    echo = client(processes["echo"])
+    router = DelegationRouter({"bapXnarrator": echo}, "bapXnarrator")
+    try:
+        for i in range(5):
+            routed = router.route("bapXnarrator", f"story {i}")
+            assert routed["text"] == f"story {i}"
+            assert routed["served_by"] == "bapXnarrator" and not routed["fallback"]
+        assert echo.stats()["connections"] == 1
+        assert echo.stats()["requests"] == 5
+    finally:
+        echo.close()
+
+
+def test_saturated_backend_sheds_to_the_primary(processes):
+    coder = client(processes["sleep"], max_concurrency=2, max_queue_depth=0)
+    primary = client(processes["echo"], max_concurrency=8)
+    router = DelegationRouter({"bapXcoder": coder, "bapXinstruct": primary}, "bapXinstruct")
+    try:
+        results = route_concurrently(router, "bapXcoder", 6)
+        assert Counter(routed["served_by"] for routed in results) == {"bapXcoder": 2, "bapXinstruct": 4}
+        assert all("saturated" in routed["reasons"][0] for routed in results if routed["fallback"])
+        assert coder.stats()["shed"] == 4
+        assert coder.stats()["in_flight"] == 0
+    finally:
+        coder.close()
+        primary.close()
+
+
+def test_requests_wait_for_a_slot_up_to_the_queue_depth(processes):
+    coder = client(processes["sleep"], max_concurrency=1, max_queue_depth=1, queue_timeout=10)
+    try:
+        router = DelegationRouter({"bapXcoder": coder}, "bapXinstruct", fallback=local)
+        results = route_concurrently(router, "bapXcoder", 3)
+        assert Counter(routed["served_by"] for routed in results) == {"bapXcoder": 2, None: 1}
+        assert coder.stats()["shed"] == 1
+    finally:
+        coder.close()
+
+
+def test_slot_wait_times_out(processes):
+    coder = client(processes["sleep"], max_concurrency=1, max_queue_depth=4, queue_timeout=0.05)
+    try:
+        first = threading.Thread(target=coder.request, args=("slow",))
+        first.start()
+        while not coder.stats()["in_flight"]:
+            time.sleep(0.001)
+        with pytest.raises(BackendSaturated, match="no free slot"):
+            coder.request("waits too long")
+        first.join()
+        assert coder.stats()["shed"] == 1
+    finally:
+        coder.close()
+
+
+def test_local_fallback_and_no_fallback():
+    router = DelegationRouter({}, "bapXinstruct", fallback=local)
+    routed = router.route("bapXcoder", "hello")
+    assert routed["text"] == "local: hello"
+    assert routed["served_by"] is None and routed["fallback"]
+    assert routed["reasons"] == ["bapXcoder: no backend", "bapXinstruct: no backend"]
+    with pytest.raises(BackendError):
+        DelegationRouter({}, "bapXinstruct").route("bapXcoder", "hello")
+
+
+def test_stopped_backend_falls_back():
+    process = BackendProcess("crashes", "stub:echo").start(30)
+    router = DelegationRouter({"bapXcoder": client(process)}, "bapXinstruct", fallback=local,
+                              processes=[process])
+    try:
+        assert router.route("bapXcoder", "before")["served_by"] == "bapXcoder"
+        process.stop()
+        routed = router.route("bapXcoder", "after")
+        assert routed["text"] == "local: after"
+        assert router.stats()["bapXcoder"]["errors"] == 1
+    finally:
+        router.close()
+
+
+def test_backend_that_fails_to_start_is_left_out():
+    config = {"backends": {"bapXcoder": {"model": "stub:unknown", "start_timeout": 30}}}
+    router = DelegationRouter.from_config(config, "bapXinstruct", fallback=local)
+    try:
+        assert router.backends == {}
+        assert router.route("bapXcoder", "hello")["text"] == "local: hello"
+    finally:
+        router.close()
@@ -0,0 +1,50 @@
+from bapx_changelog import ChangelogReader, ChangelogWriter
+from bapx_session_memory import SessionMemory, last_spilled_id
+
+
+def test_ids_continue_after_spilled_records(tmp_path):
+    spill_path = str(tmp_path / "session_memory.ndjson")
+    memory = SessionMemory(max_entries=3, spill_path=spill_path)
+    for i in range(10):
+        memory.append(f"task {i}", "bapXcoder", "done")
+    memory.close()
+    assert last_spilled_id(spill_path) == 7
+
+    restarted = SessionMemory(max_entries=3, spill_path=spill_path)
+    assert restarted.append("next", "bapXcoder", "done").session_id == 8
+    restarted.close()
+
+
+def test_torn_spill_tail_is_ignored(tmp_path):
+    spill_path = tmp_path / "session_memory.ndjson"
+    memory = SessionMemory(max_entries=1, spill_path=str(spill_path))
+    for i in range(3):
+        memory.append(f"task {i}", "bapXcoder", "done")
+    memory.close()
+    with open(spill_path, 'a') as f:
+        f.write('{"session_id": 99, "tas')
+    assert last_spilled_id(str(spill_path)) == 2
+    assert [record.session_id for record in SessionMemory(spill_path=str(spill_path)).iter_spilled()] == [1, 2]
+    assert SessionMemory(spill_path=str(spill_path), first_id=40).append("t", "x", "r").session_id == 40
+
+
+def test_spilling_after_a_torn_tail_keeps_new_records(tmp_path):
+    spill_path = str(tmp_path / "session_memory.ndjson")
+    with open(spill_path, 'w') as f:
+        f.write('{"session_id": 1, "task": "done"}\n[1, 2]\n{"session_id": 2, "tas')
+    memory = SessionMemory(max_entries=1, spill_path=spill_path)
+    for i in range(3):
+        memory.append(f"task {i}", "bapXcoder", "done")
+    # The torn and malformed lines are skipped; records spilled after them are intact
+    assert [record.task for record in memory.iter_spilled()] == ["task 0", "task 1"]
+    memory.close()
+
+
+def test_changelog_last_entry(tmp_path):
+    directory = str(tmp_path / "changelog")
+    assert ChangelogReader(directory).last() is None
+    writer = ChangelogWriter(directory, index_interval=4)
+    for session_id in range(1, 11):
+        writer.append({"session_id": session_id})
+    writer.close()
+    assert ChangelogReader(directory).last()["session_id"] == 10
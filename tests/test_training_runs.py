@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import time
+
+import pytest
+
+from bapx_training_runs import RunInProgress, TrainingRunManager, training_command, validate_params
+
+# Stands in for scripts/train_bapx_lora.py: reports one metrics record, then trains until stopped
+STUB_SCRIPT = """
+import json, os, time
+os.write(int(os.environ["BAPX_METRICS_FD"]), (json.dumps({"step": 1, "loss": 2.5}) + "\\n").encode())
+time.sleep(60)
+"""
+
+
+@pytest.fixture
+def manager(tmp_path):
+    script = tmp_path / "train_stub.py"
+    script.write_text(STUB_SCRIPT)
+    manager = TrainingRunManager(str(tmp_path), runs_dir="runs", script=str(script))
+    yield manager
+    for run in manager.list():
+        manager.cancel(run["run_id"])
+
+
+def wait_until_finished(manager, run_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while manager.get(run_id)["state"] not in ("succeeded", "failed", "cancelled"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_one_run_per_output_directory(manager, tmp_path):
+    run = manager.start({"epochs": 1}, os.path.join("output", "adapter"))
+    with pytest.raises(RunInProgress):
+        manager.start({"epochs": 1}, os.path.join("output", ".", "adapter"))
+    # The lock lives in runs_dir; the adapter directory is left to the training script
+    assert not (tmp_path / "output").exists()
+    assert [name for name in os.listdir(manager.runs_dir) if name.endswith(".lock")]
+
+    manager.cancel(run["run_id"])
+    wait_until_finished(manager, run["run_id"])
+    assert manager.get(run["run_id"])["state"] == "cancelled"
+    # The directory is released once the cancelled process has exited
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            manager.start({"epochs": 1}, os.path.join("output", "adapter"))
+            break
+        except RunInProgress:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+
+def test_metrics_reach_the_ring_buffer(manager):
+    run = manager.start({"lora_rank": 8}, "output/adapter")
+    deadline = time.monotonic() + 10
+    while not manager.get(run["run_id"])["seq"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    status = manager.get(run["run_id"], after=0)
+    assert status["metrics"] == [{"seq": 1, "step": 1, "loss": 2.5}]
+    assert status["state"] == "running"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="no advisory locks on Windows")
+def test_other_processes_are_kept_out(manager, tmp_path):
+    manager.start({}, "output/adapter")
+    other = TrainingRunManager(str(tmp_path), runs_dir="runs", script=manager.script)
+    with pytest.raises(RunInProgress, match="Another process"):
+        other.start({}, "output/adapter")
+
+
+@pytest.mark.parametrize("params", [
+    {"lora_rank": "64"}, {"lora_rank": 8.5}, {"lora_rank": True}, {"lora_rank": 0}, {"lora_rank": 4096},
+    {"epochs": -1}, {"epochs": float("nan")}, {"learning_rate": 2}, {"identity": ""}, {"task_focus": 7},
+    {"identity": "x" * 201}
+])
+def test_invalid_params_are_rejected_before_starting(manager, params):
+    with pytest.raises(ValueError, match=next(iter(params))):
+        manager.start(params, "output/adapter")
+    assert manager.list() == []
+    assert not os.path.exists(manager.runs_dir)  # no log or lock file either
+
+
+def test_command_line_round_trips_through_argparse():
+    # The training script's options (scripts/train_bapx_lora.py parse_args)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base_model", nargs="?")
+    parser.add_argument("--output-dir")
+    parser.add_argument("--lora-rank", type=int)
+    parser.add_argument("--epochs", type=float)
+    for option in ("--task-focus", "--time-consciousness", "--identity"):
+        parser.add_argument(option)
+
+    params = {"lora_rank": 16, "epochs": 0.5, "identity": "--bapX", "task_focus": "-x Identity", "time_consciousness": None}
+    validate_params(params)
+    args = parser.parse_args(training_command(params, "output/adapter", "-model")[3:])
+    assert (args.lora_rank, args.epochs, args.identity, args.task_focus) == (16, 0.5, "--bapX", "-x Identity")
+    assert args.time_consciousness is None and args.base_model == "-model"
@@ -0,0 +1,68 @@
+import json
+import os
+import random
+
+import pytest
+
+import bapx_x8d
+from bapx_x8d import X8D_FACTOR, build_x8d_table, get_x8d_table, set_x8d_tensor_path, statefold_bytes, statefold_table
+
+# Every xAt the project passes to statefold, plus factors that exercise wrap-around and negatives
+FACTORS = [X8D_FACTOR, 8 * 8 * 8 * 0.00000001 / 64, 1.0, 0.5, 8.0, 3.14159, -2.5, 255.0, 1e-300]
+
+
+def legacy_statefold(data, xAt):
+    """The per-byte loop statefold() used before the translate table"""
+    return bytes([int(b * xAt) % 256 for b in data])
+
+
+@pytest.mark.parametrize("xAt", FACTORS)
+def test_statefold_matches_legacy_on_random_inputs(xAt):
+    rng = random.Random(hash(xAt) & 0xffff)
+    for _ in range(50):
+        data = rng.randbytes(rng.randint(0, 4096))
+        assert statefold_bytes(data, xAt) == legacy_statefold(data, xAt)
+
+
+@pytest.mark.parametrize("xAt", FACTORS)
+def test_statefold_matches_legacy_on_every_byte(xAt):
+    data = bytes(range(256))
+    assert statefold_table(xAt) == legacy_statefold(data, xAt)
+    assert statefold_bytes(bytearray(data), xAt) == legacy_statefold(data, xAt)
+
+
+def test_statefold_tables_are_cached_per_factor():
+    assert statefold_table(0.5) is statefold_table(0.5)
+    assert statefold_table(0.5) != statefold_table(8.0)
+
+
+def write_tensor_file(path, values):
+    categories = {"ascii": {str(byte_val): {"ord": byte_val, "val": val} for byte_val, val in values.items()}}
+    with open(path, 'w') as f:
+        json.dump({"categories": categories}, f)
+
+
+def test_table_falls_back_to_default_mapping(tmp_path):
+    path = tmp_path / "x8Dtensor.json"
+    write_tensor_file(path, {65: 0.25, 300: 1.0})
+    table = build_x8d_table(str(path))
+    assert len(table) == 256
+    assert table[65] == 0.25
+    assert table[66] == 66 * X8D_FACTOR
+    assert table.mapchar["A"] == 0.25
+
+
+def test_table_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "x8Dtensor.json"
+    write_tensor_file(path, {65: 0.25})
+    previous = bapx_x8d.X8D_TENSOR_PATH
+    set_x8d_tensor_path(str(path))
+    try:
+        table = get_x8d_table()
+        assert get_x8d_table() is table
+        write_tensor_file(path, {65: 0.5})
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        assert get_x8d_table()[65] == 0.5
+    finally:
+        set_x8d_tensor_path(previous)